@@ -2,7 +2,9 @@
 
 import streamlit as st
 import os
+import uuid
 from src.retriever import RAGRetriever
+from config.settings import WARMUP_ON_START
 
 st.set_page_config(
     page_title="Nemotron-RAG",
@@ -40,7 +42,11 @@ def check_password():
 @st.cache_resource
 def load_pipeline():
     """Cache the RAG pipeline to avoid reloading on each interaction."""
-    return RAGRetriever()
+    pipeline = RAGRetriever()
+    # Models load in the background while the page renders
+    if WARMUP_ON_START:
+        pipeline.warm_up()
+    return pipeline
 
 def main():
     if not check_password():
@@ -58,24 +64,39 @@ def main():
         st.header("⚙️  Configuration")
         st.text(f"LLM: Nemotron-3-30B")
         st.text(f"GPUs: 3090 & 3090ti")
-        st.text(f"Reranking: Enabled")
+        st.text(f"Reranking: {'Enabled' if pipeline.reranker else 'Disabled'}")
+
+        use_cache = st.checkbox("Reuse cached answers", value=True)
+
+        cache_stats = pipeline.cache_stats()
+        st.text(f"Query cache hits: {cache_stats['retrieval']['hit_rate']:.0%} "
+                f"({cache_stats['retrieval']['size']} entries)")
+        if "reranker" in cache_stats:
+            st.text(f"Rerank fallbacks: {cache_stats['reranker']['fallbacks']}")
+        if "sessions" in cache_stats:
+            st.text(f"Chat sessions: {cache_stats['sessions']['sessions']}")
 
         if st.button("Clear Chat"):
             st.session_state.messages = []
+            pipeline.end_session(st.session_state.chat_id)
+            st.session_state.chat_id = uuid.uuid4().hex
             st.rerun()
 
     # Chat history
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    # Follow-up questions continue the LLM context of this chat
+    if "chat_id" not in st.session_state:
+        st.session_state.chat_id = uuid.uuid4().hex
 
     # Display chat history
     for msg in st.session_state.messages:
         with st.chat_message(msg["role"]):
-            st.markdown(msg["content"])
-            if "sources" in msg:
+            if msg.get("sources"):
                 with st.expander("📚 Sources"):
                     for src in msg["sources"]:
                         st.markdown(f"- {src}")
+            st.markdown(msg["content"])
 
     # Query input
     if query := st.chat_input("Ask a question..."):
@@ -85,24 +106,30 @@ def main():
             st.markdown(query)
 
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                # Adjust this call to match your pipeline's method
-                response = pipeline.retrieve_and_generate(query)
-
-                # Handle response format - adjust based on your return type
-                if isinstance(response, dict):
-                    answer = response.get("answer", str(response))
-                    sources = response.get("sources", [])
-                else:
-                    answer = str(response)
-                    sources = []
-
-                st.markdown(answer)
-
-                if sources:
-                    with st.expander("📚 Sources"):
-                        for src in sources:
-                            st.markdown(f"- {src}")
+            with st.spinner("Searching documents..."):
+                response = pipeline.stream(query, use_cache=use_cache,
+                                           session_id=st.session_state.chat_id)
+
+            # Sources are known before generation starts
+            sources = response.sources
+            if sources:
+                with st.expander("📚 Sources"):
+                    for src in sources:
+                        st.markdown(f"- {src}")
+
+            # Render tokens as they are generated
+            st.write_stream(iter(response))
+            answer = response.answer
+
+            if response.cached:
+                st.caption("Answered from cache")
+            else:
+                caption = (f"First token in {response.stats['ttft']:.2f}s · "
+                           f"{response.stats['tokens_per_sec']:.1f} tokens/s")
+                if response.stats.get("prefill_tokens") is not None:
+                    caption += (f" · turn {response.stats['turn']}, "
+                                f"{response.stats['prefill_tokens']} prompt tokens prefilled")
+                st.caption(caption)
 
         st.session_state.messages.append({
             "role": "assistant",
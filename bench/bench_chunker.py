@@ -0,0 +1,87 @@
+"""
+Benchmark the offset-preserving chunker against RecursiveCharacterTextSplitter
+
+Usage:
+    python -m bench.bench_chunker [pdf_dir] [--repeat N]
+
+Chunks every page of the PDFs in pdf_dir (DATA_DIR by default, or synthetic
+pages if there are none) with both splitters and reports throughput and how
+many chunks have identical text and start offsets.
+"""
+import glob
+import os
+import sys
+import time
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from bench.synthetic import synthetic_pages
+from src.chunker import TextChunker
+from src.pdf_chunker import iter_pages
+from config.settings import DATA_DIR, CHUNK_SIZE, CHUNK_OVERLAP
+
+
+def load_pages(pdf_dir):
+    pages = []
+    for pdf_file in sorted(glob.glob(os.path.join(pdf_dir, "*.pdf"))):
+        pages.extend(text for _, text in iter_pages(pdf_file) if text.strip())
+    return pages
+
+
+def timed(fn, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = [fn(text) for text in pages]
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    args = sys.argv[1:]
+    repeat = 3
+    if "--repeat" in args:
+        i = args.index("--repeat")
+        repeat = int(args[i + 1])
+        del args[i:i + 2]
+    pdf_dir = args[0] if args else str(DATA_DIR)
+
+    pages = load_pages(pdf_dir) if os.path.isdir(pdf_dir) else []
+    source = pdf_dir
+    if not pages:
+        pages = synthetic_pages()
+        source = "synthetic pages"
+    total_chars = sum(len(text) for text in pages)
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, length_function=len, add_start_index=True
+    )
+    chunker = TextChunker(CHUNK_SIZE, CHUNK_OVERLAP)
+
+    def baseline(text):
+        return [(doc.metadata["start_index"], doc.page_content)
+                for doc in splitter.create_documents([text], metadatas=[{"source_file": "x.pdf", "page": 1}])]
+
+    def candidate(text):
+        return [(chunk.start, chunk.text) for chunk in chunker.chunk_page(text, "x.pdf", 1)]
+
+    base_time, base_chunks = timed(baseline, pages, repeat)
+    new_time, new_chunks = timed(candidate, pages, repeat)
+
+    expected = sum(len(chunks) for chunks in base_chunks)
+    matching = sum(len(set(a) & set(b)) for a, b in zip(base_chunks, new_chunks))
+    produced = sum(len(chunks) for chunks in new_chunks)
+
+    print("=" * 60)
+    print(f"CHUNKER BENCHMARK ({source}: {len(pages)} pages, {total_chars / 1e6:.2f}M chars)")
+    print("=" * 60)
+    print(f"{'splitter':<32}{'chunks':>8}{'MB/s':>10}{'ms/page':>10}")
+    for name, seconds, count in (("RecursiveCharacterTextSplitter", base_time, expected),
+                                 ("TextChunker", new_time, produced)):
+        print(f"{name:<32}{count:>8}{total_chars / 1e6 / seconds:>10.1f}"
+              f"{seconds * 1000 / len(pages):>10.3f}")
+    print(f"\nSpeed-up: {base_time / new_time:.1f}x")
+    marker = "✓" if matching == expected == produced else "✗"
+    print(f"{marker} Identical chunks (text and start offset): {matching}/{expected}")
+
+
+if __name__ == "__main__":
+    main()
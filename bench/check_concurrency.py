@@ -0,0 +1,285 @@
+"""
+Multi-process consistency check for the shared on-disk stores and the work queue
+
+Usage:
+    python -m bench.check_concurrency [--writers 3] [--rounds 200] [--files 4] [--pages 6] [--keep]
+
+Runs several processes against one scratch directory and checks that
+nothing they share is corrupted:
+  - embedding cache: writers storing different texts; every key must still
+    return its own vector
+  - flat store: writers appending, plus re-upserting one shared id; every
+    id's document must match its vector, with no orphan live rows
+  - work queue: a task whose worker dies is retried once its lease expires
+    and fails its job after max_attempts; an expired commit lock is
+    handed to the next worker
+  - workers: several `run_worker` processes index a synthetic corpus into
+    one store; every stored chunk must match its vector and the manifest,
+    and re-queuing the unchanged files must embed nothing
+
+Vectors are a hash of the text, so every stored row can be checked against
+its document without loading the embedding model. The exit status is 1 if
+any check fails.
+"""
+import hashlib
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import config.settings as settings
+
+DIM = 32
+
+
+def _option(name, default):
+    """Value following a command-line flag, cast to the default's type."""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return type(default)(sys.argv[index + 1])
+    return default
+
+
+def text_vector(text):
+    """Deterministic unit vector for a text."""
+    seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(DIM)
+    return vector / np.linalg.norm(vector)
+
+
+class HashEmbeddings:
+    """Embedding function returning text_vector(); counts the texts it embeds."""
+
+    calls = 0
+
+    def embed_documents(self, texts):
+        HashEmbeddings.calls += len(texts)
+        return [text_vector(text).tolist() for text in texts]
+
+    def embed_query(self, text):
+        return text_vector(text).tolist()
+
+
+def setup(workdir):
+    """Point every store at workdir and embeddings at HashEmbeddings (call in each process)."""
+    from bench.run_bench import isolate
+    isolate(workdir, "http://127.0.0.1:9")
+    settings.VECTOR_BACKEND = "flat"
+    # Workers must skip unchanged chunks by their manifest, not through cache hits
+    settings.EMBEDDING_CACHE_ENABLED = False
+    import src.vector_store
+    import src.work_queue
+    src.vector_store.get_embeddings = HashEmbeddings
+    src.work_queue.get_embeddings = HashEmbeddings
+
+
+def _run_processes(target, args_list):
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=target, args=args) for args in args_list]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return [process.exitcode for process in processes]
+
+
+class Checks:
+    def __init__(self):
+        self.failed = []
+
+    def check(self, name, ok, detail=""):
+        print(f"  {'✓' if ok else '✗'} {name}{f' ({detail})' if detail else ''}")
+        if not ok:
+            self.failed.append(name)
+
+
+# Embedding cache
+
+def _cache_writer(workdir, tag, rounds):
+    setup(workdir)
+    from src.embedding_cache import EmbeddingCache
+    cache = EmbeddingCache(settings.EMBEDDING_MODEL, max_entries=rounds * 16, dtype="float32")
+    for i in range(rounds):
+        texts = [f"{tag} {i} {j}" for j in range(3)]
+        cache.put_many([cache.key(text) for text in texts], [text_vector(text) for text in texts])
+        cache.get_many([cache.key(f"{tag} {i // 2} 0")])
+
+
+def check_embedding_cache(workdir, checks, writers, rounds):
+    print("Embedding cache...")
+    codes = _run_processes(_cache_writer, [(workdir, f"w{n}", rounds) for n in range(writers)])
+    checks.check("cache writers exited cleanly", codes == [0] * writers, f"exit codes {codes}")
+
+    from src.embedding_cache import EmbeddingCache
+    cache = EmbeddingCache(settings.EMBEDDING_MODEL, max_entries=rounds * 16, dtype="float32")
+    texts = [f"w{n} {i} {j}" for n in range(writers) for i in range(rounds) for j in range(3)]
+    found = cache.get_many([cache.key(text) for text in texts])
+    wrong = sum(1 for pos, text in enumerate(texts)
+                if pos not in found or not np.allclose(found[pos], text_vector(text), atol=1e-6))
+    checks.check("every cached key returns its own vector", wrong == 0,
+                 f"{wrong} of {len(texts)} wrong or missing")
+
+
+# Flat store
+
+def _flat_writer(workdir, tag, rounds):
+    setup(workdir)
+    from src.flat_store import FlatVectorStore
+    store = FlatVectorStore(workdir / "flat_check")
+    for i in range(rounds):
+        ids = [f"{tag}-{i}-{j}" for j in range(3)] + ["shared"]
+        documents = [f"{cid} text" for cid in ids[:3]] + [f"shared text from {tag} {i}"]
+        store.upsert(ids, [text_vector(doc) for doc in documents], documents)
+        if i % 10 == 9:
+            store.delete([f"{tag}-{i - 5}-0"])
+
+
+def check_flat_store(workdir, checks, writers, rounds):
+    print("Flat store...")
+    codes = _run_processes(_flat_writer, [(workdir, f"w{n}", rounds) for n in range(writers)])
+    checks.check("flat store writers exited cleanly", codes == [0] * writers, f"exit codes {codes}")
+
+    from src.flat_store import FlatVectorStore
+    store = FlatVectorStore(workdir / "flat_check")
+    result = store.get(include=["documents", "embeddings"])
+    wrong = sum(1 for document, vector in zip(result["documents"], result["embeddings"])
+                if float(np.dot(vector, text_vector(document))) < 0.99)
+    checks.check("every id's vector matches its document", wrong == 0,
+                 f"{wrong} of {len(result['ids'])} mismatched")
+
+    expected = writers * rounds * 3 - writers * (rounds // 10) + 1
+    live = int(store._live[:store._count].sum())
+    checks.check("live rows match ids (no orphans or lost writes)",
+                 len(result["ids"]) == expected and live == expected,
+                 f"{len(result['ids'])} ids, {live} live rows, {expected} expected")
+
+
+# Work queue
+
+def _claim_and_die(db_path, staging_dir, lease_seconds, max_attempts):
+    from src.work_queue import WorkQueue
+    queue = WorkQueue(db_path, staging_dir, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    queue.claim("doomed")
+
+
+def check_work_queue(workdir, checks, pdf_path):
+    print("Work queue leases...")
+    from src.work_queue import WorkQueue, COMMIT_LOCK
+    db_path, staging_dir = workdir / "lease_check.sqlite", workdir / "lease_staging"
+    lease, attempts = 1.0, 2
+    queue = WorkQueue(db_path, staging_dir, lease_seconds=lease, max_attempts=attempts)
+    queue.enqueue([pdf_path], shard_pages=10 ** 6)
+
+    _run_processes(_claim_and_die, [(db_path, staging_dir, lease, attempts)])
+    checks.check("dead worker's task is not claimable before its lease expires",
+                 queue.claim("other") is None)
+    time.sleep(lease + 0.1)
+    task = queue.claim("retry")
+    checks.check("expired task is retried", task is not None and task["attempts"] == 2,
+                 f"attempt {task['attempts'] if task else None}")
+
+    # The retry dies as well: its lease is left to expire
+    time.sleep(lease + 0.1)
+    checks.check("task fails its job after max attempts",
+                 queue.claim("again") is None and queue.counts()["failed_jobs"] == 1,
+                 queue.failed_jobs()[0][1] if queue.failed_jobs() else "job still open")
+
+    print("Commit lock...")
+    checks.check("first worker takes the commit lock", queue.acquire_lock(COMMIT_LOCK, "a"))
+    checks.check("second worker waits while it is held", not queue.acquire_lock(COMMIT_LOCK, "b"))
+    time.sleep(lease + 0.1)
+    checks.check("expired lock is handed over", queue.acquire_lock(COMMIT_LOCK, "b"))
+    queue.release_lock(COMMIT_LOCK, "a")
+    checks.check("stale holder's release keeps the new owner's lock",
+                 not queue.acquire_lock(COMMIT_LOCK, "a"))
+
+
+# Indexing workers
+
+def _worker(workdir, name, results):
+    setup(workdir)
+    from src.work_queue import WorkQueue, run_worker
+    queue = WorkQueue(workdir / "queue.sqlite", workdir / "staging")
+    totals = run_worker(settings.CHUNK_SIZE, settings.CHUNK_OVERLAP, owner=name,
+                        work_queue=queue, poll_interval=0.2)
+    results.put((name, totals, HashEmbeddings.calls))
+
+
+def _run_workers(workdir, count):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=_worker, args=(workdir, f"worker-{n}", results))
+                 for n in range(count)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return [process.exitcode for process in processes], outcomes
+
+
+def check_workers(workdir, checks, pdf_paths, count):
+    print("Indexing workers...")
+    from src.work_queue import WorkQueue
+    queue = WorkQueue(workdir / "queue.sqlite", workdir / "staging")
+    queue.enqueue(pdf_paths, shard_pages=2)
+
+    codes, outcomes = _run_workers(workdir, count)
+    counts = queue.counts()
+    checks.check("workers drained the queue", codes == [0] * count and counts["done_jobs"] == len(pdf_paths),
+                 f"exit codes {codes}, {counts['done_jobs']} of {len(pdf_paths)} jobs done")
+
+    from src.vector_store import VectorStoreManager
+    vsm = VectorStoreManager()
+    vsm.create_or_load()
+    result = vsm.vector_store.get(include=["documents", "embeddings"])
+    wrong = sum(1 for document, vector in zip(result["documents"], result["embeddings"])
+                if float(np.dot(vector, text_vector(document))) < 0.99)
+    checks.check("every stored chunk matches its vector", wrong == 0 and len(result["ids"]) > 0,
+                 f"{wrong} of {len(result['ids'])} mismatched")
+    manifest_ids = {cid for path in pdf_paths
+                    for ids in vsm.manifest.chunk_ids(Path(path).name).values() for cid in ids}
+    checks.check("store and manifest hold the same chunks", manifest_ids == set(result["ids"]),
+                 f"{len(manifest_ids)} in manifest, {len(result['ids'])} stored")
+
+    queue.enqueue(pdf_paths, shard_pages=2)
+    codes, outcomes = _run_workers(workdir, count)
+    embedded = sum(calls for _, _, calls in outcomes)
+    checks.check("re-queued unchanged files embed nothing", codes == [0] * count and embedded == 0,
+                 f"{embedded} chunks embedded")
+
+
+def main():
+    writers = _option("--writers", 3)
+    rounds = _option("--rounds", 200)
+    files = _option("--files", 4)
+    pages = _option("--pages", 6)
+
+    workdir = Path(tempfile.mkdtemp(prefix="rag-concurrency-"))
+    checks = Checks()
+    try:
+        setup(workdir)
+        from bench.synthetic import write_pdfs
+        pdf_paths = write_pdfs(workdir / "pdfs", files, pages)
+
+        check_embedding_cache(workdir, checks, writers, rounds)
+        check_flat_store(workdir, checks, writers, rounds)
+        check_work_queue(workdir, checks, pdf_paths[0])
+        check_workers(workdir, checks, pdf_paths, writers)
+    finally:
+        if "--keep" in sys.argv:
+            print(f"Kept scratch data in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if checks.failed:
+        print(f"\n✗ {len(checks.failed)} check(s) failed: {', '.join(checks.failed)}")
+        sys.exit(1)
+    print("\n✓ All concurrency checks passed")
+
+
+if __name__ == "__main__":
+    main()
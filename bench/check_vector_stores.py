@@ -0,0 +1,81 @@
+"""
+Search checks for the flat, IVF-PQ and sharded vector store backends
+
+Usage:
+    python -m bench.check_vector_stores [--chunks 200] [--keep]
+
+Fills each backend with chunks of two source files and checks unfiltered
+search, a filter on one file and a filter that matches nothing, which must
+return no hits rather than fail. The exit status is 1 if any check fails.
+"""
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from langchain_core.documents import Document
+from bench.check_concurrency import Checks, _option, text_vector
+
+
+def _chunks(count):
+    from src.vector_store import chunk_id
+    docs = [Document(page_content=f"chunk {i} of file {i % 2}",
+                     metadata={"source_file": f"file{i % 2}.pdf", "page": i // 10, "start_index": i})
+            for i in range(count)]
+    return [chunk_id(doc) for doc in docs], docs
+
+
+def check_store(name, store, checks, count):
+    print(f"{name}...")
+    ids, docs = _chunks(count)
+    store.upsert(ids, [text_vector(doc.page_content) for doc in docs],
+                 [doc.page_content for doc in docs], [doc.metadata for doc in docs])
+    query = text_vector(docs[0].page_content)
+
+    hits = store.similarity_search_by_vector(query, k=5)
+    checks.check(f"{name}: unfiltered search", len(hits) == 5 and hits[0].id == ids[0],
+                 f"{len(hits)} hits")
+    hits = store.similarity_search_by_vector(query, k=5, filter={"source_file": "file1.pdf"})
+    checks.check(f"{name}: filter on one file",
+                 len(hits) == 5 and all(hit.metadata["source_file"] == "file1.pdf" for hit in hits),
+                 f"{len(hits)} hits")
+    try:
+        hits = store.similarity_search_by_vector(query, k=5, filter={"source_file": "missing.pdf"})
+        result = store.query([query, query], n_results=5, where={"source_file": "missing.pdf"})
+        checks.check(f"{name}: filter matching nothing returns no hits",
+                     hits == [] and result["ids"] == [[], []], f"{len(hits)} hits")
+    except Exception as e:
+        checks.check(f"{name}: filter matching nothing returns no hits", False, f"{type(e).__name__}: {e}")
+
+
+def main():
+    count = _option("--chunks", 200)
+    workdir = Path(tempfile.mkdtemp(prefix="rag-stores-"))
+    checks = Checks()
+    try:
+        from bench.run_bench import isolate
+        isolate(workdir, "http://127.0.0.1:9")
+        from src.flat_store import FlatVectorStore
+        from src.ivfpq import IVFPQVectorStore
+        from src.sharded_store import ShardRouter, ShardedVectorStore
+
+        check_store("flat", FlatVectorStore(workdir / "flat"), checks, count)
+        check_store("ivfpq", IVFPQVectorStore(workdir / "ivfpq"), checks, count)
+
+        def open_shard(shard):
+            store = FlatVectorStore(workdir / f"shard_{shard}")
+            return store, store
+        check_store("sharded", ShardedVectorStore(open_shard, ShardRouter(3, {})), checks, count)
+    finally:
+        if "--keep" in sys.argv:
+            print(f"Kept scratch data in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if checks.failed:
+        print(f"\n✗ {len(checks.failed)} check(s) failed: {', '.join(checks.failed)}")
+        sys.exit(1)
+    print("\n✓ All vector store checks passed")
+
+
+if __name__ == "__main__":
+    main()
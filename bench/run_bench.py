@@ -0,0 +1,278 @@
+"""
+Offline benchmark of the indexing and query paths
+
+Usage:
+    python -m bench.run_bench [--files 20] [--pages 50] [--queries 200]
+                              [--requests 64] [--concurrency 4]
+                              [--token-latency 0.02] [--prefill-latency 0.0002]
+                              [--answer-tokens 64] [--output bench_results.json]
+                              [--baseline baseline.json] [--tolerance 0.10] [--keep]
+    python -m bench.run_bench --compare baseline.json results.json [--tolerance 0.10]
+
+Generates a synthetic PDF corpus, indexes it into a scratch vector store
+(VECTOR_BACKEND as configured) and queries it through RAGRetriever against a
+stub Ollama, so runs are reproducible and need no GPU or network. Stages:
+extraction pages/s, chunking MB/s, embeddings/s, vector store write chunks/s,
+retrieval p50/p95/p99 and end-to-end latency and QPS under concurrency.
+
+Results are written as JSON. With a baseline, every metric is compared and
+the exit status is 1 if any regressed by more than the tolerance.
+"""
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import config.settings as settings
+
+# Metrics where larger numbers are better; all others are latencies
+HIGHER_IS_BETTER_SUFFIXES = ("_per_s", "_qps")
+
+
+def _option(name, default):
+    """Value following a command-line flag, cast to the default's type."""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return type(default)(sys.argv[index + 1])
+    return default
+
+
+def isolate(workdir, ollama_url):
+    """
+    Point every store and cache at workdir and the LLM at the stub.
+
+    Must run before any src module is imported, since they bind settings
+    at import time.
+    """
+    loaded = [name for name in sys.modules if name.startswith("src.")]
+    if loaded:
+        raise RuntimeError(f"isolate() must run before importing {loaded[0]}")
+    settings.VECTOR_STORE_DIR = workdir / "chroma_db"
+    settings.FLAT_STORE_DIR = workdir / "flat"
+    settings.EMBEDDING_CACHE_DIR = workdir / "embedding_cache"
+    settings.ANSWER_CACHE_PATH = workdir / "answer_cache.sqlite"
+    settings.OLLAMA_BASE_URL = ollama_url
+
+
+def percentiles(seconds, prefix):
+    values = np.asarray(seconds) * 1000
+    return {f"{prefix}_p{p}_ms": float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def machine_info():
+    info = {
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "git_commit": _git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+    try:
+        import torch
+        if torch.cuda.is_available():
+            info["gpu"] = torch.cuda.get_device_name(0)
+    except ImportError:
+        pass
+    return info
+
+
+def run(params):
+    """Run every stage and return the results document."""
+    from bench.stub_ollama import StubOllama
+    from bench.synthetic import write_pdfs, questions
+
+    workdir = params.pop("workdir")
+    stub = StubOllama(
+        token_latency=params["token_latency"], prefill_latency=params["prefill_latency"],
+        answer_tokens=params["answer_tokens"]
+    ).start()
+    isolate(workdir, stub.url)
+
+    from src.chunker import TextChunker
+    from src.pdf_chunker import iter_pages
+    from src.vector_store import VectorStoreManager
+    from src.retriever import RAGRetriever
+
+    metrics = {}
+
+    print(f"Generating {params['files']} PDFs x {params['pages']} pages...")
+    pdf_files = write_pdfs(workdir / "pdfs", params["files"], params["pages"], seed=params["seed"])
+
+    print("Extraction...")
+    start = time.perf_counter()
+    pages = [(os.path.basename(path), number, text)
+             for path in pdf_files for number, text in iter_pages(path)]
+    metrics["extract_pages_per_s"] = len(pages) / (time.perf_counter() - start)
+
+    print("Chunking...")
+    chunker = TextChunker(settings.CHUNK_SIZE, settings.CHUNK_OVERLAP)
+    total_chars = sum(len(text) for _, _, text in pages)
+    start = time.perf_counter()
+    chunks = [chunk for source, number, text in pages
+              for chunk in chunker.chunk_page(text, source, number)]
+    metrics["chunk_mb_per_s"] = total_chars / 1e6 / (time.perf_counter() - start)
+
+    vsm = VectorStoreManager()
+    vsm.create_or_load()
+
+    print(f"Embedding {len(chunks)} chunks...")
+    vsm.embed_queries(["warm up"])
+    batch_size = settings.EMBED_BATCH_SIZE
+    vectors = []
+    start = time.perf_counter()
+    for i in range(0, len(chunks), batch_size):
+        vectors.extend(vsm.embed_queries([chunk.text for chunk in chunks[i:i + batch_size]]))
+    metrics["embed_chunks_per_s"] = len(chunks) / (time.perf_counter() - start)
+
+    print(f"Writing to the {vsm.backend} store...")
+    start = time.perf_counter()
+    for i in range(0, len(chunks), batch_size):
+        vsm.add_embedded_documents(chunks[i:i + batch_size], vectors[i:i + batch_size])
+    vsm.save_lexical_index()
+    metrics["store_write_chunks_per_s"] = len(chunks) / (time.perf_counter() - start)
+
+    rag = RAGRetriever()
+    rag.warm_up(background=False, llm=True)
+    asked = questions([chunk.text for chunk in chunks], params["queries"] + params["requests"],
+                      seed=params["seed"])
+    retrieval_questions, e2e_questions = asked[:params["queries"]], asked[params["queries"]:]
+
+    print(f"Retrieval ({len(retrieval_questions)} queries)...")
+    latencies = []
+    for question in retrieval_questions:
+        start = time.perf_counter()
+        rag.retrieve(question)
+        latencies.append(time.perf_counter() - start)
+    metrics.update(percentiles(latencies, "retrieval"))
+
+    print(f"End to end ({len(e2e_questions)} requests, concurrency {params['concurrency']})...")
+
+    def answer(question):
+        start = time.perf_counter()
+        result = rag.retrieve_and_generate(question, use_cache=False)
+        return time.perf_counter() - start, result["stats"]["ttft"] if result["stats"] else 0.0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=params["concurrency"]) as executor:
+        timings = list(executor.map(answer, e2e_questions))
+    wall = time.perf_counter() - start
+    metrics.update(percentiles([total for total, _ in timings], "e2e"))
+    metrics["e2e_ttft_p50_ms"] = float(np.median([ttft for _, ttft in timings]) * 1000)
+    metrics["e2e_qps"] = len(timings) / wall
+
+    params.update({
+        "chunks": len(chunks), "text_mb": total_chars / 1e6, "backend": vsm.backend,
+        "chunk_size": settings.CHUNK_SIZE, "embedding_model": settings.EMBEDDING_MODEL,
+        "embedding_backend": settings.EMBEDDING_BACKEND, "rerank": bool(rag.reranker),
+    })
+    stub.shutdown()
+    return {"machine": machine_info(), "params": params, "metrics": metrics}
+
+
+def compare(baseline, current, tolerance):
+    """
+    Print each metric against the baseline.
+
+    Returns:
+        Names of metrics that regressed by more than tolerance
+    """
+    if baseline.get("params") != current.get("params"):
+        print("Warning: benchmark parameters differ from the baseline; numbers may not be comparable")
+    if baseline.get("machine", {}).get("host") != current.get("machine", {}).get("host"):
+        print("Warning: baseline was recorded on another machine")
+
+    regressions = []
+    print(f"\n  {'metric':<28}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, value in current["metrics"].items():
+        base = baseline["metrics"].get(name)
+        if not base:
+            print(f"  {name:<28}{'-':>12}{value:>12.2f}")
+            continue
+        change = (value - base) / base
+        better = change if name.endswith(HIGHER_IS_BETTER_SUFFIXES) else -change
+        marker = ""
+        if better < -tolerance:
+            regressions.append(name)
+            marker = " ✗"
+        elif better > tolerance:
+            marker = " ✓"
+        print(f"  {name:<28}{base:>12.2f}{value:>12.2f}{change:>+9.1%}{marker}")
+    return regressions
+
+
+def main():
+    tolerance = _option("--tolerance", 0.10)
+
+    if "--compare" in sys.argv:
+        index = sys.argv.index("--compare")
+        with open(sys.argv[index + 1]) as f:
+            baseline = json.load(f)
+        with open(sys.argv[index + 2]) as f:
+            current = json.load(f)
+        sys.exit(1 if compare(baseline, current, tolerance) else 0)
+
+    params = {
+        "files": _option("--files", 20),
+        "pages": _option("--pages", 50),
+        "queries": _option("--queries", 200),
+        "requests": _option("--requests", 64),
+        "concurrency": _option("--concurrency", 4),
+        "token_latency": _option("--token-latency", 0.02),
+        "prefill_latency": _option("--prefill-latency", 0.0002),
+        "answer_tokens": _option("--answer-tokens", 64),
+        "seed": _option("--seed", 0),
+    }
+    output = _option("--output", "bench_results.json")
+    baseline_path = _option("--baseline", "")
+
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    params["workdir"] = Path(workdir)
+    try:
+        results = run(params)
+    finally:
+        if "--keep" in sys.argv:
+            print(f"Kept scratch data in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print("\n" + "=" * 60)
+    print("BENCHMARK RESULTS")
+    print("=" * 60)
+    for name, value in results["metrics"].items():
+        print(f"  {name:<28}{value:>12.2f}")
+    print(f"\n✓ Results written to {output}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, tolerance)
+        if regressions:
+            print(f"\n✗ Regressed beyond {tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\n✓ No regressions beyond {tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
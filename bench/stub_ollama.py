@@ -0,0 +1,138 @@
+"""
+Local stand-in for the Ollama HTTP API with configurable latency
+
+Usage:
+    python -m bench.stub_ollama [--port 11500] [--token-latency 0.02]
+                                [--prefill-latency 0.0002] [--answer-tokens 64]
+
+Answers /api/generate (streaming NDJSON or a single JSON object), /api/tags
+and /api/version. Prefill takes prefill_latency seconds per prompt token
+(estimated as 4 characters) and each answer token token_latency seconds, so
+end-to-end numbers reflect queueing and streaming without a GPU. Like
+Ollama, the final chunk carries a 'context' of token ids; a request passing
+it back is charged prefill only for its new prompt tokens.
+"""
+import json
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubOllama(ThreadingHTTPServer):
+    """Threaded HTTP server; one handler thread per connection like Ollama's parallel slots."""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, token_latency=0.02, prefill_latency=0.0002, answer_tokens=64):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.token_latency = token_latency
+        self.prefill_latency = prefill_latency
+        self.answer_tokens = answer_tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        """Serve in a daemon thread and return self."""
+        threading.Thread(target=self.serve_forever, name="stub-ollama", daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, payload):
+        data = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": []})
+        elif self.path == "/api/version":
+            self._send_json({"version": "stub"})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+
+        server = self.server
+        with server._lock:
+            server.requests += 1
+        prompt = body.get("prompt", "")
+        prompt_tokens = len(prompt) // 4
+        model = body.get("model", "stub")
+        # An empty prompt only loads the model
+        answer_tokens = server.answer_tokens if prompt else 0
+
+        start = time.perf_counter()
+        time.sleep(prompt_tokens * server.prefill_latency)
+        prefill_ns = int((time.perf_counter() - start) * 1e9)
+        final = {
+            "model": model, "created_at": "1970-01-01T00:00:00Z", "response": "", "done": True,
+            "done_reason": "stop", "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": prefill_ns, "eval_count": answer_tokens,
+            "eval_duration": int(answer_tokens * server.token_latency * 1e9),
+            # Stand-in token ids: the conversation so far plus this prompt and answer
+            "context": list(body.get("context") or []) + list(range(prompt_tokens + answer_tokens)),
+        }
+
+        if not body.get("stream", True):
+            time.sleep(answer_tokens * server.token_latency)
+            final["response"] = " ".join(f"token{i}" for i in range(answer_tokens))
+            self._send_json(final)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i in range(answer_tokens):
+                if i:
+                    time.sleep(server.token_latency)
+                self._write_chunk({"model": model, "created_at": final["created_at"],
+                                   "response": f" token{i}", "done": False})
+            self._write_chunk(final)
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def _option(name, default):
+    if name in sys.argv:
+        return type(default)(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+
+if __name__ == "__main__":
+    stub = StubOllama(
+        port=_option("--port", 11500),
+        token_latency=_option("--token-latency", 0.02),
+        prefill_latency=_option("--prefill-latency", 0.0002),
+        answer_tokens=_option("--answer-tokens", 64),
+    )
+    print(f"✓ Stub Ollama listening on {stub.url}")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,74 @@
+"""
+Synthetic, reproducible corpora for the benchmarks
+"""
+import os
+import random
+
+WORDS = ("pressure valve torque calibration sensor firmware XJ-2000 bracket manifold "
+         "assembly tolerance the a of to and is in for with on clearance housing").split()
+
+
+def page_text(rng, long_token_rate=0.0):
+    """Manual-like page: paragraphs of wrapped lines, optionally with unbroken token runs."""
+    paragraphs = []
+    for _ in range(rng.randint(3, 12)):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14)))
+                 for _ in range(rng.randint(1, 8))]
+        if rng.random() < long_token_rate:
+            lines.append("".join(rng.choice(WORDS) for _ in range(300)))
+        paragraphs.append("\n".join(lines))
+    return "\n\n".join(paragraphs)
+
+
+def synthetic_pages(count=200, seed=0, long_token_rate=0.05):
+    """Page texts for chunker benchmarks."""
+    rng = random.Random(seed)
+    return [page_text(rng, long_token_rate) for _ in range(count)]
+
+
+def write_pdfs(out_dir, files=20, pages=50, seed=0):
+    """
+    Write a reproducible PDF corpus.
+
+    Args:
+        out_dir: Directory to write bench_NNNN.pdf files into
+        files: Number of PDFs
+        pages: Pages per PDF
+        seed: Random seed; the same arguments always produce the same text
+
+    Returns:
+        List of PDF paths
+    """
+    import fitz
+
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        path = os.path.join(out_dir, f"bench_{i:04d}.pdf")
+        with fitz.open() as doc:
+            for _ in range(pages):
+                page = doc.new_page()
+                page.insert_textbox(fitz.Rect(36, 36, 576, 806), page_text(rng), fontsize=7)
+            doc.save(path)
+        paths.append(path)
+    return paths
+
+
+def questions(texts, count, seed=0, words=8):
+    """Distinct questions made from the opening words of sampled texts."""
+    rng = random.Random(seed)
+    out = []
+    seen = set()
+    for text in rng.sample(texts, min(len(texts), count * 4)):
+        tokens = text.split()
+        if len(tokens) < words:
+            continue
+        start = rng.randint(0, len(tokens) - words)
+        question = "What does the manual say about " + " ".join(tokens[start:start + words]) + "?"
+        if question not in seen:
+            seen.add(question)
+            out.append(question)
+            if len(out) == count:
+                break
+    return out
@@ -22,22 +22,132 @@ VECTOR_STORE_DIR.mkdir(parents=True, exist_ok=True)
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
 
+# Indexing pipeline settings
+INDEX_WORKERS = os.cpu_count() or 1
+INDEX_QUEUE_SIZE = 8
+EMBED_BATCH_SIZE = 1024
+HASH_WORKERS = 8
+PDF_SHARD_PAGES = 64
+
+# Work queue settings (main.py enqueue / main.py worker)
+QUEUE_DB_PATH = BASE_DIR / "vectorstore" / "work_queue.sqlite"
+QUEUE_STAGING_DIR = BASE_DIR / "vectorstore" / "staging"
+QUEUE_LEASE_SECONDS = 120
+QUEUE_MAX_ATTEMPTS = 3
+QUEUE_POLL_INTERVAL = 2.0
+
+# Watch mode settings (main.py watch)
+WATCH_BACKEND = "auto"
+WATCH_DEBOUNCE_SECONDS = 2.0
+WATCH_POLL_INTERVAL = 5.0
+WATCH_STATUS_PATH = BASE_DIR / "vectorstore" / "watch_status.json"
+
 # HuggingFace Models
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 LLM_MODEL = "nemotron-3-nano:latest"
 OLLAMA_BASE_URL = "http://127.0.0.1:11434"
 
+# Embedding engine settings
+EMBEDDING_BACKEND = "torch"
+EMBEDDING_ONNX_FILE = "onnx/model_quint8_avx2.onnx"
+EMBEDDING_PARITY_THRESHOLD = 0.98
+EMBEDDING_WORKERS = min(os.cpu_count() or 1, 8)
+EMBEDDING_MAX_BATCH_TOKENS = 16384
+EMBEDDING_MAX_BATCH_SIZE = 128
+EMBEDDING_POOL_MIN_TEXTS = 256
+
+# Embedding cache settings
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_DIR = BASE_DIR / "vectorstore" / "embedding_cache"
+EMBEDDING_CACHE_MAX_ENTRIES = 500_000
+EMBEDDING_CACHE_DTYPE = "float16"
+
 # Vector store settings
 COLLECTION_NAME = "enterprise_docs"
 TOP_K_RESULTS = 1
+VECTOR_BACKEND = "chroma"
+FLAT_STORE_DIR = BASE_DIR / "vectorstore" / "flat"
+FLAT_STORE_DTYPE = "float16"
+
+# Sharding settings
+VECTOR_SHARDS = 1
+SHARD_GROUPS = {}
+SHARD_SEARCH_WORKERS = min(os.cpu_count() or 1, 8)
+
+# Approximate search settings (VECTOR_BACKEND = "ivfpq")
+IVF_NLIST = 1024
+IVF_NPROBE = 16
+PQ_M = 48
+IVF_SHORTLIST = 256
+IVF_TRAIN_SAMPLE = 65536
+IVF_MIN_ROWS = 20000
+IVF_RETRAIN_GROWTH = 4
+
+# Hybrid lexical search settings
+HYBRID_SEARCH_ENABLED = True
+HYBRID_CANDIDATES = 20
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+# Reranking settings
+RERANK_ENABLED = True
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 20
+RERANK_BATCH_SIZE = 8
+RERANK_TIME_BUDGET = 0.25
+RERANK_MAX_LENGTH = 512
+RERANK_CACHE_SIZE = 16384
+
+# Query cache settings
+QUERY_CACHE_SIZE = 4096
+RETRIEVAL_CACHE_SIZE = 4096
+QUERY_CACHE_TTL = 3600
+
+# Semantic answer cache settings
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_PATH = BASE_DIR / "vectorstore" / "answer_cache.sqlite"
+ANSWER_CACHE_THRESHOLD = 0.95
+ANSWER_CACHE_MAX_ENTRIES = 10000
+ANSWER_CACHE_TTL = 24 * 3600
 
 # LLM generation settings
 MAX_MODEL_LENGTH = 8192
 MAX_TOKENS = 2048
 TEMPERATURE = 0.7
 
+# Context packing settings
+CONTEXT_TOKEN_BUDGET = MAX_MODEL_LENGTH - MAX_TOKENS
+CHARS_PER_TOKEN = 3.5
+
+# Chat session settings (app.py)
+CHAT_SESSIONS_ENABLED = True
+CHAT_SESSION_MAX_TOKENS = MAX_MODEL_LENGTH // 2
+CHAT_SESSION_IDLE_SECONDS = 1800
+CHAT_MAX_SESSIONS = 256
+
+# Startup settings
+WARMUP_ON_START = True
+WARMUP_LLM = True
+
+# HTTP serving settings (main.py serve)
+SERVE_HOST = "127.0.0.1"
+SERVE_PORT = 8000
+SERVE_MAX_CONCURRENT_GENERATIONS = 4
+SERVE_MAX_QUEUE = 64
+SERVE_RETRIEVAL_THREADS = 8
+SERVE_KEEPALIVE_TIMEOUT = 30
+
+# Batch query settings (main.py batch)
+BATCH_CONCURRENCY = 4
+BATCH_EMBED_SIZE = 256
+
 # Misc Settings
 ENFORCE_EAGER = True
 
 # Logging
 LOG_LEVEL = "INFO"
+
+# Metrics settings
+METRICS_ENABLED = True
+METRICS_LOG_PATH = None
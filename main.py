@@ -4,21 +4,24 @@ Main CLI interface for Lightweight Enterprise RAG System
 import sys
 import os
 import glob
-from src.pdf_chunker import process_pdfs_in_directory_parallel, extract_and_chunk_pdf
-from src.vector_store import VectorStoreManager
-from src.retriever import RAGRetriever
-from config.settings import DATA_DIR, CHUNK_SIZE, CHUNK_OVERLAP
+from config.settings import DATA_DIR, CHUNK_SIZE, CHUNK_OVERLAP, WARMUP_ON_START, VECTOR_SHARDS
+
+# Heavy modules (torch, LangChain, Chroma) are imported by the commands that need them
 
 os.environ['CUDA_DEVICE_ORDER'] = 'PCI_BUS_ID' # Forces GPU assignment according to their physicalhardware arrangement. 
 
 def index_documents(force_reindex=False):
     """Index new/changed PDFs only (unless force_reindex=True)."""
+    from src.indexing_pipeline import run_indexing_pipeline
+    from src.vector_store import VectorStoreManager
+    
     print("=" * 60)
     print("INDEXING DOCUMENTS")
     print("=" * 60)
     
     vsm = VectorStoreManager()
     vsm.create_or_load()
+    vsm.sync_lexical_index()
     
     # Get all PDFs
     pdf_files = glob.glob(os.path.join(DATA_DIR, '*.pdf'))
@@ -29,7 +32,7 @@ def index_documents(force_reindex=False):
     
     # Filter to new/changed files only
     if not force_reindex:
-        files_to_process = [f for f in pdf_files if not vsm.is_file_indexed(f)]
+        files_to_process = vsm.find_changed_files(pdf_files)
         
         if not files_to_process:
             print("\nAll PDFs already indexed. No new files to process.")
@@ -46,36 +49,182 @@ def index_documents(force_reindex=False):
         files_to_process = pdf_files
         print(f"Force re-indexing ALL {len(files_to_process)} PDF(s)\n")
     
-    # Process each file individually
-    total_new_chunks = 0
-    for pdf_file in files_to_process:
-        filename = os.path.basename(pdf_file)
-        print(f"Processing: {filename}")
-        
-        chunks = extract_and_chunk_pdf(pdf_file, CHUNK_SIZE, CHUNK_OVERLAP)
-        
-        if chunks:
-            vsm.add_documents(chunks, source_file=pdf_file, batch_size=100)
-            total_new_chunks += len(chunks)
-            print(f"  Added {len(chunks)} chunks from {filename}\n")
-        else:
-            print(f"  Warning: No chunks generated from {filename}\n")
+    # Extract, embed and write in overlapping stages
+    stats = run_indexing_pipeline(
+        files_to_process, vsm, CHUNK_SIZE, CHUNK_OVERLAP, force=force_reindex
+    )
     
     total_docs = vsm.get_collection_count()
     print(f"Indexing complete!")
-    print(f"  New chunks added: {total_new_chunks}")
+    print(f"  New/changed chunks written: {stats['chunks']}")
+    print(f"  Stale chunks removed: {stats['stale']}")
     print(f"  Total chunks in database: {total_docs}")
     print(f"  Indexed files: {len(vsm.list_indexed_files())}")
+    if stats["failed_files"]:
+        print(f"  ✗ Failed files (retried next run): {len(stats['failed_files'])}")
+    
+    if vsm.embedding_cache:
+        cache_stats = vsm.embedding_cache.stats()
+        print(f"  Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+              f"({cache_stats['hit_rate']:.0%} hit rate, {cache_stats['entries']} entries)")
+    
+    print_stage_timings()
+
+
+def enqueue_documents(force=False):
+    """Queue new/changed PDFs for indexing workers (main.py worker)."""
+    from src.vector_store import VectorStoreManager
+    from src.work_queue import WorkQueue
+    
+    pdf_files = glob.glob(os.path.join(DATA_DIR, '*.pdf'))
+    if not pdf_files:
+        print("\nNo PDFs found in data/pdfs/ directory.")
+        return
+    
+    files_to_queue = pdf_files if force else VectorStoreManager().find_changed_files(pdf_files)
+    work_queue = WorkQueue()
+    added = work_queue.enqueue(files_to_queue, force=force)
+    print(f"✓ Queued {added} file(s) ({len(files_to_queue) - added} already queued, "
+          f"{len(pdf_files) - len(files_to_queue)} unchanged)")
+    show_queue(work_queue)
+
+
+def _worker_process(commit, follow, name):
+    from src.work_queue import run_worker
+    
+    totals = run_worker(CHUNK_SIZE, CHUNK_OVERLAP, owner=name, commit=commit, follow=follow)
+    print(f"✓ Worker finished: {totals['tasks']} tasks, {totals['committed']} files committed "
+          f"({totals['chunks']} chunks), {totals['retried']} tasks handed back for retry, "
+          f"{totals['failed']} failed")
+
+
+def run_workers():
+    """Process the indexing work queue, optionally with several local worker processes."""
+    import multiprocessing
+    
+    processes = int(_option('--processes', 1))
+    commit = '--no-commit' not in sys.argv
+    follow = '--follow' in sys.argv
+    name = _option('--name', None)
+    
+    if processes == 1:
+        _worker_process(commit, follow, name)
+        return
+    
+    workers = [
+        multiprocessing.Process(
+            target=_worker_process, args=(commit, follow, f"{name}-{i}" if name else None)
+        )
+        for i in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def show_queue(work_queue=None):
+    """Work queue depth and failures."""
+    from src.work_queue import WorkQueue
+    
+    work_queue = work_queue or WorkQueue()
+    counts = work_queue.counts()
+    print(f"\nWork queue: {counts['open_jobs']} open file(s), {counts['done_jobs']} done, "
+          f"{counts['failed_jobs']} failed")
+    print(f"  Tasks: {counts['queued']} queued, {counts['leased']} leased "
+          f"({counts['expired']} expired), {counts['staged']} staged for commit")
+    for path, error in work_queue.failed_jobs():
+        print(f"  ✗ {os.path.basename(path)}: {error}")
 
 
-def query_system():
+def watch_documents():
+    """Index PDFs as they are added, changed or removed in DATA_DIR, until Ctrl-C."""
+    from src.vector_store import VectorStoreManager
+    from src.watcher import DocumentWatcher
+    from config.settings import WATCH_BACKEND, WATCH_DEBOUNCE_SECONDS
+    
+    vsm = VectorStoreManager()
+    vsm.create_or_load()
+    vsm.sync_lexical_index()
+    if WARMUP_ON_START:
+        # Load the model now rather than when the first document arrives
+        vsm.embeddings.engine
+    
+    watcher = DocumentWatcher(
+        vsm, CHUNK_SIZE, CHUNK_OVERLAP,
+        debounce=float(_option('--debounce', WATCH_DEBOUNCE_SECONDS)),
+        backend='poll' if '--poll' in sys.argv else WATCH_BACKEND
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    watcher.write_status()
+    print_stage_timings()
+
+
+def show_watch_status():
+    """Queue depth and lag of a running (or the last) main.py watch."""
+    import json
+    import time
+    from config.settings import WATCH_STATUS_PATH
+    
+    if not WATCH_STATUS_PATH.exists():
+        print("No watch status yet; start one with 'python3 main.py watch'.")
+        return
+    with open(WATCH_STATUS_PATH) as f:
+        status = json.load(f)
+    
+    alive = True
+    try:
+        os.kill(status["pid"], 0)
+    except ProcessLookupError:
+        alive = False
+    except PermissionError:
+        pass
+    print(f"\nWatcher (pid {status['pid']}, {status['backend']}): "
+          f"{'running' if alive else 'not running'}, watching {status['directory']}")
+    lag = time.time() - status["oldest_pending_since"] if status["oldest_pending_since"] else 0.0
+    print(f"  Queue: {status['pending']} file(s) pending ({status['incomplete']} still being written), "
+          f"lag {lag:.1f}s")
+    totals = status["totals"]
+    print(f"  Since start: {totals['indexed']} indexed, {totals['removed']} removed, "
+          f"{totals['failed']} failed, {totals['chunks']} chunks written")
+    batch = status["last_batch"]
+    if batch:
+        lag = f", max lag {batch['max_lag_seconds']:.1f}s" if batch["max_lag_seconds"] is not None else ""
+        print(f"  Last batch {time.time() - batch['finished']:.0f}s ago: {batch['indexed']} indexed, "
+              f"{batch['removed']} removed in {batch['seconds']:.1f}s{lag}")
+        for name in batch["failed"]:
+            print(f"  ✗ {name}")
+
+
+def print_stage_timings():
+    """Print count, p50/p95 and total time for every stage timed so far."""
+    from src import metrics
+    
+    summary = metrics.REGISTRY.summary()
+    if not summary:
+        return
+    print(f"\n  {'stage':<14}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'total s':>10}")
+    for stage, row in summary.items():
+        print(f"  {stage:<14}{row['count']:>8}{row['p50'] * 1000:>10.1f}"
+              f"{row['p95'] * 1000:>10.1f}{row['total']:>10.2f}")
+
+
+def query_system(use_cache=True):
     """Interactive query interface."""
+    from src.retriever import RAGRetriever
+    
     print("=" * 60)
     print("RAG QUERY SYSTEM")
     print("=" * 60)
-    print("Type 'exit' or 'quit' to stop\n")
+    print("Type 'exit' or 'quit' to stop, 'stats' for cache and timing statistics\n")
     
     rag = RAGRetriever()
+    # Models load while the first question is typed
+    if WARMUP_ON_START:
+        rag.warm_up()
     
     try:
         while True:
@@ -88,10 +237,26 @@ def query_system():
             if not query:
                 continue
             
-            result = rag.retrieve_and_generate(query)
+            if query.lower() == 'stats':
+                cache_stats = rag.cache_stats()
+                reranker = cache_stats.pop("reranker", None)
+                for name, stats in cache_stats.items():
+                    print(f"  {name}: {stats['hits']} hits, {stats['misses']} misses "
+                          f"({stats['hit_rate']:.0%}), {stats['size']} entries")
+                if reranker:
+                    print(f"  reranker: {reranker['reranked']} reranked, "
+                          f"{reranker['fallbacks']} budget fallbacks, "
+                          f"{reranker['score_cache']['hit_rate']:.0%} score cache hits")
+                print_stage_timings()
+                continue
+            
+            response = rag.stream(query, use_cache=use_cache)
             
-            print(f"\nAnswer:\n{result['answer']}")
-            print(f"\nSources: {', '.join(result['sources'])}")
+            print(f"\nSources: {', '.join(response.sources)}")
+            print("\nAnswer:")
+            for token in response:
+                print(token, end="", flush=True)
+            print()
             print("-" * 60)
     
     finally:
@@ -100,18 +265,183 @@ def query_system():
             del rag.llm
         del rag
 
-def show_stats():
-    """Show vector store statistics."""
+def serve():
+    """Run the async HTTP API."""
+    from src.server import run_server
+    from config.settings import SERVE_HOST, SERVE_PORT, OLLAMA_BASE_URL
+    
+    run_server(
+        host=_option('--host', SERVE_HOST),
+        port=int(_option('--port', SERVE_PORT)),
+        ollama_url=_option('--ollama-url', OLLAMA_BASE_URL)
+    )
+
+
+def batch_queries(input_path, output_path):
+    """Answer a JSONL file of questions."""
+    from src.batch import run_batch
+    from config.settings import BATCH_CONCURRENCY
+    
+    print("=" * 60)
+    print("BATCH QUERIES")
+    print("=" * 60)
+    
+    stats = run_batch(
+        input_path, output_path,
+        concurrency=int(_option('--concurrency', BATCH_CONCURRENCY)),
+        use_cache='--no-cache' not in sys.argv
+    )
+    
+    print(f"\nBatch complete!")
+    print(f"  Queries: {stats['total']} ({stats['skipped']} already answered)")
+    print(f"  Answered: {stats['answered']} ({stats['cached']} from cache)")
+    print(f"  Errors: {stats['errors']}")
+
+
+def ann_report():
+    """Measure IVF-PQ recall@k and latency against exact search on the indexed chunks."""
+    import random
+    from src.ivfpq import recall_report
+    from src.vector_store import VectorStoreManager
+    
     vsm = VectorStoreManager()
+    if vsm.backend != "ivfpq":
+        print('Set VECTOR_BACKEND = "ivfpq" in config/settings.py first.')
+        return
     vsm.create_or_load()
+    store = vsm.vector_store
+    if vsm.router:
+        # Each shard has its own IVF-PQ index
+        store = store.collections[int(_option('--shard', 0))]
+    
+    if store.index is None or '--train' in sys.argv:
+        store.train()
+    if store.index is None:
+        print("No chunks indexed yet.")
+        return
+    
+    # Query with the opening words of randomly sampled chunks
+    n_queries = int(_option('--queries', 200))
+    k = int(_option('--k', 10))
+    texts = store.get(include=["documents"])["documents"]
+    sample = random.Random(0).sample(texts, min(n_queries, len(texts)))
+    queries = vsm.embed_queries([" ".join(text.split()[:16]) for text in sample])
+    
+    stats = store.stats()
+    float32_bytes = stats["rows"] * stats["dim"] * 4
+    print(f"\nIVF-PQ: {stats['nlist']} lists, {stats['pq_bytes']}-byte codes, "
+          f"{stats['rows']} vectors")
+    print(f"  Codes in memory: {stats['code_bytes'] / 1e6:.1f} MB "
+          f"(float32 vectors: {float32_bytes / 1e6:.1f} MB, "
+          f"{float32_bytes / max(1, stats['code_bytes']):.0f}x smaller)")
+    print(f"\n  {'nprobe':>8}  {f'recall@{k}':>10}  {'mean ms':>8}  {'p95 ms':>8}")
+    for row in recall_report(store, queries, k=k):
+        nprobe = row['nprobe'] if row['nprobe'] is not None else 'exact'
+        print(f"  {nprobe:>8}  {row['recall']:>10.3f}  {row['mean_ms']:>8.2f}  {row['p95_ms']:>8.2f}")
+
+
+def show_shards():
+    """Per-shard chunk and file counts."""
+    from src.vector_store import VectorStoreManager
+    
+    vsm = VectorStoreManager()
+    if not vsm.router:
+        print("The vector store is not sharded (set VECTOR_SHARDS in config/settings.py).")
+        return
+    vsm.create_or_load()
+    print(f"\n  {'shard':>6}{'chunks':>10}{'files':>8}  directory")
+    for row in vsm.shard_stats():
+        print(f"  {row['shard']:>6}{row['chunks']:>10}{row['files']:>8}  {vsm.shard_dir(row['shard'])}")
+
+
+def rebuild_shard(shard, compact=False):
+    """Rebuild (or compact) one shard while the others keep serving."""
+    from src.indexing_pipeline import run_indexing_pipeline
+    from src.vector_store import VectorStoreManager
+    
+    vsm = VectorStoreManager()
+    vsm.create_or_load()
+    if not 0 <= shard < VECTOR_SHARDS:
+        print(f"No shard {shard}; shards are 0-{VECTOR_SHARDS - 1}.")
+        return
+    
+    paths = vsm.compact_shard(shard) if compact else vsm.rebuild_shard(shard)
+    if paths:
+        print(f"Re-indexing {len(paths)} file(s) into shard {shard}\n")
+        stats = run_indexing_pipeline(paths, vsm, CHUNK_SIZE, CHUNK_OVERLAP)
+        print(f"✓ Shard {shard} rebuilt: {stats['chunks']} chunks from {stats['files']} file(s)")
+        if stats["failed_files"]:
+            print(f"  ✗ Failed files (retried by the next index run): {len(stats['failed_files'])}")
+
+
+def export_index(path):
+    """Write the whole index to one snapshot file."""
+    import time
+    from src.snapshot import export_snapshot
+    from src.vector_store import VectorStoreManager
+    
+    vsm = VectorStoreManager()
+    start = time.perf_counter()
+    stats = export_snapshot(vsm, path, dtype='float16' if '--float16' in sys.argv else 'float32')
+    print(f"✓ Exported {stats['chunks']} chunks ({stats['dim']}-dim) from {stats['files']} file(s) "
+          f"to {path}: {stats['bytes'] / 1e6:.1f} MB in {time.perf_counter() - start:.1f}s")
+
+
+def import_index(path):
+    """Load a snapshot file into the vector store without re-embedding."""
+    import time
+    from src.snapshot import import_snapshot
+    from src.vector_store import VectorStoreManager
+    
+    if not os.path.exists(path):
+        print(f"No snapshot at {path}")
+        return
+    vsm = VectorStoreManager()
+    start = time.perf_counter()
+    try:
+        stats = import_snapshot(vsm, path, replace='--replace' in sys.argv,
+                                verify='--no-verify' not in sys.argv)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return
+    print(f"✓ Imported {stats['chunks']} chunks from {stats['files']} file(s) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+def _option(name, default):
+    """Value following a command-line flag, e.g. --port 8000."""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return default
+
+
+def show_stats():
+    """Show vector store statistics, answered from the manifest without loading models."""
+    from src.manifest import ManifestStore, manifest_path, backend_store_dir
+    from config.settings import COLLECTION_NAME, VECTOR_BACKEND
     
-    count = vsm.get_collection_count()
-    indexed_files = vsm.list_indexed_files()
+    manifest = ManifestStore(manifest_path())
+    manifest.import_legacy(
+        backend_store_dir() / "indexed_files.json",
+        backend_store_dir() / "chunk_manifest.json"
+    )
+    indexed_files = manifest.filenames()
+    pending = manifest.pending_files()
     
     print(f"\nVector Store Statistics")
-    print(f"  Collection: {COLLECTION_NAME}")
-    print(f"  Total chunks: {count}")
+    print(f"  Collection: {COLLECTION_NAME} ({VECTOR_BACKEND})")
+    if VECTOR_SHARDS > 1:
+        print(f"  Shards: {VECTOR_SHARDS} (python3 main.py shards for details)")
+    print(f"  Total chunks: {manifest.chunk_count()}")
     print(f"  Indexed files: {len(indexed_files)}")
+    if pending:
+        print(f"  Interrupted updates (finished by the next index run): {len(pending)}")
+    
+    if '--verify' in sys.argv:
+        from src.vector_store import VectorStoreManager
+        print(f"  Chunks in vector store: {VectorStoreManager().get_collection_count()}")
     
     if indexed_files:
         print(f"\nIndexed Files:")
@@ -119,11 +449,53 @@ def show_stats():
             print(f"  {i}. {filename}")
 
 
+def startup_report():
+    """Time each stage of a cold start, in the order commands pay for them."""
+    import time
+    
+    timings = []
+    
+    def timed(name, fn):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((name, time.perf_counter() - start))
+        return result
+    
+    def read_manifest():
+        from src.manifest import ManifestStore, manifest_path
+        return ManifestStore(manifest_path()).chunk_count()
+    
+    def open_store():
+        from src.vector_store import VectorStoreManager
+        VectorStoreManager().create_or_load()
+    
+    def init_retriever():
+        from src.retriever import RAGRetriever
+        return RAGRetriever()
+    
+    timed("stats (manifest)", read_manifest)
+    timed("open vector store", open_store)
+    rag = timed("retriever init", init_retriever)
+    rag.warm_up(background=False, llm='--llm' in sys.argv)
+    timings.extend((f"load {name}", seconds) for name, seconds in rag.warmup_times.items())
+    timed("first retrieval", lambda: rag.retrieve("How do I reset the device?"))
+    
+    print("\nStartup time report")
+    print(f"  {'stage':<24}{'ms':>10}{'cumulative ms':>16}")
+    total = 0.0
+    for name, seconds in timings:
+        total += seconds
+        print(f"  {name:<24}{seconds * 1000:>10.0f}{total * 1000:>16.0f}")
+    print("\n  'stats' needs only the first stage; 'query', 'serve' and the app need")
+    print("  the retriever before accepting input and load the models in the background.")
+
+
 def reset_database():
     """Delete and reset the vector store."""
     confirm = input("WARNING: Are you sure you want to delete all indexed documents? (yes/no): ")
     
     if confirm.lower() == 'yes':
+        from src.vector_store import VectorStoreManager
         vsm = VectorStoreManager()
         vsm.create_or_load()
         vsm.delete_collection()
@@ -139,8 +511,23 @@ def main():
         print("\nUsage:")
         print("  python3 main.py index           - Index new/changed PDFs only")
         print("  python3 main.py index --force   - Re-index all PDFs")
+        print("  python3 main.py enqueue         - Queue new/changed PDFs for workers (--force: all)")
+        print("  python3 main.py worker          - Index queued PDFs (--processes N, --no-commit, --follow)")
+        print("  python3 main.py queue           - Show work queue depth and failures")
+        print("  python3 main.py watch           - Index PDFs as they change in data/pdfs/ (--poll, --debounce S)")
+        print("  python3 main.py watch --status  - Show the watcher's queue depth and lag")
         print("  python3 main.py query           - Start interactive Q&A")
-        print("  python3 main.py stats           - Show database statistics")
+        print("  python3 main.py query --no-cache - Q&A without the semantic answer cache")
+        print("  python3 main.py batch IN OUT    - Answer a JSONL file of questions (--concurrency N)")
+        print("  python3 main.py serve           - Start HTTP API (--host, --port, --ollama-url)")
+        print("  python3 main.py stats           - Show database statistics (--verify: count the store)")
+        print("  python3 main.py startup-report  - Time each cold-start stage (--llm: include the LLM)")
+        print("  python3 main.py ann-report      - IVF-PQ recall/latency report (--queries N, --k K, --train, --shard N)")
+        print("  python3 main.py shards          - Show chunks and files per shard (VECTOR_SHARDS > 1)")
+        print("  python3 main.py rebuild-shard N - Re-index one shard while the others keep serving")
+        print("  python3 main.py compact-shard N - Reclaim space from deleted chunks in one shard")
+        print("  python3 main.py export FILE     - Write the index to one snapshot file (--float16)")
+        print("  python3 main.py import FILE     - Load a snapshot without re-embedding (--replace, --no-verify)")
         print("  python3 main.py reset           - Reset vector database")
         return
     
@@ -149,10 +536,47 @@ def main():
     if command == 'index':
         force = '--force' in sys.argv
         index_documents(force_reindex=force)
+    elif command == 'enqueue':
+        enqueue_documents(force='--force' in sys.argv)
+    elif command == 'worker':
+        run_workers()
+    elif command == 'queue':
+        show_queue()
+    elif command == 'watch':
+        if '--status' in sys.argv:
+            show_watch_status()
+        else:
+            watch_documents()
     elif command == 'query':
-        query_system()
+        query_system(use_cache='--no-cache' not in sys.argv)
+    elif command == 'batch':
+        if len(sys.argv) < 4:
+            print("Usage: python3 main.py batch queries.jsonl out.jsonl [--concurrency N] [--no-cache]")
+            return
+        batch_queries(sys.argv[2], sys.argv[3])
+    elif command == 'serve':
+        serve()
     elif command == 'stats':
         show_stats()
+    elif command == 'startup-report':
+        startup_report()
+    elif command == 'ann-report':
+        ann_report()
+    elif command == 'shards':
+        show_shards()
+    elif command in ('rebuild-shard', 'compact-shard'):
+        if len(sys.argv) < 3 or not sys.argv[2].isdigit():
+            print(f"Usage: python3 main.py {command} SHARD_NUMBER")
+            return
+        rebuild_shard(int(sys.argv[2]), compact=command == 'compact-shard')
+    elif command in ('export', 'import'):
+        if len(sys.argv) < 3 or sys.argv[2].startswith('--'):
+            print(f"Usage: python3 main.py {command} SNAPSHOT_FILE")
+            return
+        if command == 'export':
+            export_index(sys.argv[2])
+        else:
+            import_index(sys.argv[2])
     elif command == 'reset':
         reset_database()
     else:
@@ -0,0 +1,180 @@
+"""
+Persistent semantic answer cache for near-duplicate questions
+"""
+import json
+import sqlite3
+import threading
+import time
+import numpy as np
+from config.settings import (
+    ANSWER_CACHE_PATH, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL
+)
+
+
+class SemanticAnswerCache:
+    """
+    Answers keyed by query embedding rather than query text.
+
+    A lookup hits when a cached query is within a cosine-similarity threshold
+    of the new one, was answered by the same model from exactly the same
+    retrieved chunks, has not expired, and was stored at the current
+    collection generation. Entries from older generations are skipped at
+    lookup and left for TTL/LRU eviction to remove, since other processes
+    sharing the cache may still be on another generation. Embeddings are
+    kept in memory as one normalized matrix, so a lookup is a single
+    matrix-vector product; stored answers are appended to it, and it is only
+    reloaded when an eviction deleted rows.
+    """
+
+    def __init__(self, db_path=ANSWER_CACHE_PATH, threshold=ANSWER_CACHE_THRESHOLD,
+                 max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                model TEXT NOT NULL,
+                chunk_ids TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                generation INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+        """)
+        self._db.commit()
+        self._load()
+
+    def _load(self):
+        """Load entry ids and normalized embeddings into memory."""
+        rows = self._db.execute(
+            "SELECT id, embedding, model, chunk_ids, generation, created_at FROM answers"
+        ).fetchall()
+        self._ids = [row[0] for row in rows]
+        self._entries = {row[0]: (row[2], row[3], row[4], row[5]) for row in rows}
+        if rows:
+            self._matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = None
+
+    def _append(self, entry_id, vector, entry):
+        """Add a stored entry to the in-memory matrix, growing it by half when full."""
+        count = len(self._ids)
+        if self._matrix is None:
+            self._matrix = np.empty((16, len(vector)), dtype=np.float32)
+        elif count == len(self._matrix):
+            grown = np.empty((int(count * 1.5) + 1, self._matrix.shape[1]), dtype=np.float32)
+            grown[:count] = self._matrix
+            self._matrix = grown
+        self._matrix[count] = vector
+        self._ids.append(entry_id)
+        self._entries[entry_id] = entry
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, embedding, model, chunk_ids, generation):
+        """
+        Find a cached answer for a near-duplicate query.
+
+        Args:
+            embedding: Query embedding
+            model: LLM that would generate the answer
+            chunk_ids: Ids of the chunks retrieved for this query
+            generation: Current collection generation
+
+        Returns:
+            Dict with 'answer', 'sources' and 'similarity', or None on a miss
+        """
+        with self._lock:
+            if not self._ids:
+                self.misses += 1
+                return None
+
+            similarities = self._matrix[:len(self._ids)] @ self._normalize(embedding)
+            candidates = np.flatnonzero(similarities >= self.threshold)
+            chunk_key = json.dumps(sorted(chunk_ids))
+            now = time.time()
+
+            for index in candidates[np.argsort(-similarities[candidates])]:
+                entry_id = self._ids[index]
+                entry_model, entry_chunks, entry_generation, created_at = self._entries[entry_id]
+                if entry_model != model or entry_chunks != chunk_key or entry_generation != generation:
+                    continue
+                if self.ttl and created_at + self.ttl < now:
+                    continue
+
+                row = self._db.execute(
+                    "SELECT answer, sources FROM answers WHERE id = ?", (entry_id,)
+                ).fetchone()
+                if row is None:
+                    # Evicted by another process sharing the cache
+                    continue
+                answer, sources = row
+                self._db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, entry_id))
+                self._db.commit()
+                self.hits += 1
+                return {
+                    "answer": answer,
+                    "sources": json.loads(sources),
+                    "similarity": float(similarities[index]),
+                }
+
+            self.misses += 1
+            return None
+
+    def store(self, query, embedding, model, chunk_ids, generation, answer, sources):
+        """Cache an answer, evicting expired and least recently used entries."""
+        now = time.time()
+        vector = self._normalize(embedding)
+        chunk_key = json.dumps(sorted(chunk_ids))
+        with self._lock:
+            entry_id = self._db.execute(
+                "INSERT INTO answers (query, embedding, model, chunk_ids, answer, sources, "
+                "generation, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (query, vector.tobytes(), model, chunk_key, answer,
+                 json.dumps(sources), generation, now, now)
+            ).lastrowid
+            evicted = 0
+            if self.ttl:
+                evicted += self._db.execute(
+                    "DELETE FROM answers WHERE created_at < ?", (now - self.ttl,)
+                ).rowcount
+            evicted += self._db.execute(
+                "DELETE FROM answers WHERE id NOT IN "
+                "(SELECT id FROM answers ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            ).rowcount
+            self._db.commit()
+            if evicted:
+                self._load()
+            else:
+                self._append(entry_id, vector, (model, chunk_key, generation, now))
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM answers")
+            self._db.commit()
+            self._load()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._ids),
+            "maxsize": self.max_entries,
+        }
@@ -0,0 +1,173 @@
+"""
+Batch question answering with vectorized retrieval (main.py batch)
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from tqdm import tqdm
+from src import metrics
+from src.retriever import RAGRetriever
+from config.settings import (
+    LLM_MODEL, TOP_K_RESULTS, BATCH_CONCURRENCY, BATCH_EMBED_SIZE, RERANK_CANDIDATES
+)
+
+
+def _read_queries(input_path):
+    """Load {"id", "query"} records; ids default to the line number."""
+    queries = []
+    with open(input_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            queries.append({"id": str(record.get("id", line_number)), "query": record["query"]})
+    return queries
+
+
+def _completed_ids(output_path):
+    """
+    Ids already answered in an earlier run.
+
+    A partially written last line (from a crash) is truncated so new results
+    are appended on a clean line boundary.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if "answer" in record:
+            done.add(str(record["id"]))
+    return done
+
+
+def run_batch(input_path, output_path, rag=None, concurrency=BATCH_CONCURRENCY,
+              embed_batch_size=BATCH_EMBED_SIZE, k=TOP_K_RESULTS, use_cache=True):
+    """
+    Answer a JSONL file of questions and stream results to a JSONL file.
+
+    Queries are embedded in large batches and looked up in the vector store
+    with one multi-query call per batch, then fused with BM25 rankings and
+    reranked (when enabled). Generation fans out over a thread pool while the next batch is being
+    retrieved. Each result is flushed as soon as it completes; rerunning with
+    the same output file skips ids that were already answered.
+
+    Args:
+        input_path: JSONL with a 'query' (and optional 'id') per line
+        output_path: JSONL results file (appended to)
+        rag: Optional RAGRetriever to reuse
+        concurrency: Max generations in flight
+        embed_batch_size: Queries per embedding and retrieval batch
+        k: Chunks retrieved per query
+        use_cache: Serve near-duplicate questions from the answer cache
+
+    Returns:
+        Dict with 'total', 'skipped', 'answered', 'cached' and 'errors'
+    """
+    queries = _read_queries(input_path)
+    done = _completed_ids(output_path)
+    pending = [q for q in queries if q["id"] not in done]
+    stats = {"total": len(queries), "skipped": len(queries) - len(pending),
+             "answered": 0, "cached": 0, "errors": 0}
+    if not pending:
+        return stats
+
+    rag = rag or RAGRetriever()
+    vsm = rag.vs_manager
+    answer_cache = rag.answer_cache if use_cache else None
+    generation = vsm.generation
+
+    def generate(item, docs):
+        start = time.perf_counter()
+        prompt = rag.build_prompt(item["query"], docs)
+        # Not streamed, so prefill and decode cannot be told apart here
+        with metrics.span("llm_generate"):
+            answer = rag.llm.invoke(prompt).strip()
+        return answer, time.perf_counter() - start
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor, \
+            tqdm(total=len(pending), desc="Answering", unit="query") as pbar:
+
+        def write(record):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            pbar.update(1)
+
+        def finish(future, item, docs, sources, cache_key):
+            try:
+                answer, latency = future.result()
+            except Exception as e:
+                stats["errors"] += 1
+                write({"id": item["id"], "query": item["query"], "error": str(e)})
+                return
+            if cache_key:
+                embedding, chunk_ids = cache_key
+                answer_cache.store(item["query"], embedding, LLM_MODEL, chunk_ids,
+                                   generation, answer, sources)
+            stats["answered"] += 1
+            write({"id": item["id"], "query": item["query"], "answer": answer,
+                   "sources": sources, "cached": False, "latency": latency})
+
+        in_flight = {}
+
+        def drain(limit):
+            while len(in_flight) > limit:
+                completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    finish(future, *in_flight.pop(future))
+
+        for i in range(0, len(pending), embed_batch_size):
+            block = pending[i:i + embed_batch_size]
+            texts = [item["query"] for item in block]
+            with metrics.span("query_embed", queries=len(texts)):
+                embeddings = vsm.embed_queries(texts)
+            with metrics.span("search", queries=len(texts)):
+                results = vsm.hybrid_search_by_vectors(
+                    texts, embeddings, k=max(k, RERANK_CANDIDATES) if rag.reranker else k
+                )
+            if rag.reranker:
+                with metrics.span("rerank", pairs=sum(map(len, results))):
+                    results = [rag.reranker.rerank(text, docs, k)[0] for text, docs in zip(texts, results)]
+
+            for item, embedding, docs in zip(block, embeddings, results):
+                if not docs:
+                    stats["answered"] += 1
+                    write({"id": item["id"], "query": item["query"],
+                           "answer": "No relevant documents found in the knowledge base.",
+                           "sources": [], "cached": False, "latency": 0.0})
+                    continue
+
+                sources = list(set([doc.metadata.get('source_file', 'unknown') for doc in docs]))
+                cache_key = None
+                if answer_cache is not None:
+                    chunk_ids = [doc.metadata.get("chunk_id") or doc.id for doc in docs]
+                    cached = answer_cache.lookup(embedding, LLM_MODEL, chunk_ids, generation)
+                    if cached:
+                        stats["answered"] += 1
+                        stats["cached"] += 1
+                        write({"id": item["id"], "query": item["query"], "answer": cached["answer"],
+                               "sources": cached["sources"], "cached": True, "latency": 0.0})
+                        continue
+                    cache_key = (embedding, chunk_ids)
+
+                future = executor.submit(generate, item, docs)
+                in_flight[future] = (item, docs, sources, cache_key)
+
+            # Keep retrieving ahead while generations run, but bound the backlog
+            drain(concurrency * 2)
+
+        drain(0)
+
+    return stats
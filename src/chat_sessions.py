@@ -0,0 +1,112 @@
+"""
+Per-conversation LLM context kept between chat turns
+"""
+import threading
+from array import array
+from src.query_cache import LRUCache
+from config.settings import CHAT_MAX_SESSIONS, CHAT_SESSION_IDLE_SECONDS, CHAT_SESSION_MAX_TOKENS
+
+
+class ChatSession:
+    """
+    State of one conversation.
+
+    'context' holds the token ids Ollama returned with the last answer:
+    the whole conversation so far, already tokenized. Sending it back with
+    the next prompt continues the conversation, and since it is a prefix of
+    the new input, Ollama reuses the KV cache it still holds for it and
+    only prefills the new turn's tokens. The chunks already in the context
+    are remembered so a follow-up sends only new ones.
+    """
+
+    def __init__(self, session_id, max_tokens=CHAT_SESSION_MAX_TOKENS):
+        self.session_id = session_id
+        self.max_tokens = max_tokens
+        self.context = None
+        self.sent_chunks = set()
+        # (question, answer) of the last turn, carried over when the context is dropped
+        self.last_exchange = None
+        self.turns = 0
+        self.restarts = 0
+        # Prompt tokens Ollama actually evaluated for the last turn
+        self.last_prefill_tokens = None
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self):
+        return len(self.context) if self.context is not None else 0
+
+    def snapshot(self):
+        """
+        State to build the next turn on.
+
+        Returns:
+            Tuple of (turn number, context token list or None, ids of chunks
+            in the context, last exchange or None)
+        """
+        with self._lock:
+            context = self.context.tolist() if self.context is not None else None
+            return self.turns, context, set(self.sent_chunks), self.last_exchange
+
+    def record(self, turn, question, answer, context, chunk_ids, prefill_tokens=None):
+        """
+        Save a finished turn.
+
+        Args:
+            turn: Turn number from the snapshot() the prompt was built on; if
+                another turn finished since (two tabs, a double submit),
+                this one is not recorded
+            context: Token ids returned by Ollama, or None (e.g. a cached
+                answer), which ends the current context
+            chunk_ids: Chunks sent in this turn's prompt
+            prefill_tokens: Prompt tokens Ollama evaluated
+        """
+        with self._lock:
+            if turn != self.turns:
+                return
+            self.turns += 1
+            self.last_exchange = (question, answer)
+            self.last_prefill_tokens = prefill_tokens
+            if context is None or len(context) > self.max_tokens:
+                # Over the cap: the next turn starts a new context from the last exchange
+                if self.context is not None:
+                    self.restarts += 1
+                self.context = None
+                self.sent_chunks = set()
+                return
+            self.context = array("i", context)
+            self.sent_chunks.update(chunk_ids)
+
+
+class SessionStore:
+    """
+    Chat sessions by id, dropped after CHAT_SESSION_IDLE_SECONDS without a
+    turn or when more than CHAT_MAX_SESSIONS are open (least recently used
+    first). Each session holds at most CHAT_SESSION_MAX_TOKENS context
+    tokens (4 bytes each); Ollama holds no per-session state, so dropping a
+    session here frees it entirely.
+    """
+
+    def __init__(self, max_sessions=CHAT_MAX_SESSIONS, idle_seconds=CHAT_SESSION_IDLE_SECONDS,
+                 max_tokens=CHAT_SESSION_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        self._sessions = LRUCache(max_sessions, idle_seconds)
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """The session with this id, started anew if it expired or never existed."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChatSession(session_id, self.max_tokens)
+            # Re-inserting restarts the idle timer
+            self._sessions.put(session_id, session)
+            return session
+
+    def end(self, session_id):
+        self._sessions.pop(session_id)
+
+    def stats(self):
+        stats = self._sessions.stats()
+        return {"sessions": stats["size"], "max_sessions": stats["maxsize"],
+                "resumed": stats["hits"], "started": stats["misses"]}
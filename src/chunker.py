@@ -0,0 +1,148 @@
+"""
+Single-pass, offset-preserving text chunker
+
+Produces the same chunk boundaries as LangChain's RecursiveCharacterTextSplitter
+(default separators, separators kept at the start of splits, whitespace
+stripped) but works on (start, end) offsets into the page text instead of
+copying strings, so each page is scanned once per separator level and every
+chunk knows exactly where it came from.
+"""
+from collections import deque
+from langchain_core.documents import Document
+
+# Paragraph, line, word, character
+SEPARATORS = ("\n\n", "\n", " ", "")
+
+
+class Chunk:
+    """A chunk of one PDF page, located by character offsets within the page."""
+
+    __slots__ = ("text", "source_file", "page", "start", "end")
+
+    def __init__(self, text, source_file, page, start):
+        self.text = text
+        self.source_file = source_file
+        self.page = page
+        self.start = start
+        self.end = start + len(text)
+
+    def __repr__(self):
+        return f"Chunk({self.source_file!r}, page={self.page}, start={self.start}, end={self.end})"
+
+    def to_document(self):
+        """LangChain Document with the metadata the vector store indexes."""
+        return Document(
+            page_content=self.text,
+            metadata={
+                "source_file": self.source_file,
+                "page": self.page,
+                "start_index": self.start,
+                "end_index": self.end,
+            }
+        )
+
+
+class TextChunker:
+    """
+    Splits text at the coarsest separator that yields chunks of at most
+    chunk_size characters, with up to chunk_overlap characters shared
+    between neighbouring chunks.
+    """
+
+    def __init__(self, chunk_size, chunk_overlap, separators=SEPARATORS):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) is larger than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = tuple(separators)
+
+    def spans(self, text):
+        """
+        Chunk boundaries of a text.
+
+        Returns:
+            List of (start, end) offsets, in order
+        """
+        out = []
+        if text:
+            self._split(text, 0, len(text), 0, out)
+        return out
+
+    def split_text(self, text):
+        """Chunk texts, like RecursiveCharacterTextSplitter.split_text()."""
+        return [text[start:end] for start, end in self.spans(text)]
+
+    def chunk_page(self, text, source_file, page):
+        """Yield Chunk records for one page."""
+        for start, end in self.spans(text):
+            yield Chunk(text[start:end], source_file, page, start)
+
+    def _split(self, text, start, end, level, out):
+        separators = self.separators
+        separator, deeper = separators[-1], False
+        for i in range(level, len(separators)):
+            if separators[i] == "":
+                separator = ""
+                break
+            if text.find(separators[i], start, end) != -1:
+                separator, deeper = separators[i], i + 1 < len(separators)
+                break
+
+        good = []
+        for a, b in self._pieces(text, start, end, separator):
+            if b - a < self.chunk_size:
+                good.append((a, b))
+                continue
+            if good:
+                self._merge(text, good, out)
+                good = []
+            if deeper:
+                self._split(text, a, b, i + 1, out)
+            else:
+                # Unsplittable; kept whole and unstripped as the recursive splitter does
+                out.append((a, b))
+        if good:
+            self._merge(text, good, out)
+
+    @staticmethod
+    def _pieces(text, start, end, separator):
+        """Contiguous pieces of text[start:end], each but the first starting with separator."""
+        if not separator:
+            for pos in range(start, end):
+                yield pos, pos + 1
+            return
+        a = start
+        pos = text.find(separator, start, end)
+        while pos != -1:
+            if pos > a:
+                yield a, pos
+            a = pos
+            pos = text.find(separator, pos + len(separator), end)
+        if end > a:
+            yield a, end
+
+    def _merge(self, text, pieces, out):
+        """Greedily merge contiguous pieces into chunks, carrying the overlap forward."""
+        window = deque()
+        total = 0
+        for a, b in pieces:
+            length = b - a
+            if total + length > self.chunk_size and window:
+                self._emit(text, window[0][0], window[-1][1], out)
+                while total > self.chunk_overlap or (total + length > self.chunk_size and total > 0):
+                    first_a, first_b = window.popleft()
+                    total -= first_b - first_a
+            window.append((a, b))
+            total += length
+        if window:
+            self._emit(text, window[0][0], window[-1][1], out)
+
+    @staticmethod
+    def _emit(text, start, end, out):
+        """Record text[start:end] without surrounding whitespace, if any is left."""
+        chunk = text[start:end]
+        stripped = chunk.lstrip()
+        start += len(chunk) - len(stripped)
+        stripped = stripped.rstrip()
+        if stripped:
+            out.append((start, start + len(stripped)))
@@ -0,0 +1,220 @@
+"""
+Token-budgeted prompt assembly from retrieved chunks
+"""
+import hashlib
+import math
+from config.settings import CONTEXT_TOKEN_BUDGET, CHARS_PER_TOKEN
+
+# Constant across requests so Ollama can reuse the KV cache for this prefix
+INSTRUCTIONS = """You are a technical documentation expert. Using the context provided below, give a comprehensive and detailed answer to the question.
+
+Instructions:
+- Provide a thorough explanation with relevant details
+- Include specific examples or technical specifications when available
+- Structure your response with clear paragraphs
+- Aim for 3-5 paragraphs when the context supports it
+- If multiple aspects exist, address each one
+- Use technical terminology appropriately
+- If context is insufficient, explain what information is missing
+Context:
+"""
+
+QUESTION_TEMPLATE = """
+
+Question: {query}
+
+Answer:"""
+
+# A follow-up turn in a chat session: the instructions and earlier context are
+# already in the session's KV context, so only new chunks and the question are sent
+FOLLOW_UP_TEMPLATE = """Additional context:
+{context}
+
+Question: {query}
+
+Answer:"""
+
+FOLLOW_UP_NO_CONTEXT_TEMPLATE = """Question: {query}
+
+Answer:"""
+
+# The last exchange of a chat session that had to start over
+HISTORY_TEMPLATE = """
+
+Earlier in this conversation:
+Q: {question}
+A: {answer}"""
+HISTORY_MAX_TOKENS = 512
+
+
+def estimate_tokens(text):
+    """Conservative token estimate (the LLM tokenizer is not available in-process)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class ContextBlock:
+    """A span of one page assembled from one or more retrieved chunks."""
+
+    __slots__ = ("source", "page", "start", "end", "text", "rank")
+
+    def __init__(self, source, page, start, text, rank):
+        self.source = source
+        self.page = page
+        self.start = start
+        self.end = start + len(text) if start is not None else None
+        self.text = text
+        self.rank = rank
+
+    def extend(self, start, text, rank):
+        """Append a chunk that overlaps or directly follows this block."""
+        self.text += text[self.end - start:]
+        self.end = max(self.end, start + len(text))
+        self.rank = min(self.rank, rank)
+
+    def header(self):
+        if self.page is not None:
+            return f"[Source: {self.source}, page {self.page}]"
+        return f"[Source: {self.source}]"
+
+    def render(self, text=None):
+        return f"{self.header()}\n{self.text if text is None else text}"
+
+
+def merge_chunks(docs):
+    """
+    Merge overlapping or adjacent chunks of the same page and drop duplicates.
+
+    Chunks carry their character offset within the page ('start_index'), so
+    the CHUNK_OVERLAP shared between neighbours is kept only once. Chunks
+    without offsets are kept whole; identical text is kept only once.
+
+    Args:
+        docs: Retrieved LangChain Documents, most relevant first
+
+    Returns:
+        List of ContextBlock ordered by their best chunk's rank
+    """
+    spans = {}
+    standalone = []
+    for rank, doc in enumerate(docs):
+        meta = doc.metadata
+        source = meta.get("source_file", "unknown")
+        start = meta.get("start_index")
+        if start is None:
+            standalone.append(ContextBlock(source, meta.get("page"), None, doc.page_content, rank))
+        else:
+            spans.setdefault((source, meta.get("page")), []).append((start, doc.page_content, rank))
+
+    blocks = []
+    for (source, page), chunks in spans.items():
+        chunks.sort()
+        current = None
+        for start, text, rank in chunks:
+            if current is not None and start <= current.end:
+                current.extend(start, text, rank)
+            else:
+                current = ContextBlock(source, page, start, text, rank)
+                blocks.append(current)
+
+    seen = set()
+    unique = []
+    for block in sorted(blocks + standalone, key=lambda b: b.rank):
+        digest = hashlib.blake2b(" ".join(block.text.split()).encode("utf-8"), digest_size=16).digest()
+        if digest not in seen:
+            seen.add(digest)
+            unique.append(block)
+    return unique
+
+
+class ContextPacker:
+    """
+    Builds prompts as INSTRUCTIONS + packed context + question.
+
+    Blocks are added in relevance order while they fit the token budget
+    left after the instructions, the question and the answer (MAX_TOKENS);
+    if even the most relevant block does not fit, it is truncated.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self._prefix_tokens = estimate_tokens(INSTRUCTIONS)
+
+    def pack(self, query, docs, budget=None):
+        """
+        Select and order context for a query.
+
+        Args:
+            budget: Tokens available for context (default: what the token
+                budget leaves after the instructions and question)
+
+        Returns:
+            Tuple of (context string, ContextBlocks included)
+        """
+        if budget is None:
+            budget = self.token_budget - self._prefix_tokens - estimate_tokens(
+                QUESTION_TEMPLATE.format(query=query)
+            )
+
+        parts, used = [], []
+        for block in merge_chunks(docs):
+            rendered = block.render()
+            # Blocks are joined by a blank line
+            cost = estimate_tokens(rendered) + (1 if parts else 0)
+            if cost <= budget:
+                parts.append(rendered)
+                used.append(block)
+                budget -= cost
+            elif not parts and budget > 0:
+                keep = int(max(0, budget - estimate_tokens(block.header()) - 1) * CHARS_PER_TOKEN)
+                block = ContextBlock(block.source, block.page, block.start, block.text[:keep], block.rank)
+                parts.append(block.render())
+                used.append(block)
+                break
+
+        return "\n\n".join(parts), used
+
+    def build_prompt(self, query, docs, history=None):
+        """Full prompt for the LLM."""
+        return self.compose(query, docs, history=history)[0]
+
+    def compose(self, query, docs, history=None, follow_up_budget=None):
+        """
+        Prompt for one turn of a conversation.
+
+        Args:
+            history: Optional (question, answer) of an earlier exchange to
+                include, truncated to HISTORY_MAX_TOKENS
+            follow_up_budget: For a follow-up turn in a chat session, the
+                prompt tokens the session still has room for; the prompt is
+                then only the new context and the question
+
+        Returns:
+            Tuple of (prompt, docs whose whole text is in the prompt)
+        """
+        if follow_up_budget is not None:
+            budget = follow_up_budget - estimate_tokens(FOLLOW_UP_TEMPLATE.format(context="", query=query))
+            context, blocks = self.pack(query, docs, budget)
+            if context:
+                prompt = FOLLOW_UP_TEMPLATE.format(context=context, query=query)
+            else:
+                prompt = FOLLOW_UP_NO_CONTEXT_TEMPLATE.format(query=query)
+        else:
+            question = QUESTION_TEMPLATE.format(query=query)
+            earlier = ""
+            if history:
+                keep = int(HISTORY_MAX_TOKENS * CHARS_PER_TOKEN)
+                earlier_question = history[0][:keep // 4]
+                answer = history[1][:keep - len(earlier_question)]
+                earlier = HISTORY_TEMPLATE.format(question=earlier_question, answer=answer)
+            budget = (self.token_budget - self._prefix_tokens - estimate_tokens(question)
+                      - estimate_tokens(earlier))
+            context, blocks = self.pack(query, docs, budget)
+            prompt = INSTRUCTIONS + context + earlier + question
+
+        # Merged blocks contain each of their chunks verbatim (a truncated one only a prefix)
+        included = [
+            doc for doc in docs
+            if any(block.source == doc.metadata.get("source_file", "unknown")
+                   and doc.page_content in block.text for block in blocks)
+        ]
+        return prompt, included
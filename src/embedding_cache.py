@@ -0,0 +1,257 @@
+"""
+Content-addressed on-disk embedding cache
+"""
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from contextlib import contextmanager
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from config.settings import (
+    EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_DTYPE
+)
+
+
+def normalize_text(text):
+    """Canonical form of a chunk used for cache keys."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """
+    Fixed-capacity vector cache keyed by (model name, normalized text hash).
+
+    Vectors live in one memory-mapped matrix (float16 by default); a small
+    SQLite table maps 16-byte keys to matrix rows and tracks recency. When the
+    matrix is full the least recently used rows are evicted and reused.
+
+    Several processes (e.g. `main.py index` and `main.py watch`) may share a
+    cache directory, so slots are allocated, written and read under SQLite's
+    write lock rather than from counters held in memory.
+    """
+
+    def __init__(self, model_name, cache_dir=EMBEDDING_CACHE_DIR,
+                 max_entries=EMBEDDING_CACHE_MAX_ENTRIES, dtype=EMBEDDING_CACHE_DTYPE):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = cache_dir / f"vectors.{self.dtype.name}"
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(cache_dir / "index.sqlite"), timeout=60,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key BLOB PRIMARY KEY,
+                slot INTEGER NOT NULL,
+                last_used INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER);
+        """)
+
+        self.dim = None
+        self._matrix = None
+        self._load_matrix()
+
+    def _get_meta(self, name):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value)
+        )
+
+    def _open_matrix(self):
+        mode = "r+" if self.vectors_path.exists() else "w+"
+        return np.memmap(self.vectors_path, dtype=self.dtype, mode=mode,
+                         shape=(self.max_entries, self.dim))
+
+    def _load_matrix(self):
+        """Map the matrix once any process has stored a vector."""
+        if self._matrix is None:
+            self.dim = self._get_meta("dim")
+            if self.dim:
+                self._matrix = self._open_matrix()
+        return self._matrix
+
+    @contextmanager
+    def _transaction(self):
+        """Run a block holding the cache's write lock across processes."""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _tick(self):
+        """Advance the shared recency clock; call inside _transaction()."""
+        clock = (self._get_meta("clock") or 0) + 1
+        self._set_meta("clock", clock)
+        return clock
+
+    def key(self, text):
+        """16-byte key for a chunk of text under this cache's model."""
+        data = f"{self.model_name}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def get_many(self, keys):
+        """
+        Look up cached vectors.
+
+        Args:
+            keys: List of keys from key()
+
+        Returns:
+            Dict mapping position in keys to a float32 vector
+        """
+        found = {}
+        with self._lock:
+            if keys and self._load_matrix() is not None:
+                # Held while reading rows so another process cannot evict and overwrite them
+                with self._transaction():
+                    found = self._read(keys)
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def _read(self, keys):
+        """Vectors stored for keys, by position; call inside _transaction()."""
+        found = {}
+        slots = {}
+        unique = list(set(keys))
+        for i in range(0, len(unique), 500):
+            part = unique[i:i + 500]
+            rows = self._db.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})",
+                part
+            ).fetchall()
+            slots.update(rows)
+
+        for pos, key in enumerate(keys):
+            if key in slots:
+                found[pos] = np.asarray(self._matrix[slots[key]], dtype=np.float32)
+
+        if slots:
+            clock = self._tick()
+            self._db.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(clock, key) for key in slots]
+            )
+        return found
+
+    def put_many(self, keys, vectors):
+        """
+        Store vectors, evicting least recently used entries when full.
+
+        Args:
+            keys: List of keys from key()
+            vectors: Matching float vectors
+        """
+        items = dict(zip(keys, vectors))
+        if not items:
+            return
+
+        with self._lock, self._transaction():
+            if self._load_matrix() is None:
+                self.dim = len(next(iter(items.values())))
+                self._matrix = self._open_matrix()
+                self._set_meta("dim", self.dim)
+
+            existing = set()
+            all_keys = list(items)
+            for i in range(0, len(all_keys), 500):
+                part = all_keys[i:i + 500]
+                existing.update(row[0] for row in self._db.execute(
+                    f"SELECT key FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+                ))
+            new_keys = [key for key in items if key not in existing][:self.max_entries]
+            if not new_keys:
+                return
+
+            # Reserve slots from the shared counter, then write them before committing
+            next_slot = self._get_meta("next_slot") or 0
+            fresh = min(len(new_keys), self.max_entries - next_slot)
+            slots = list(range(next_slot, next_slot + fresh))
+            self._set_meta("next_slot", next_slot + fresh)
+
+            evict = len(new_keys) - fresh
+            if evict:
+                victims = self._db.execute(
+                    "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (evict,)
+                ).fetchall()
+                self._db.executemany("DELETE FROM entries WHERE key = ?",
+                                     [(key,) for key, _ in victims])
+                slots.extend(slot for _, slot in victims)
+
+            clock = self._tick()
+            self._db.executemany(
+                "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                [(key, slot, clock) for key, slot in zip(new_keys, slots)]
+            )
+            for key, slot in zip(new_keys, slots):
+                self._matrix[slot] = items[key]
+            self._matrix.flush()
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self):
+        """Hit/miss counters for this process plus current size."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """Embedding function that serves unchanged chunks from an EmbeddingCache."""
+
+    def __init__(self, embeddings, cache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        """Embed documents, computing only cache misses."""
+        texts = list(texts)
+        keys = [self.cache.key(text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        # Embed each distinct missing text once
+        missing = {}
+        for pos, key in enumerate(keys):
+            if pos not in found:
+                missing.setdefault(key, texts[pos])
+
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing, vectors))
+            self.cache.put_many(list(computed), list(computed.values()))
+            for pos, key in enumerate(keys):
+                if pos not in found:
+                    found[pos] = computed[key]
+
+        return [list(map(float, found[pos])) for pos in range(len(texts))]
+
+    def embed_query(self, text):
+        """Queries bypass the persistent cache."""
+        return self.embeddings.embed_query(text)
+
+    def __getattr__(self, name):
+        # Expose the wrapped engine's helpers (encode, close, backend, ...)
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
@@ -0,0 +1,491 @@
+"""
+Memory-mapped NumPy vector store (VECTOR_BACKEND = "flat")
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+from langchain_core.documents import Document
+
+# Rows scored per matrix product during search
+SEARCH_BLOCK_ROWS = 16384
+# Rows allocated when the matrix is first created
+MIN_CAPACITY = 1024
+# Max SQL parameters per IN (...) clause
+SQL_BATCH_SIZE = 900
+# Compact once at least this fraction of rows is deleted
+COMPACT_RATIO = 0.5
+COMPACT_MIN_ROWS = 1000
+# Seconds to wait for another process's write transaction
+WRITE_LOCK_TIMEOUT = 300
+
+
+def open_memmap(path, dtype, row_shape, capacity, mode):
+    """
+    Map a row-major array file, first growing it to capacity rows when writable.
+
+    Returns:
+        np.memmap covering every row in the file, or None if it has no rows
+    """
+    row_bytes = np.dtype(dtype).itemsize * int(np.prod(row_shape or (1,)))
+    if mode == "r+":
+        if not path.exists() or path.stat().st_size < capacity * row_bytes:
+            with open(path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+    rows = path.stat().st_size // row_bytes if path.exists() else 0
+    if not rows:
+        return None
+    return np.memmap(path, dtype=dtype, mode=mode, shape=(rows,) + tuple(row_shape))
+
+
+def rewrite_file(path, data):
+    """Atomically replace a file with the raw bytes of an array."""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    np.ascontiguousarray(data).tofile(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class FlatVectorStore:
+    """
+    Exact top-k search over one contiguous memory-mapped matrix.
+
+    Vectors are L2-normalized and stored row by row as float16, or as int8
+    with a float32 scale per row. A byte per row marks live rows, so deletes
+    are tombstones; text and metadata live in a SQLite table keyed by row.
+    Search is a blocked matrix product over the mapped rows with
+    argpartition for the top k, so the only memory used beyond the OS page
+    cache (which every process mapping the files shares) is one block of
+    float32 scores.
+
+    The methods mirror the parts of Chroma's API that VectorStoreManager
+    uses (add_documents, similarity_search*, get, delete, upsert, query,
+    count, delete_collection).
+    """
+
+    def __init__(self, store_dir, embedding_function=None, dtype="float16"):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported flat store dtype: {dtype}")
+        self.dir = Path(store_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.embedding_function = embedding_function
+        self.mode = "r+" if os.access(self.dir, os.W_OK) else "r"
+
+        self._lock = threading.RLock()
+        # Writers in other processes hold the database for as long as an upsert takes
+        self._db = sqlite3.connect(str(self.dir / "metadata.sqlite"), timeout=WRITE_LOCK_TIMEOUT,
+                                   check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                id TEXT NOT NULL UNIQUE,
+                document TEXT,
+                metadata TEXT,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+
+        self.dtype = self._get_meta("dtype") or dtype
+        dim = self._get_meta("dim")
+        self.dim = int(dim) if dim else None
+
+        self._epoch = None
+        self._count = 0
+        self._capacity = 0
+        self._vectors = None
+        self._scales = None
+        self._live = None
+        self._refresh()
+
+    # Storage
+
+    def _get_meta(self, name):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        self._db.execute(
+            "INSERT INTO meta (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = excluded.value",
+            (name, str(value))
+        )
+
+    @contextmanager
+    def _write_transaction(self):
+        """
+        Hold SQLite's write lock for a block that also writes the matrix files.
+
+        Other processes append to and renumber the same files, so row numbers
+        must be read, used and committed without another writer in between.
+        """
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def _paths(self):
+        return self.dir / f"vectors.{self.dtype}", self.dir / "scales.float32", self.dir / "live.u8"
+
+    def _map(self, capacity, mode):
+        """(Re)map the matrix files, growing them to at least capacity rows."""
+        vectors_path, scales_path, live_path = self._paths()
+        self._vectors = open_memmap(vectors_path, self.dtype, (self.dim,), capacity, mode)
+        self._live = open_memmap(live_path, np.uint8, (), capacity, mode)
+        self._scales = None
+        if self.dtype == "int8":
+            self._scales = open_memmap(scales_path, np.float32, (), capacity, mode)
+        self._capacity = len(self._vectors) if self._vectors is not None else 0
+
+    def _refresh(self):
+        """Pick up rows appended, or a compaction done, by another process."""
+        epoch = self._get_meta("epoch") or "0"
+        count = int(self._get_meta("count") or 0)
+        if epoch != self._epoch or count > self._capacity:
+            self._epoch = epoch
+            if self.dim is None:
+                dim = self._get_meta("dim")
+                self.dim = int(dim) if dim else None
+            if self.dim is not None:
+                self._map(count, self.mode)
+        self._count = count
+
+    def _id_rows(self, ids):
+        """Rows currently assigned to the given ids (read from SQLite, which other processes also write)."""
+        id_rows = {}
+        ids = list(ids)
+        for i in range(0, len(ids), SQL_BATCH_SIZE):
+            batch = ids[i:i + SQL_BATCH_SIZE]
+            id_rows.update(self._db.execute(
+                f"SELECT id, row FROM rows WHERE id IN ({','.join('?' * len(batch))})", batch
+            ))
+        return id_rows
+
+    def _encode(self, embeddings):
+        """Normalize float vectors; returns (stored rows, per-row scales or None)."""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1.0)
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales
+        return vectors.astype(np.float16), None
+
+    def _decode(self, rows):
+        """Stored vectors of the given rows as float32."""
+        vectors = self._vectors[rows].astype(np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    def _rows_written(self, rows):
+        """Called inside upsert()'s write transaction once rows are stored (hook for subclasses)."""
+
+    # Writes
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        """Insert or overwrite rows; existing ids are rewritten in place."""
+        if not len(ids):
+            return
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [None] * len(ids)
+
+        with self._lock:
+            # Row allocation is a read-modify-write of 'count' shared with other processes
+            with self._write_transaction():
+                self._refresh()
+                if self.dim is None:
+                    self.dim = len(embeddings[0])
+                    self._set_meta("dim", self.dim)
+                    self._set_meta("dtype", self.dtype)
+                vectors, scales = self._encode(embeddings)
+                id_rows = self._id_rows(ids)
+
+                rows = []
+                next_row = self._count
+                for cid in ids:
+                    row = id_rows.get(cid)
+                    if row is None:
+                        row = id_rows[cid] = next_row
+                        next_row += 1
+                    rows.append(row)
+
+                if next_row > self._capacity:
+                    self._map(max(MIN_CAPACITY, next_row, int(self._capacity * 1.5)), "r+")
+
+                rows = np.asarray(rows, dtype=np.int64)
+                self._vectors[rows] = vectors
+                if scales is not None:
+                    self._scales[rows] = scales
+                self._live[rows] = 1
+                self._vectors.flush()
+
+                self._db.executemany(
+                    "INSERT INTO rows (row, id, document, metadata, deleted) VALUES (?, ?, ?, ?, 0) "
+                    "ON CONFLICT(id) DO UPDATE SET document = excluded.document, "
+                    "metadata = excluded.metadata, deleted = 0",
+                    [(int(row), cid, doc, json.dumps(meta or {}))
+                     for row, cid, doc, meta in zip(rows, ids, documents, metadatas)]
+                )
+                self._set_meta("count", next_row)
+                self._count = next_row
+                self._rows_written(rows)
+
+    def add_documents(self, documents, ids):
+        """Embed and upsert LangChain Documents."""
+        self.upsert(
+            ids,
+            self.embedding_function.embed_documents([doc.page_content for doc in documents]),
+            [doc.page_content for doc in documents],
+            [doc.metadata for doc in documents]
+        )
+        return list(ids)
+
+    def delete(self, ids):
+        """Tombstone rows by id."""
+        with self._lock:
+            with self._write_transaction():
+                self._refresh()
+                rows = list(self._id_rows(ids).values())
+                if rows:
+                    self._live[np.asarray(rows, dtype=np.int64)] = 0
+                    self._live.flush()
+                    for i in range(0, len(rows), SQL_BATCH_SIZE):
+                        batch = rows[i:i + SQL_BATCH_SIZE]
+                        self._db.execute(
+                            f"UPDATE rows SET deleted = 1 WHERE row IN ({','.join('?' * len(batch))})",
+                            batch
+                        )
+            if not rows:
+                return
+
+            deleted = self._count - int(self._live[:self._count].sum())
+            if deleted >= COMPACT_MIN_ROWS and deleted >= COMPACT_RATIO * self._count:
+                self.compact()
+
+    def compact(self):
+        """Rewrite the matrix without tombstoned rows and renumber the metadata."""
+        with self._lock:
+            # Taken before reading the matrix so no other process appends rows the rewrite would drop
+            with self._write_transaction():
+                self._refresh()
+                live = np.flatnonzero(self._live[:self._count])
+                vectors_path, scales_path, live_path = self._paths()
+
+                rewrite_file(vectors_path, self._vectors[live])
+                if self.dtype == "int8":
+                    rewrite_file(scales_path, self._scales[live])
+                rewrite_file(live_path, np.ones(len(live), dtype=np.uint8))
+
+                self._db.execute("DELETE FROM rows WHERE deleted = 1")
+                # Renumber through negative values so the primary key never collides
+                self._db.execute("DROP TABLE IF EXISTS temp.remap")
+                self._db.execute(
+                    "CREATE TEMP TABLE remap AS "
+                    "SELECT row AS old, ROW_NUMBER() OVER (ORDER BY row) - 1 AS new FROM rows"
+                )
+                self._db.execute("UPDATE rows SET row = -1 - (SELECT new FROM remap WHERE old = rows.row)")
+                self._db.execute("UPDATE rows SET row = -1 - row")
+                self._db.execute("DROP TABLE temp.remap")
+                self._set_meta("count", len(live))
+                self._set_meta("epoch", int(self._epoch or 0) + 1)
+            self._refresh()
+
+    def delete_collection(self):
+        """Remove every row and the matrix files."""
+        with self._lock:
+            with self._write_transaction():
+                self._vectors = self._scales = self._live = None
+                self._capacity = 0
+                for path in self._paths():
+                    if path.exists():
+                        path.unlink()
+                self._db.execute("DELETE FROM rows")
+                self._db.execute("DELETE FROM meta WHERE name IN ('count', 'dim', 'dtype')")
+                self._set_meta("epoch", int(self._epoch or 0) + 1)
+            self.dim = None
+            self._refresh()
+
+    # Reads
+
+    def count(self):
+        """Number of live rows."""
+        return self._db.execute("SELECT COUNT(*) FROM rows WHERE deleted = 0").fetchone()[0]
+
+    def _where_rows(self, where):
+        """Row numbers matching an equality filter on metadata fields."""
+        if not all(isinstance(value, (str, int, float, bool)) for value in where.values()):
+            raise ValueError("Flat store filters support equality on metadata fields only")
+        clauses = " AND ".join("json_extract(metadata, ?) = ?" for _ in where)
+        params = [p for key, value in where.items() for p in (f"$.{key}", value)]
+        return np.fromiter(
+            (row for (row,) in self._db.execute(
+                f"SELECT row FROM rows WHERE deleted = 0 AND {clauses}", params)),
+            dtype=np.int64
+        )
+
+    @staticmethod
+    def _normalize_queries(queries):
+        queries = np.asarray(queries, dtype=np.float32)
+        return queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+    def _top_k(self, queries, k, where=None):
+        """
+        Top-k rows by cosine similarity for each query vector.
+
+        Returns:
+            (rows, scores) arrays of shape (n_queries, <=k), best first
+        """
+        with self._lock:
+            self._refresh()
+            n = self._count
+            if not n or self._vectors is None:
+                return np.empty((len(queries), 0), np.int64), np.empty((len(queries), 0), np.float32)
+            queries = self._normalize_queries(queries)
+
+            subset = self._where_rows(where) if where else None
+            total = n if subset is None else len(subset)
+            if not total:
+                return np.empty((len(queries), 0), np.int64), np.empty((len(queries), 0), np.float32)
+
+            best_rows, best_scores = [], []
+            for start in range(0, total, SEARCH_BLOCK_ROWS):
+                if subset is None:
+                    rows = np.arange(start, min(start + SEARCH_BLOCK_ROWS, n))
+                    block = self._vectors[start:start + len(rows)]
+                    scales = self._scales[start:start + len(rows)] if self._scales is not None else None
+                    live = self._live[start:start + len(rows)]
+                else:
+                    rows = subset[start:start + SEARCH_BLOCK_ROWS]
+                    block = self._vectors[rows]
+                    scales = self._scales[rows] if self._scales is not None else None
+                    live = self._live[rows]
+
+                scores = block.astype(np.float32) @ queries.T
+                if scales is not None:
+                    scores *= scales[:, None]
+                scores[live == 0] = -np.inf
+
+                if len(rows) > k:
+                    top = np.argpartition(-scores, k - 1, axis=0)[:k]
+                    scores = np.take_along_axis(scores, top, axis=0)
+                    rows = rows[top]
+                else:
+                    rows = np.repeat(rows[:, None], len(queries), axis=1)
+                best_rows.append(rows)
+                best_scores.append(scores)
+
+        rows = np.concatenate(best_rows).T
+        scores = np.concatenate(best_scores).T
+        order = np.argsort(-scores, axis=1)[:, :k]
+        rows = np.take_along_axis(rows, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        return rows, scores
+
+    def _fetch(self, rows):
+        """row -> (id, document, metadata) for the given rows."""
+        found = {}
+        rows = [int(row) for row in rows]
+        for i in range(0, len(rows), SQL_BATCH_SIZE):
+            batch = rows[i:i + SQL_BATCH_SIZE]
+            for row, cid, doc, meta in self._db.execute(
+                f"SELECT row, id, document, metadata FROM rows "
+                f"WHERE deleted = 0 AND row IN ({','.join('?' * len(batch))})", batch
+            ):
+                found[row] = (cid, doc, json.loads(meta) if meta else {})
+        return found
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas")):
+        """Chroma-style batched query: one result list per query embedding."""
+        rows, scores = self._top_k(query_embeddings, n_results, where)
+        found = self._fetch({int(row) for row, score in zip(rows.flat, scores.flat)
+                             if score > -np.inf})
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for query_rows, query_scores in zip(rows, scores):
+            hits = [(found[int(row)], float(score)) for row, score in zip(query_rows, query_scores)
+                    if score > -np.inf and int(row) in found]
+            result["ids"].append([hit[0] for hit, _ in hits])
+            result["documents"].append([hit[1] for hit, _ in hits])
+            result["metadatas"].append([hit[2] for hit, _ in hits])
+            result["distances"].append([1.0 - score for _, score in hits])
+        return result
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None):
+        result = self.query([embedding], n_results=k, where=filter)
+        return [
+            Document(page_content=text, metadata=meta, id=cid)
+            for cid, text, meta in zip(result["ids"][0], result["documents"][0], result["metadatas"][0])
+        ]
+
+    def similarity_search(self, query, k=4, filter=None):
+        return self.similarity_search_by_vector(
+            self.embedding_function.embed_query(query), k=k, filter=filter
+        )
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None):
+        """Chroma-style get of live rows by id and/or metadata equality filter."""
+        clauses, params = ["deleted = 0"], []
+        if where:
+            for key, value in where.items():
+                clauses.append("json_extract(metadata, ?) = ?")
+                params.extend([f"$.{key}", value])
+
+        if ids is not None:
+            ids = list(ids)
+            batches = [ids[i:i + SQL_BATCH_SIZE] for i in range(0, len(ids), SQL_BATCH_SIZE)]
+        else:
+            batches = [None]
+
+        records = []
+        for batch in batches:
+            sql = f"SELECT row, id, document, metadata FROM rows WHERE {' AND '.join(clauses)}"
+            batch_params = list(params)
+            if batch is not None:
+                sql += f" AND id IN ({','.join('?' * len(batch))})"
+                batch_params += batch
+            sql += " ORDER BY row"
+            if limit is not None:
+                sql += " LIMIT ? OFFSET ?"
+                batch_params += [limit, offset or 0]
+            records.extend(self._db.execute(sql, batch_params).fetchall())
+
+        embeddings = None
+        if "embeddings" in include:
+            with self._lock:
+                self._refresh()
+                rows = np.fromiter((row for row, _, _, _ in records), dtype=np.int64, count=len(records))
+                embeddings = (self._decode(rows) if len(rows)
+                              else np.empty((0, self.dim or 0), dtype=np.float32))
+
+        return {
+            "ids": [cid for _, cid, _, _ in records],
+            "documents": [doc for _, _, doc, _ in records] if "documents" in include else None,
+            "metadatas": ([json.loads(meta) if meta else {} for _, _, _, meta in records]
+                          if "metadatas" in include else None),
+            "embeddings": embeddings,
+        }
+
+    def stats(self):
+        """Row counts and on-disk size of the vector files."""
+        with self._lock:
+            self._refresh()
+            live = int(self._live[:self._count].sum()) if self._live is not None else 0
+        return {
+            "rows": self._count,
+            "live": live,
+            "dtype": self.dtype,
+            "dim": self.dim,
+            "bytes": sum(path.stat().st_size for path in self._paths() if path.exists()),
+        }
@@ -0,0 +1,261 @@
+"""
+Staged streaming indexing pipeline: extract/chunk -> embed -> write
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from tqdm import tqdm
+from src import metrics
+from src.pdf_chunker import chunk_pdf_shard, plan_shards
+from config.settings import INDEX_WORKERS, INDEX_QUEUE_SIZE, EMBED_BATCH_SIZE, PDF_SHARD_PAGES
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+def _put(q, item, abort):
+    """Blocking put that gives up once the pipeline is aborted."""
+    while not abort.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, abort):
+    """Blocking get that returns _DONE once the pipeline is aborted."""
+    while not abort.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _embed_stage(embeddings, inbox, outbox, batch_size, abort, errors):
+    """
+    Batch chunks across files and embed them.
+
+    Receives (pdf_file, chunks, file_done) per shard and emits
+    (chunks, vectors, completed_files) where completed_files are the files
+    whose last chunk is part of this batch.
+    """
+    pending = []
+    remaining = {}
+    finishing = set()
+
+    def flush(batch):
+        texts = [chunk.page_content for _, chunk in batch]
+        with metrics.span("embed", chunks=len(texts), chars=sum(map(len, texts))):
+            vectors = embeddings.embed_documents(texts)
+        completed = []
+        for pdf_file, _ in batch:
+            remaining[pdf_file] -= 1
+            if remaining[pdf_file] == 0:
+                del remaining[pdf_file]
+                if pdf_file in finishing:
+                    finishing.discard(pdf_file)
+                    completed.append(pdf_file)
+        return _put(outbox, ([chunk for _, chunk in batch], vectors, completed), abort)
+
+    try:
+        while True:
+            item = _get(inbox, abort)
+            if item is _DONE:
+                break
+            pdf_file, chunks, file_done = item
+            if chunks:
+                remaining[pdf_file] = remaining.get(pdf_file, 0) + len(chunks)
+                pending.extend((pdf_file, chunk) for chunk in chunks)
+            if file_done:
+                if pdf_file in remaining:
+                    finishing.add(pdf_file)
+                # Nothing left to embed, but stale chunks may still need deleting
+                elif not _put(outbox, ([], [], [pdf_file]), abort):
+                    return
+            while len(pending) >= batch_size:
+                if not flush(pending[:batch_size]):
+                    return
+                pending = pending[batch_size:]
+        if pending and not abort.is_set():
+            flush(pending)
+    except Exception as e:
+        errors.append(e)
+        abort.set()
+    finally:
+        _put(outbox, _DONE, abort)
+
+
+def _write_stage(vsm, inbox, pbar, abort, errors):
+    """Single writer: upsert embedded batches and commit finished files."""
+    try:
+        while True:
+            item = _get(inbox, abort)
+            if item is _DONE:
+                break
+            chunks, vectors, completed = item
+            if chunks:
+                with metrics.span("store_write", chunks=len(chunks)):
+                    vsm.add_embedded_documents(chunks, vectors)
+            for pdf_file in completed:
+                vsm.commit_file_update(pdf_file)
+            pbar.update(len(chunks))
+    except Exception as e:
+        errors.append(e)
+        abort.set()
+
+
+def run_indexing_pipeline(pdf_files, vsm, chunk_size, chunk_overlap, force=False,
+                          workers=INDEX_WORKERS, queue_size=INDEX_QUEUE_SIZE,
+                          embed_batch_size=EMBED_BATCH_SIZE, shard_pages=PDF_SHARD_PAGES):
+    """
+    Index PDFs with overlapping extraction, embedding and write stages.
+
+    A process pool extracts and chunks PDFs in page-range shards, a thread
+    batches chunks through the embedding model and a single thread writes
+    them to the vector store. Stages are connected by bounded queues and the
+    number of shards in flight in the pool is capped, so memory stays flat
+    regardless of corpus or document size, and a large PDF is spread over
+    all workers instead of holding up the end of the run.
+    Only chunks that are new or changed since a file was last indexed are
+    embedded and written, as each shard completes; a file's vanished chunks
+    are deleted once all of its shards are written.
+
+    Args:
+        pdf_files: Paths of PDFs to index
+        vsm: Loaded VectorStoreManager
+        chunk_size: Characters per chunk
+        chunk_overlap: Overlap between chunks
+        force: Rewrite every chunk, not just new or changed ones
+        workers: Number of extraction processes
+        queue_size: Max items buffered between stages
+        embed_batch_size: Chunks per embedding call
+        shard_pages: Pages per extraction task
+
+    Returns:
+        Dict with 'files', 'chunks' (written), 'stale' (deleted), 'empty_files'
+        and 'failed_files'
+    """
+    stats = {"files": 0, "chunks": 0, "stale": 0, "empty_files": [], "failed_files": []}
+    if not pdf_files:
+        return stats
+
+    workers = max(1, workers)
+    chunk_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    abort = threading.Event()
+    errors = []
+
+    # Per file: shards not yet returned, chunks extracted and written so far
+    shards_left = {}
+    extracted = {}
+    written = {}
+    failed = set()
+
+    def shards():
+        for pdf_file in pdf_files:
+            ranges = plan_shards(pdf_file, shard_pages)
+            shards_left[pdf_file] = len(ranges)
+            for start, end in ranges:
+                yield pdf_file, start, end
+
+    pending_shards = shards()
+    in_flight = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            tqdm(desc="Indexing chunks", unit="chunk") as pbar:
+
+        def submit_next():
+            for pdf_file, start, end in pending_shards:
+                future = executor.submit(chunk_pdf_shard, pdf_file, chunk_size, chunk_overlap, start, end)
+                in_flight[future] = pdf_file
+                return True
+            return False
+
+        # Prime the pool before starting the stage threads so worker
+        # processes are forked from a single-threaded parent.
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+
+        embedder = threading.Thread(
+            target=_embed_stage,
+            args=(vsm.embeddings, chunk_queue, write_queue, embed_batch_size, abort, errors),
+            name="index-embed", daemon=True
+        )
+        writer = threading.Thread(
+            target=_write_stage,
+            args=(vsm, write_queue, pbar, abort, errors),
+            name="index-write", daemon=True
+        )
+        embedder.start()
+        writer.start()
+
+        try:
+            while in_flight and not abort.is_set():
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pdf_file = in_flight.pop(future)
+                    filename = os.path.basename(pdf_file)
+                    shards_left[pdf_file] -= 1
+                    file_done = shards_left[pdf_file] == 0
+                    submit_next()
+
+                    if pdf_file in failed:
+                        continue
+                    try:
+                        chunks, shard_stats = future.result()
+                    except Exception as e:
+                        # Without every page the stale-chunk diff would be wrong
+                        failed.add(pdf_file)
+                        stats["failed_files"].append(pdf_file)
+                        vsm.discard_file_update(pdf_file)
+                        tqdm.write(f"  ✗ Error processing {filename}: {e}")
+                        continue
+                    # Timed in the worker process, recorded here
+                    metrics.observe("pdf_extract", shard_stats["extract_seconds"],
+                                    pages=shard_stats["pages"], chars=shard_stats["chars"])
+                    metrics.observe("chunking", shard_stats["chunk_seconds"],
+                                    chunks=len(chunks), chars=shard_stats["chars"])
+
+                    # A file indexed before must be committed even with no chunks
+                    # now, so its old chunks are deleted
+                    if (chunks or pdf_file in extracted or vsm.manifest.get_file(filename)
+                            or vsm.manifest.is_pending(filename)):
+                        changed, stale = vsm.plan_file_update(pdf_file, chunks, force=force,
+                                                              complete=file_done)
+                        extracted[pdf_file] = extracted.get(pdf_file, 0) + len(chunks)
+                        written[pdf_file] = written.get(pdf_file, 0) + len(changed)
+                        stats["chunks"] += len(changed)
+                        stats["stale"] += stale
+                        pbar.total = stats["chunks"]
+                        pbar.refresh()
+                        if file_done:
+                            stats["files"] += 1
+                            if not extracted[pdf_file]:
+                                stats["empty_files"].append(pdf_file)
+                            tqdm.write(f"  {filename}: {extracted.pop(pdf_file)} chunks, "
+                                       f"{written.pop(pdf_file)} new/changed, {stale} stale")
+                        _put(chunk_queue, (pdf_file, changed, file_done), abort)
+                    elif file_done:
+                        stats["empty_files"].append(pdf_file)
+                        tqdm.write(f"  Warning: No chunks generated from {filename}")
+        except BaseException:
+            abort.set()
+            raise
+        finally:
+            if abort.is_set():
+                executor.shutdown(wait=True, cancel_futures=True)
+            _put(chunk_queue, _DONE, abort)
+            embedder.join()
+            writer.join()
+            # Chunks written so far are in Chroma; keep BM25 consistent with them
+            vsm.save_lexical_index()
+
+    if errors:
+        raise errors[0]
+
+    return stats
@@ -0,0 +1,433 @@
+"""
+IVF-PQ approximate nearest-neighbour search over the flat store (VECTOR_BACKEND = "ivfpq")
+"""
+import threading
+import time
+import numpy as np
+from src.flat_store import FlatVectorStore, open_memmap, rewrite_file
+from config.settings import (
+    IVF_NLIST, IVF_NPROBE, PQ_M, IVF_SHORTLIST, IVF_TRAIN_SAMPLE, IVF_MIN_ROWS,
+    IVF_RETRAIN_GROWTH
+)
+
+# Centroids per PQ sub-quantizer (one byte per code)
+PQ_CENTROIDS = 256
+KMEANS_ITERATIONS = 10
+# Residuals used to train each PQ codebook (64 per centroid is plenty)
+PQ_TRAIN_POINTS = 16384
+# Rows assigned per distance matrix during k-means and encoding
+ASSIGN_BATCH_ROWS = 16384
+# Training points per coarse cluster below which nlist is reduced
+MIN_POINTS_PER_CLUSTER = 39
+
+
+def nearest_centroids(data, centroids):
+    """Index of the nearest centroid (squared L2) for every row of data."""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), ASSIGN_BATCH_ROWS):
+        block = data[start:start + ASSIGN_BATCH_ROWS]
+        labels[start:start + len(block)] = (centroid_norms - 2.0 * block @ centroids.T).argmin(axis=1)
+    return labels
+
+
+def kmeans(data, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """Lloyd's k-means; empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = nearest_centroids(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        order = np.argsort(labels, kind="stable")
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts[filled])[:-1]))
+        centroids[filled] = np.add.reduceat(data[order], starts, axis=0) / counts[filled, None]
+
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+class IVFPQIndex:
+    """
+    Trained quantizers: coarse centroids plus residual product-quantizer codebooks.
+
+    A vector is stored as its nearest coarse centroid (the inverted list it
+    belongs to) and m one-byte codes for the sub-vectors of its residual.
+    """
+
+    def __init__(self, centroids, codebooks, trained_rows=0):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)
+        self.trained_rows = trained_rows
+        self.m, _, self.dsub = self.codebooks.shape
+        self._centroid_norms = (self.centroids ** 2).sum(axis=1)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, sample, nlist=IVF_NLIST, m=PQ_M, trained_rows=0):
+        """
+        Train coarse and PQ quantizers on a sample of vectors.
+
+        nlist is capped so every cluster gets enough training points, and m
+        is lowered to the largest divisor of the dimension not above PQ_M.
+        """
+        sample = np.asarray(sample, dtype=np.float32)
+        dim = sample.shape[1]
+        nlist = max(1, min(nlist, len(sample) // MIN_POINTS_PER_CLUSTER))
+        m = max(d for d in range(1, min(m, dim) + 1) if dim % d == 0)
+        dsub = dim // m
+
+        centroids = kmeans(sample, nlist)
+        residuals = sample - centroids[nearest_centroids(sample, centroids)]
+        residuals = residuals[:PQ_TRAIN_POINTS]
+        ksub = min(PQ_CENTROIDS, len(residuals))
+        codebooks = np.zeros((m, PQ_CENTROIDS, dsub), dtype=np.float32)
+        for j in range(m):
+            codebooks[j, :ksub] = kmeans(residuals[:, j * dsub:(j + 1) * dsub], ksub, seed=j)
+        if ksub < PQ_CENTROIDS:
+            codebooks[:, ksub:] = np.inf
+        return cls(centroids, codebooks, trained_rows)
+
+    def encode(self, vectors):
+        """
+        Returns:
+            (inverted list per vector, uint8 codes of shape (n, m))
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        assign = nearest_centroids(vectors, self.centroids)
+        residuals = vectors - self.centroids[assign]
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codebook = np.nan_to_num(self.codebooks[j], posinf=1e9)
+            codes[:, j] = nearest_centroids(residuals[:, j * self.dsub:(j + 1) * self.dsub], codebook)
+        return assign.astype(np.int32), codes
+
+    def probe(self, query, nprobe):
+        """The nprobe inverted lists nearest to a query."""
+        distances = self._centroid_norms - 2.0 * self.centroids @ query
+        nprobe = min(nprobe, self.nlist)
+        return np.argpartition(distances, nprobe - 1)[:nprobe]
+
+    def distance_table(self, query, list_no):
+        """Squared distances from each residual sub-vector of the query to every PQ centroid."""
+        residual = (query - self.centroids[list_no]).reshape(self.m, 1, self.dsub)
+        return ((residual - self.codebooks) ** 2).sum(axis=2)
+
+    def save(self, path):
+        tmp_path = path.with_name(path.stem + ".tmp.npz")
+        np.savez(tmp_path, centroids=self.centroids, codebooks=self.codebooks,
+                 trained_rows=self.trained_rows)
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["codebooks"], int(data["trained_rows"]))
+
+
+class IVFPQVectorStore(FlatVectorStore):
+    """
+    FlatVectorStore searched through an IVF-PQ index.
+
+    Full vectors stay in the memory-mapped matrix and are only touched to
+    re-score the shortlist exactly; what is scanned per query is nprobe
+    inverted lists of m-byte PQ codes. Codes and list assignments are kept
+    per row in their own memory-mapped files, so new rows are encoded
+    incrementally without retraining. The quantizers are trained in a
+    background thread once the store reaches IVF_MIN_ROWS and retrained when
+    it has grown IVF_RETRAIN_GROWTH times past the training size; searches
+    use exact scoring (or the previous index) until the new one is swapped
+    in. Metadata filters fall back to exact search.
+    """
+
+    def __init__(self, store_dir, embedding_function=None, dtype="float16",
+                 nprobe=IVF_NPROBE, shortlist=IVF_SHORTLIST):
+        self.nprobe = nprobe
+        self.shortlist = shortlist
+        self.index = None
+        self._index_version = None
+        self._codes = None
+        self._assign = None
+        self._lists = None
+        self._pending = {}
+        self._listed = 0
+        self._lists_key = None
+        self._trainer = None
+        super().__init__(store_dir, embedding_function=embedding_function, dtype=dtype)
+
+    def _ivf_paths(self):
+        return self.dir / "ivfpq.npz", self.dir / "ivf_assign.i32", self.dir / "pq_codes.u8"
+
+    def _map_codes(self, capacity, mode):
+        _, assign_path, codes_path = self._ivf_paths()
+        self._assign = open_memmap(assign_path, np.int32, (), capacity, mode)
+        self._codes = open_memmap(codes_path, np.uint8, (self.index.m,), capacity, mode)
+
+    def _ensure_code_capacity(self):
+        """Grow the code files (by half again, like the matrix) to hold every row."""
+        if self._codes is None or len(self._codes) < self._count:
+            capacity = max(self._count, int(len(self._codes) * 1.5) if self._codes is not None else 0)
+            self._map_codes(capacity, "r+")
+
+    def _refresh(self):
+        super()._refresh()
+        version = self._get_meta("ivf_version")
+        if version != self._index_version:
+            self._index_version = version
+            self.index = IVFPQIndex.load(self._ivf_paths()[0]) if version else None
+            self._lists_key = None
+        if self.index is not None:
+            self._sync_codes()
+
+    def _sync_codes(self):
+        """Encode rows written without codes (e.g. by the plain flat backend) and extend the lists."""
+        key = (self._index_version, self._epoch)
+        if self._lists_key != key or self._codes is None or len(self._codes) < self._count:
+            self._map_codes(self._count if self.mode == "r+" else 0, self.mode)
+
+        encoded = int(self._get_meta("ivf_rows") or 0)
+        if self._get_meta("ivf_epoch") != self._epoch:
+            encoded = 0
+        if encoded < self._count and self.mode == "r+":
+            self._encode_rows(np.arange(encoded, self._count))
+            encoded = self._count
+        if self._assign is None:
+            return
+
+        if self._lists_key != key:
+            assign = np.asarray(self._assign[:encoded])
+            order = np.argsort(assign, kind="stable")
+            bounds = np.cumsum(np.bincount(assign, minlength=self.index.nlist))[:-1]
+            self._lists = np.split(order, bounds)
+            self._pending = {}
+            self._listed = encoded
+            self._lists_key = key
+        elif self._listed < encoded:
+            self._add_to_lists(np.arange(self._listed, encoded))
+            self._listed = encoded
+
+    def _encode_rows(self, rows):
+        """PQ-encode stored rows and record them as encoded."""
+        for start in range(0, len(rows), ASSIGN_BATCH_ROWS):
+            batch = rows[start:start + ASSIGN_BATCH_ROWS]
+            assign, codes = self.index.encode(self._decode(batch))
+            self._assign[batch] = assign
+            self._codes[batch] = codes
+        self._assign.flush()
+        self._codes.flush()
+        self._set_meta("ivf_rows", self._count)
+        self._set_meta("ivf_epoch", self._epoch)
+
+    def _add_to_lists(self, rows):
+        assign = np.asarray(self._assign[rows])
+        for list_no in np.unique(assign):
+            self._pending.setdefault(int(list_no), []).append(rows[assign == list_no])
+
+    def _list(self, list_no):
+        pending = self._pending.pop(int(list_no), None)
+        if pending:
+            self._lists[list_no] = np.concatenate([self._lists[list_no]] + pending)
+        return self._lists[list_no]
+
+    def _rows_written(self, rows):
+        if self.index is None or self._count >= IVF_RETRAIN_GROWTH * self.index.trained_rows:
+            if self._count >= IVF_MIN_ROWS:
+                self._train_in_background()
+        if self.index is None:
+            return
+
+        self._ensure_code_capacity()
+        self._encode_rows(rows)
+        # Rewritten rows get a second list entry; stale ones are filtered at search time
+        self._add_to_lists(rows)
+        self._listed = self._count
+
+    def _train_in_background(self):
+        """
+        Start train() in a thread unless one is already running.
+
+        It is called from inside upsert()'s write transaction and first waits
+        for the write to finish. Not a daemon, so a short-lived indexing
+        process finishes training before it exits.
+        """
+        if self._trainer is None or not self._trainer.is_alive():
+            self._trainer = threading.Thread(target=self.train, name="ivfpq-train")
+            self._trainer.start()
+
+    def train(self, sample_size=IVF_TRAIN_SAMPLE):
+        """
+        (Re)train the quantizers on a sample of live rows and encode every row.
+
+        The k-means runs on a copy of the sample without holding the store's
+        lock, so searches and writes continue meanwhile; only encoding the
+        rows and swapping the index in is done inside a write transaction.
+        If another process installed an index in the meantime, this one is
+        dropped.
+        """
+        with self._lock:
+            self._refresh()
+            live = np.flatnonzero(self._live[:self._count])
+            if not len(live):
+                return
+            version = self._index_version
+            trained_rows = self._count
+            rng = np.random.default_rng(0)
+            sample = self._decode(np.sort(rng.choice(live, min(sample_size, len(live)), replace=False)))
+
+        print(f"Training IVF-PQ index on {len(sample)} of {len(live)} vectors...")
+        start = time.perf_counter()
+        index = IVFPQIndex.train(sample, trained_rows=trained_rows)
+
+        with self._lock:
+            with self._write_transaction():
+                self._refresh()
+                if not self._count:
+                    return
+                if self._index_version != version:
+                    print("IVF-PQ index was retrained by another process; discarding this one")
+                    return
+                index_path, assign_path, codes_path = self._ivf_paths()
+                index.save(index_path)
+
+                self.index = index
+                for path in (assign_path, codes_path):
+                    if path.exists():
+                        path.unlink()
+                self._map_codes(self._count, "r+")
+                self._encode_rows(np.arange(self._count))
+                self._index_version = str(int(self._index_version or 0) + 1)
+                self._set_meta("ivf_version", self._index_version)
+                self._lists_key = None
+                self._sync_codes()
+        print(f"✓ IVF-PQ index trained: {index.nlist} lists, {index.m}-byte codes "
+              f"({time.perf_counter() - start:.1f}s)")
+
+    def compact(self):
+        with self._lock:
+            self._refresh()
+            if self.index is None or self._assign is None:
+                return super().compact()
+            live = np.flatnonzero(self._live[:self._count])
+            assign, codes = np.array(self._assign[live]), np.array(self._codes[live])
+            # Keep the codes of surviving rows rather than re-encoding after renumbering
+            index, self.index = self.index, None
+            self._assign = self._codes = None
+            super().compact()
+            self.index = index
+
+            _, assign_path, codes_path = self._ivf_paths()
+            rewrite_file(assign_path, assign)
+            rewrite_file(codes_path, codes)
+            self._set_meta("ivf_rows", self._count)
+            self._set_meta("ivf_epoch", self._epoch)
+            self._lists_key = None
+            self._sync_codes()
+
+    def delete_collection(self):
+        with self._lock:
+            self._assign = self._codes = self.index = None
+            for path in self._ivf_paths():
+                if path.exists():
+                    path.unlink()
+            self._db.execute("DELETE FROM meta WHERE name IN ('ivf_version', 'ivf_rows', 'ivf_epoch')")
+            self._index_version = None
+            super().delete_collection()
+
+    def _top_k(self, queries, k, where=None, nprobe=None, shortlist=None):
+        with self._lock:
+            self._refresh()
+            if where or self.index is None or self._assign is None:
+                return super()._top_k(queries, k, where)
+
+            nprobe = nprobe or self.nprobe
+            shortlist = max(k, shortlist or self.shortlist)
+            queries = self._normalize_queries(queries)
+            rows_out = np.zeros((len(queries), k), dtype=np.int64)
+            scores_out = np.full((len(queries), k), -np.inf, dtype=np.float32)
+            m_range = np.arange(self.index.m)
+
+            for qi, query in enumerate(queries):
+                candidates, distances = [], []
+                for list_no in self.index.probe(query, nprobe):
+                    rows = self._list(list_no)
+                    rows = rows[(self._assign[rows] == list_no) & (self._live[rows] == 1)]
+                    if not len(rows):
+                        continue
+                    table = self.index.distance_table(query, list_no)
+                    candidates.append(rows)
+                    distances.append(table[m_range, self._codes[rows]].sum(axis=1))
+                if not candidates:
+                    continue
+
+                rows = np.concatenate(candidates)
+                distances = np.concatenate(distances)
+                if len(rows) > shortlist:
+                    keep = np.argpartition(distances, shortlist - 1)[:shortlist]
+                    rows = rows[keep]
+                rows = np.unique(rows)
+
+                # Exact re-scoring of the shortlist from the full vectors
+                scores = self._decode(rows) @ query
+                top = np.argsort(-scores)[:k]
+                rows_out[qi, :len(top)] = rows[top]
+                scores_out[qi, :len(top)] = scores[top]
+
+            return rows_out, scores_out
+
+    def stats(self):
+        stats = super().stats()
+        if self.index is not None:
+            stats.update({
+                "nlist": self.index.nlist,
+                "pq_bytes": self.index.m,
+                "nprobe": self.nprobe,
+                "code_bytes": self._count * (self.index.m + 4),
+                "trained_rows": self.index.trained_rows,
+            })
+        return stats
+
+
+def recall_report(store, query_vectors, k=10, nprobes=(1, 2, 4, 8, 16, 32, 64)):
+    """
+    Recall@k and latency of IVF-PQ search against exact search.
+
+    Args:
+        store: Trained IVFPQVectorStore
+        query_vectors: Query embeddings (e.g. from real questions or chunk text)
+        k: Results compared per query
+        nprobes: nprobe values to measure
+
+    Returns:
+        List of dicts with 'nprobe', 'recall', 'mean_ms' and 'p95_ms', preceded
+        by one row for exact search (nprobe None)
+    """
+    exact_rows, latencies = [], []
+    for query in query_vectors:
+        start = time.perf_counter()
+        rows, _ = FlatVectorStore._top_k(store, [query], k)
+        latencies.append(time.perf_counter() - start)
+        exact_rows.append(set(rows[0].tolist()))
+
+    report = [{"nprobe": None, "recall": 1.0,
+               "mean_ms": 1000 * np.mean(latencies), "p95_ms": 1000 * np.percentile(latencies, 95)}]
+    for nprobe in nprobes:
+        hits, latencies = 0, []
+        for query, exact in zip(query_vectors, exact_rows):
+            start = time.perf_counter()
+            rows, scores = store._top_k([query], k, nprobe=nprobe)
+            latencies.append(time.perf_counter() - start)
+            hits += len(exact & set(rows[0][scores[0] > -np.inf].tolist()))
+        report.append({
+            "nprobe": nprobe,
+            "recall": hits / max(1, sum(len(exact) for exact in exact_rows)),
+            "mean_ms": 1000 * np.mean(latencies),
+            "p95_ms": 1000 * np.percentile(latencies, 95),
+        })
+    return report
@@ -0,0 +1,218 @@
+"""
+In-process BM25 lexical index over chunk text
+"""
+import math
+import os
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter
+import numpy as np
+from config.settings import BM25_K1, BM25_B, RRF_K
+
+# Keeps part numbers and error codes (XJ-2000, E.104, v2_3) as single tokens
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+SPLIT_RE = re.compile(r"[-_./]")
+
+# Compact once this fraction of documents is deleted
+COMPACT_RATIO = 0.25
+
+
+def tokenize(text):
+    """Lowercased terms; compound codes are indexed whole and by their parts."""
+    terms = []
+    for token in TOKEN_RE.findall(text.lower()):
+        terms.append(token)
+        if SPLIT_RE.search(token):
+            terms.extend(part for part in SPLIT_RE.split(token) if part)
+    return terms
+
+
+def has_exact_terms(text):
+    """True if the text contains a code-like term (letters mixed with digits)."""
+    return any(
+        any(c.isdigit() for c in token) and any(c.isalpha() for c in token)
+        for token in TOKEN_RE.findall(text.lower())
+    )
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Merge ranked id lists: each id scores sum(1 / (k + rank)) over the lists.
+
+    Ties keep the order in which ids first appear, so earlier lists win them.
+
+    Args:
+        rankings: Lists of ids, best first
+        k: Damping constant; larger values flatten the rank weights
+
+    Returns:
+        Ids ordered by fused score
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+class LexicalIndex:
+    """
+    Incrementally updated BM25 index.
+
+    Postings are two parallel typed arrays per term (document numbers as
+    uint32, term frequencies as uint16) that are scored with vectorized
+    NumPy. Deleted documents are tombstoned and squeezed out by compaction.
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.generation = None
+        self._lock = threading.RLock()
+        self.clear()
+        self.dirty = False
+
+    def clear(self):
+        with self._lock:
+            self.doc_ids = []
+            self.doc_numbers = {}
+            self.doc_lengths = array("I")
+            self.live = bytearray()
+            self.postings = {}
+            self.total_length = 0
+            self.dirty = True
+
+    def __len__(self):
+        return len(self.doc_numbers)
+
+    def add(self, chunk_id, text):
+        """Index a chunk, replacing any previous version with the same id."""
+        terms = tokenize(text)
+        with self._lock:
+            if chunk_id in self.doc_numbers:
+                self._remove(chunk_id)
+
+            doc = len(self.doc_ids)
+            self.doc_ids.append(chunk_id)
+            self.doc_numbers[chunk_id] = doc
+            self.doc_lengths.append(len(terms))
+            self.live.append(1)
+            self.total_length += len(terms)
+
+            for term, tf in Counter(terms).items():
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = (array("I"), array("H"))
+                postings[0].append(doc)
+                postings[1].append(min(tf, 0xFFFF))
+            self.dirty = True
+
+    def remove(self, chunk_id):
+        """Tombstone a chunk."""
+        with self._lock:
+            if chunk_id in self.doc_numbers:
+                self._remove(chunk_id)
+                if len(self.doc_ids) - len(self.doc_numbers) > COMPACT_RATIO * len(self.doc_ids):
+                    self.compact()
+
+    def _remove(self, chunk_id):
+        doc = self.doc_numbers.pop(chunk_id)
+        self.live[doc] = 0
+        self.total_length -= self.doc_lengths[doc]
+        self.dirty = True
+
+    def compact(self):
+        """Renumber live documents and drop tombstoned postings."""
+        with self._lock:
+            live = np.frombuffer(self.live, dtype=np.uint8).astype(bool)
+            remap = np.cumsum(live, dtype=np.int64) - 1
+
+            postings = {}
+            for term, (docs, tfs) in self.postings.items():
+                docs_np = np.frombuffer(docs, dtype=np.uint32)
+                keep = live[docs_np]
+                if keep.any():
+                    postings[term] = (
+                        array("I", remap[docs_np[keep]].astype(np.uint32).tobytes()),
+                        array("H", np.frombuffer(tfs, dtype=np.uint16)[keep].tobytes()),
+                    )
+
+            self.doc_ids = [cid for cid, alive in zip(self.doc_ids, live) if alive]
+            self.doc_numbers = {cid: i for i, cid in enumerate(self.doc_ids)}
+            self.doc_lengths = array("I", np.frombuffer(self.doc_lengths, dtype=np.uint32)[live].tobytes())
+            self.live = bytearray(b"\x01" * len(self.doc_ids))
+            self.postings = postings
+            self.dirty = True
+
+    def search(self, query, k=10):
+        """
+        Top-k chunks by BM25 score.
+
+        Returns:
+            List of (chunk_id, score), best first
+        """
+        with self._lock:
+            n_live = len(self.doc_numbers)
+            if not n_live:
+                return []
+
+            lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+            avg_length = self.total_length / n_live or 1.0
+            scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.uint32)
+                tfs = np.frombuffer(postings[1], dtype=np.uint16).astype(np.float32)
+                df = len(docs)
+                idf = math.log(1.0 + (n_live - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (1.0 - self.b + self.b * lengths[docs] / avg_length)
+                scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+            scores *= np.frombuffer(self.live, dtype=np.uint8)
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates])]
+            return [(self.doc_ids[doc], float(scores[doc])) for doc in candidates]
+
+    def save(self, path, generation=None):
+        """Atomically persist the index, tagged with a collection generation."""
+        with self._lock:
+            self.generation = generation
+            state = {
+                "k1": self.k1, "b": self.b, "generation": generation,
+                "doc_ids": self.doc_ids, "doc_lengths": self.doc_lengths,
+                "live": self.live, "postings": self.postings,
+                "total_length": self.total_length,
+            }
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved index, or return an empty one."""
+        index = cls()
+        if path.exists():
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+            index.k1, index.b = state["k1"], state["b"]
+            index.generation = state["generation"]
+            index.doc_ids = state["doc_ids"]
+            index.doc_lengths = state["doc_lengths"]
+            index.live = state["live"]
+            index.postings = state["postings"]
+            index.total_length = state["total_length"]
+            index.doc_numbers = {
+                cid: i for i, cid in enumerate(index.doc_ids) if index.live[i]
+            }
+            index.dirty = False
+        return index
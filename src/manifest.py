@@ -0,0 +1,310 @@
+"""
+SQLite manifest of indexed files and their per-page chunk ids
+"""
+import hashlib
+import json
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from config.settings import HASH_WORKERS, VECTOR_BACKEND, VECTOR_STORE_DIR, FLAT_STORE_DIR
+
+# Files at least this large are hashed through mmap instead of read()
+MMAP_MIN_SIZE = 1 << 20
+
+FileRecord = namedtuple("FileRecord", ["filename", "path", "size", "mtime_ns", "inode", "hash"])
+
+
+def backend_store_dir(backend=VECTOR_BACKEND):
+    """Directory holding a vector backend's data, manifest and lexical index."""
+    return VECTOR_STORE_DIR if backend == "chroma" else FLAT_STORE_DIR
+
+
+def manifest_path(backend=VECTOR_BACKEND):
+    return backend_store_dir(backend) / "manifest.sqlite"
+
+
+def hash_file(path, algorithm="blake2b"):
+    """
+    Content hash of a file as "<algorithm>:<hexdigest>".
+
+    Large files are hashed through mmap in one update call, which lets
+    hashlib release the GIL so several files can be hashed in parallel.
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size >= MMAP_MIN_SIZE:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                digest.update(mm)
+        else:
+            digest.update(f.read())
+    return f"{algorithm}:{digest.hexdigest()}"
+
+
+def normalize_hash(stored_hash):
+    """Hashes from indexed_files.json are bare MD5 hex digests."""
+    return stored_hash if ":" in stored_hash else f"md5:{stored_hash}"
+
+
+def rehash_files(items, workers=HASH_WORKERS):
+    """
+    Hash files in parallel, each with the algorithm of its stored hash.
+
+    Args:
+        items: List of (path, stored_hash) pairs
+
+    Returns:
+        List of current hashes in the same order
+    """
+    def rehash(item):
+        path, stored_hash = item
+        return hash_file(path, normalize_hash(stored_hash).split(":", 1)[0])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(rehash, items))
+
+
+class ManifestStore:
+    """
+    Transactional record of what is in the vector store.
+
+    Tracks each indexed file's stat fingerprint (size, mtime, inode) and
+    content hash, the chunk ids it produced per page, and files whose update
+    was started but never committed. Uses WAL mode so readers never block
+    the indexing writer.
+    """
+
+    def __init__(self, db_path, read_only=False):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        if read_only:
+            # An existing manifest someone else writes: no DDL or pragmas
+            self._db = sqlite3.connect(f"{db_path.resolve().as_uri()}?mode=ro", uri=True,
+                                       check_same_thread=False, isolation_level=None)
+            return
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                filename TEXT PRIMARY KEY,
+                path TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                hash TEXT NOT NULL,
+                indexed_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                page INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_filename ON chunks(filename);
+            CREATE TABLE IF NOT EXISTS pending (filename TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+        """)
+
+    def close(self):
+        self._db.close()
+
+    @contextmanager
+    def transaction(self):
+        """Run a block of writes atomically."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def import_legacy(self, index_log_path, chunk_manifest_path):
+        """
+        One-time import of indexed_files.json and chunk_manifest.json.
+
+        Files without a chunk manifest were indexed with random chunk ids,
+        so they are marked pending and swept on their next update.
+        """
+        if self.get_meta("legacy_imported") or not index_log_path.exists():
+            return
+
+        with open(index_log_path) as f:
+            index_log = json.load(f)
+        chunk_manifest = {}
+        if chunk_manifest_path.exists():
+            with open(chunk_manifest_path) as f:
+                chunk_manifest = json.load(f)
+
+        with self.transaction() as db:
+            for filename, file_hash in index_log.items():
+                db.execute(
+                    "INSERT OR IGNORE INTO files (filename, hash) VALUES (?, ?)",
+                    (filename, file_hash)
+                )
+                pages = chunk_manifest.get(filename)
+                if pages:
+                    db.executemany(
+                        "INSERT OR REPLACE INTO chunks (chunk_id, filename, page) VALUES (?, ?, ?)",
+                        [(cid, filename, int(page)) for page, ids in pages.items() for cid in ids]
+                    )
+                else:
+                    db.execute("INSERT OR IGNORE INTO pending (filename) VALUES (?)", (filename,))
+            db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('legacy_imported', '1')")
+
+    def get_meta(self, name):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, name, value):
+        with self.transaction() as db:
+            db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def generation(self):
+        """Counter bumped on every change to the collection."""
+        with self._lock:
+            return int(self.get_meta("generation") or 0)
+
+    def bump_generation(self):
+        """Invalidate anything cached against the current collection contents."""
+        with self.transaction() as db:
+            db.execute(
+                "INSERT INTO meta (name, value) VALUES ('generation', '1') "
+                "ON CONFLICT(name) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+            )
+
+    def files(self):
+        """All file records keyed by filename."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT filename, path, size, mtime_ns, inode, hash FROM files"
+            ).fetchall()
+        return {row[0]: FileRecord(*row) for row in rows}
+
+    def get_file(self, filename):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT filename, path, size, mtime_ns, inode, hash FROM files WHERE filename = ?",
+                (filename,)
+            ).fetchone()
+        return FileRecord(*row) if row else None
+
+    def filenames(self):
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT filename FROM files")]
+
+    def chunk_ids(self, filename):
+        """Chunk ids of a file grouped by page: {page: [ids]}."""
+        pages = {}
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT page, chunk_id FROM chunks WHERE filename = ?", (filename,)
+            ).fetchall()
+        for page, cid in rows:
+            pages.setdefault(page, []).append(cid)
+        return pages
+
+    def chunk_count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def pending_files(self):
+        """Files whose last update was started but not committed."""
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT filename FROM pending")]
+
+    def is_pending(self, filename):
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM pending WHERE filename = ?", (filename,)
+            ).fetchone() is not None
+
+    def mark_pending(self, filename):
+        """Record that an update of this file has started."""
+        with self.transaction() as db:
+            db.execute("INSERT OR IGNORE INTO pending (filename) VALUES (?)", (filename,))
+
+    def commit_file(self, filename, path, stat, file_hash, pages):
+        """Atomically replace a file's record and chunk ids and clear its pending flag."""
+        with self.transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO files (filename, path, size, mtime_ns, inode, hash, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (filename, str(path), stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                 file_hash, time.time())
+            )
+            db.execute("DELETE FROM chunks WHERE filename = ?", (filename,))
+            db.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, filename, page) VALUES (?, ?, ?)",
+                [(cid, filename, int(page)) for page, ids in pages.items() for cid in ids]
+            )
+            db.execute("DELETE FROM pending WHERE filename = ?", (filename,))
+
+    def update_stats(self, items):
+        """
+        Refresh stat fingerprints of files whose content hash still matched.
+
+        Args:
+            items: List of (filename, os.stat_result) pairs
+        """
+        with self.transaction() as db:
+            db.executemany(
+                "UPDATE files SET size = ?, mtime_ns = ?, inode = ? WHERE filename = ?",
+                [(stat.st_size, stat.st_mtime_ns, stat.st_ino, filename) for filename, stat in items]
+            )
+
+    def forget_files(self, filenames):
+        """Drop files and their chunk ids so the next index run treats them as new."""
+        with self.transaction() as db:
+            for table in ("files", "chunks", "pending"):
+                db.executemany(f"DELETE FROM {table} WHERE filename = ?", [(f,) for f in filenames])
+
+    def dump(self):
+        """
+        Every file record, chunk id and pending file, for a snapshot.
+
+        Returns:
+            Dict with 'files' (lists of column values), 'chunks'
+            ({filename: {page: [ids]}}) and 'pending' (filenames)
+        """
+        with self._lock:
+            files = self._db.execute(
+                "SELECT filename, path, size, mtime_ns, inode, hash, indexed_at FROM files"
+            ).fetchall()
+            rows = self._db.execute("SELECT chunk_id, filename, page FROM chunks").fetchall()
+            pending = [row[0] for row in self._db.execute("SELECT filename FROM pending")]
+        chunks = {}
+        for cid, filename, page in rows:
+            chunks.setdefault(filename, {}).setdefault(str(page), []).append(cid)
+        return {"files": [list(row) for row in files], "chunks": chunks, "pending": pending}
+
+    def load(self, data):
+        """Replace every file record, chunk id and pending file with a dump()."""
+        with self.transaction() as db:
+            for table in ("files", "chunks", "pending"):
+                db.execute(f"DELETE FROM {table}")
+            db.executemany(
+                "INSERT INTO files (filename, path, size, mtime_ns, inode, hash, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [tuple(row) for row in data["files"]]
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, filename, page) VALUES (?, ?, ?)",
+                [(cid, filename, int(page))
+                 for filename, pages in data["chunks"].items()
+                 for page, ids in pages.items() for cid in ids]
+            )
+            db.executemany("INSERT INTO pending (filename) VALUES (?)",
+                           [(filename,) for filename in data["pending"]])
+
+    def clear(self):
+        """Forget every file and chunk."""
+        with self.transaction() as db:
+            for table in ("files", "chunks", "pending"):
+                db.execute(f"DELETE FROM {table}")
@@ -0,0 +1,216 @@
+"""
+Per-stage timing spans, histograms and their Prometheus/JSON exposition
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from config.settings import METRICS_ENABLED, METRICS_LOG_PATH, LOG_LEVEL
+
+# Histogram upper bounds in seconds: 0.5 ms doubling up to ~65 s
+BUCKETS = tuple(0.0005 * 2 ** i for i in range(18))
+
+# Span records are emitted through this logger when METRICS_LOG_PATH is set
+span_log = logging.getLogger("rag.spans")
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; observe() is a bisect and three adds."""
+
+    __slots__ = ("bounds", "counts", "sum", "count", "max")
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        # One count per bound plus the +Inf bucket
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating within its bucket, capped at the largest value seen."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1] * 2
+                return min(self.max, lower + (upper - lower) * (rank - seen) / n)
+            seen += n
+        return self.max
+
+
+class Span:
+    """A timed stage; add() attaches counters such as tokens, chunks or bytes."""
+
+    __slots__ = ("registry", "stage", "counters", "start")
+
+    def __init__(self, registry, stage, counters):
+        self.registry = registry
+        self.stage = stage
+        self.counters = counters
+        self.start = time.perf_counter()
+
+    def add(self, **counters):
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(
+            self.stage, time.perf_counter() - self.start,
+            error=exc_type is not None, **self.counters
+        )
+        return False
+
+
+class _NullSpan:
+    """Span stand-in used when metrics are disabled."""
+
+    __slots__ = ()
+
+    def add(self, **counters):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class MetricsRegistry:
+    """
+    Process-wide stage timings and counters.
+
+    Each stage gets a latency histogram, an error count and running totals
+    of its counters. Worker processes cannot share a registry, so stages
+    timed there (PDF extraction, chunking) are measured in the worker and
+    recorded in the parent with observe().
+    """
+
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._errors = {}
+        self._log_json = False
+
+    def span(self, stage, **counters):
+        """Time a block: `with metrics.span("search", chunks=k) as s: ...`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, stage, counters)
+
+    def observe(self, stage, seconds, error=False, **counters):
+        """Record an already-measured stage duration and its counters."""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(seconds)
+            if error:
+                self._errors[stage] = self._errors.get(stage, 0) + 1
+            for name, value in counters.items():
+                key = (stage, name)
+                self._counters[key] = self._counters.get(key, 0) + value
+        if self._log_json:
+            record = {"ts": round(time.time(), 6), "stage": stage, "seconds": round(seconds, 6)}
+            if error:
+                record["error"] = True
+            record.update(counters)
+            span_log.info(json.dumps(record))
+
+    def log_json(self, path):
+        """Append every span to path as one JSON object per line."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        span_log.addHandler(handler)
+        span_log.setLevel(LOG_LEVEL)
+        span_log.propagate = False
+        self._log_json = span_log.isEnabledFor(logging.INFO)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._errors.clear()
+
+    def summary(self):
+        """
+        Per-stage statistics.
+
+        Returns:
+            Dict of stage -> {'count', 'total', 'p50', 'p95', 'p99', 'errors', 'counters'}
+            with times in seconds
+        """
+        with self._lock:
+            out = {}
+            for stage, histogram in self._histograms.items():
+                out[stage] = {
+                    "count": histogram.count,
+                    "total": histogram.sum,
+                    "p50": histogram.quantile(0.50),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                    "errors": self._errors.get(stage, 0),
+                    "counters": {name: value for (s, name), value in self._counters.items() if s == stage},
+                }
+            return out
+
+    def render_prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = [
+            "# HELP rag_stage_seconds Time spent in each pipeline stage.",
+            "# TYPE rag_stage_seconds histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, n in zip(self.bounds_labels(), histogram.counts):
+                    cumulative += n
+                    lines.append(f'rag_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'rag_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'rag_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            lines.append("# HELP rag_stage_errors_total Stage executions that raised.")
+            lines.append("# TYPE rag_stage_errors_total counter")
+            for stage, n in sorted(self._errors.items()):
+                lines.append(f'rag_stage_errors_total{{stage="{stage}"}} {n}')
+
+            lines.append("# HELP rag_stage_work_total Work done per stage (tokens, chunks, bytes, ...).")
+            lines.append("# TYPE rag_stage_work_total counter")
+            for (stage, name), value in sorted(self._counters.items()):
+                lines.append(f'rag_stage_work_total{{stage="{stage}",unit="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def bounds_labels():
+        return [f"{bound:g}" for bound in BUCKETS] + ["+Inf"]
+
+
+REGISTRY = MetricsRegistry()
+if METRICS_LOG_PATH:
+    REGISTRY.log_json(METRICS_LOG_PATH)
+
+span = REGISTRY.span
+observe = REGISTRY.observe
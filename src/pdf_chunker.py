@@ -3,40 +3,149 @@ PDF processing and chunking using PyMuPDF (fitz)
 Original working implementation
 """
 import fitz
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 import os
 import glob
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 import multiprocessing
+from src.chunker import TextChunker
+from config.settings import PDF_SHARD_PAGES
 
 
-def extract_and_chunk_pdf(pdf_path, chunk_size, chunk_overlap):
+def page_count(pdf_path):
+    """Number of pages in a PDF."""
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+
+def plan_shards(pdf_path, shard_pages=PDF_SHARD_PAGES):
+    """
+    Split a PDF into page ranges of at most shard_pages pages.
+    
+    Returns:
+        List of (start_page, end_page) 0-based half-open ranges; a single
+        open range if the page count cannot be read
+    """
+    try:
+        pages = page_count(pdf_path)
+    except Exception:
+        return [(0, None)]
+    return [(start, min(start + shard_pages, pages)) for start in range(0, pages, shard_pages)] or [(0, 0)]
+
+
+def iter_pages(pdf_path, start_page=0, end_page=None):
+    """Yield (1-based page number, text) for a page range, one page at a time."""
+    with fitz.open(pdf_path) as doc:
+        end_page = doc.page_count if end_page is None else min(end_page, doc.page_count)
+        for index in range(start_page, end_page):
+            yield index + 1, doc.load_page(index).get_text()
+
+
+def iter_chunks(pdf_path, chunk_size, chunk_overlap, start_page=0, end_page=None, stats=None):
+    """
+    Yield Chunk records page by page for a page range of a PDF.
+    
+    Each chunk records its 1-based page number and its start/end offsets
+    within that page, so an edit to one page only changes that page's chunks.
+    Only one page of text is held at a time.
+    
+    Args:
+        stats: Optional dict accumulating 'pages', 'chars', 'extract_seconds'
+            and 'chunk_seconds'
+    """
+    chunker = TextChunker(chunk_size, chunk_overlap)
+    source_file = os.path.basename(pdf_path)
+    pages = iter_pages(pdf_path, start_page, end_page)
+    
+    while True:
+        start = time.perf_counter()
+        page = next(pages, None)
+        extracted = time.perf_counter()
+        if page is None:
+            break
+        page_number, text = page
+        chunks = chunker.chunk_page(text, source_file, page_number) if text.strip() else []
+        if stats is not None:
+            chunks = list(chunks)
+            stats["pages"] += 1
+            stats["chars"] += len(text)
+            stats["extract_seconds"] += extracted - start
+            stats["chunk_seconds"] += time.perf_counter() - extracted
+        yield from chunks
+
+
+def chunk_pdf_pages(pdf_path, chunk_size, chunk_overlap, start_page=0, end_page=None):
+    """
+    Chunks of one page-range shard. Runs in a worker process; errors propagate.
+    """
+    return list(iter_chunks(pdf_path, chunk_size, chunk_overlap, start_page, end_page))
+
+
+def chunk_pdf_shard(pdf_path, chunk_size, chunk_overlap, start_page=0, end_page=None):
     """
-    Extracts text from a single PDF and chunks it. 
+    Like chunk_pdf_pages(), also timing extraction and chunking for the
+    parent process's metrics.
+    
+    Returns:
+        Tuple of (chunks, stats dict)
+    """
+    stats = {"pages": 0, "chars": 0, "extract_seconds": 0.0, "chunk_seconds": 0.0}
+    chunks = list(iter_chunks(pdf_path, chunk_size, chunk_overlap, start_page, end_page, stats))
+    return chunks, stats
+
+
+def extract_and_chunk_pdf(pdf_path, chunk_size, chunk_overlap, start_page=0, end_page=None):
+    """
+    Extracts text from a PDF (or a page range of it) and chunks it page by page.
     This function runs in a separate process.
+    
+    Returns:
+        List of chunks, empty on error
     """
     try:
-        text = ""
-        with fitz.open(pdf_path) as doc:
-            for page in doc:
-                text += page.get_text() + "\n"
-        
-        if text:
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-                length_function=len,
-            )
-            chunks = text_splitter.create_documents([text])
-            # Add metadata to each chunk
-            for chunk in chunks:
-                chunk.metadata["source_file"] = os.path.basename(pdf_path)
-            return chunks
+        return chunk_pdf_pages(pdf_path, chunk_size, chunk_overlap, start_page, end_page)
     except Exception as e:
         print(f"Error processing {pdf_path}: {e}")
         return []
 
 
+def iter_pdf_chunks_parallel(pdf_files, chunk_size=1000, chunk_overlap=200,
+                             shard_pages=PDF_SHARD_PAGES, max_workers=None):
+    """
+    Chunk PDFs across a process pool, yielding results shard by shard.
+    
+    Large PDFs are split into page-range shards so no single document
+    becomes the tail of the run, and at most two shards per worker are
+    in flight so memory is bounded by shard size.
+    
+    Yields:
+        (pdf_file, chunks of one shard) as shards complete
+    """
+    max_workers = max_workers or multiprocessing.cpu_count()
+    shards = ((pdf_file, shard) for pdf_file in pdf_files for shard in plan_shards(pdf_file, shard_pages))
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = {}
+        
+        def submit_next():
+            for pdf_file, (start, end) in shards:
+                future = executor.submit(extract_and_chunk_pdf, pdf_file, chunk_size, chunk_overlap, start, end)
+                in_flight[future] = pdf_file
+                return True
+            return False
+        
+        for _ in range(max_workers * 2):
+            if not submit_next():
+                break
+        
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                pdf_file = in_flight.pop(future)
+                yield pdf_file, future.result()
+                submit_next()
+
+
 def process_pdfs_in_directory_parallel(directory_path, chunk_size=1000, chunk_overlap=200):
     """
     Processes all PDF files in a given directory using multiprocessing.
@@ -48,27 +157,16 @@ def process_pdfs_in_directory_parallel(directory_path, chunk_size=1000, chunk_ov
 
     print(f"Found {len(pdf_files)} PDFs to process.")
     all_chunks = []
+    file_chunks = {}
     
-    # Use ProcessPoolExecutor to manage a pool of worker processes
-    # max_workers can be set to the number of CPU cores for optimal performance
-    max_workers = multiprocessing.cpu_count()
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks to the executor
-        future_to_pdf = {
-            executor.submit(extract_and_chunk_pdf, pdf_file, chunk_size, chunk_overlap): pdf_file
-            for pdf_file in pdf_files
-        }
-        
-        # Process results as they complete
-        for future in as_completed(future_to_pdf):
-            pdf_file = future_to_pdf[future]
-            try:
-                chunks = future.result()
-                if chunks:
-                    all_chunks.extend(chunks)
-                    print(f"  ✓ Processed '{os.path.basename(pdf_file)}' → {len(chunks)} chunks")
-            except Exception as e:
-                print(f"  ✗ Error retrieving results for {pdf_file}: {e}")
+    # Shards of every file are spread over one worker process per CPU core
+    for pdf_file, chunks in iter_pdf_chunks_parallel(pdf_files, chunk_size, chunk_overlap):
+        all_chunks.extend(chunks)
+        file_chunks[pdf_file] = file_chunks.get(pdf_file, 0) + len(chunks)
+    
+    for pdf_file, count in file_chunks.items():
+        if count:
+            print(f"  ✓ Processed '{os.path.basename(pdf_file)}' → {count} chunks")
 
     return all_chunks
 
@@ -94,7 +192,7 @@ if __name__ == "__main__":
             output_file = 'chunks_output.txt'
             with open(output_file, 'w', encoding='utf-8') as f:
                 f.write('\n\n---CHUNK SEPARATOR---\n\n'.join([
-                    f"Source: {chunk.metadata['source_file']}\n\nContent:\n{chunk.page_content}" 
+                    f"Source: {chunk.source_file}, page {chunk.page}\n\nContent:\n{chunk.text}"
                     for chunk in final_chunks_list
                 ]))
             print(f"✓ Chunks saved to {output_file}")
@@ -0,0 +1,110 @@
+"""
+Cross-encoder reranking of retrieved chunks under a latency budget
+"""
+import threading
+import time
+from src.query_cache import LRUCache, normalize_query
+from config.settings import (
+    RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_TIME_BUDGET, RERANK_MAX_LENGTH,
+    RERANK_CACHE_SIZE, QUERY_CACHE_TTL
+)
+
+
+class CrossEncoderReranker:
+    """
+    Rescores (query, chunk) pairs with a small cross-encoder on CPU.
+
+    Candidates are scored in batches in their retrieval order. Before each
+    batch the reranker estimates its cost from the pairs scored so far and
+    stops if it would overrun the per-query time budget; an incomplete
+    rerank falls back to the original order. Scores are cached per
+    (normalized query, chunk id), so a repeated question or a shared chunk
+    is never scored twice. The model is loaded on first use (or by
+    warm_up()), so constructing a reranker is free.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, batch_size=RERANK_BATCH_SIZE,
+                 time_budget=RERANK_TIME_BUDGET, cache_size=RERANK_CACHE_SIZE):
+        self.model_name = model_name
+        self._model = None
+        self._model_lock = threading.Lock()
+        self.batch_size = batch_size
+        self.time_budget = time_budget
+        self.score_cache = LRUCache(cache_size, QUERY_CACHE_TTL)
+        # Running estimate of seconds per scored pair
+        self._pair_time = None
+        self.reranked = 0
+        self.fallbacks = 0
+
+    @property
+    def model(self):
+        """The cross-encoder, loaded on first access."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    print(f"Loading reranker: {self.model_name}")
+                    self._model = CrossEncoder(self.model_name, device="cpu", max_length=RERANK_MAX_LENGTH)
+                    print("✓ Reranker loaded")
+        return self._model
+
+    def warm_up(self):
+        """Load the model and run one pair so the first query pays no setup cost."""
+        self.model.predict([("warm up", "warm up")], batch_size=1, show_progress_bar=False)
+
+    def rerank(self, query, docs, k):
+        """
+        Reorder candidate chunks by cross-encoder relevance.
+
+        Args:
+            query: User question
+            docs: Candidate LangChain Documents in retrieval order
+            k: Number of chunks to return
+
+        Returns:
+            Tuple of (top-k Documents, whether every candidate was scored)
+        """
+        if len(docs) <= 1:
+            return docs[:k], True
+
+        # Loaded outside the budget so a cold model does not skew the pair-time estimate
+        model = self.model
+        start = time.perf_counter()
+        key = normalize_query(query)
+        doc_keys = [(key, doc.metadata.get("chunk_id") or doc.id) for doc in docs]
+        scores = [self.score_cache.get(doc_key) for doc_key in doc_keys]
+        todo = [i for i, score in enumerate(scores) if score is None]
+
+        for b in range(0, len(todo), self.batch_size):
+            batch = todo[b:b + self.batch_size]
+            elapsed = time.perf_counter() - start
+            if self._pair_time is not None and elapsed + self._pair_time * len(batch) > self.time_budget:
+                break
+
+            batch_start = time.perf_counter()
+            batch_scores = model.predict(
+                [(query, docs[i].page_content) for i in batch],
+                batch_size=len(batch), show_progress_bar=False
+            )
+            pair_time = (time.perf_counter() - batch_start) / len(batch)
+            self._pair_time = pair_time if self._pair_time is None else 0.8 * self._pair_time + 0.2 * pair_time
+
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                self.score_cache.put(doc_keys[i], scores[i])
+
+        if any(score is None for score in scores):
+            self.fallbacks += 1
+            return docs[:k], False
+
+        self.reranked += 1
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order[:k]], True
+
+    def stats(self):
+        return {
+            "reranked": self.reranked,
+            "fallbacks": self.fallbacks,
+            "pair_ms": self._pair_time * 1000 if self._pair_time is not None else None,
+            "score_cache": self.score_cache.stats(),
+        }
@@ -1,11 +1,22 @@
 """
-RAG retriever: combines vector search with LLM generation
+RAG retriever: combines hybrid (vector + BM25) search with LLM generation
 """
+import json
+import threading
+import time
+from array import array
 from langchain_ollama import OllamaLLM
 from src.vector_store import VectorStoreManager
+from src.query_cache import LRUCache, normalize_query
+from src.answer_cache import SemanticAnswerCache
+from src import metrics
+from src.context_packer import ContextPacker, estimate_tokens
+from src.chat_sessions import SessionStore
 from config.settings import (
-    LLM_MODEL, TOP_K_RESULTS, MAX_TOKENS, 
-    TEMPERATURE, OLLAMA_BASE_URL
+    LLM_MODEL, TOP_K_RESULTS, MAX_TOKENS, MAX_MODEL_LENGTH,
+    TEMPERATURE, OLLAMA_BASE_URL,
+    QUERY_CACHE_SIZE, RETRIEVAL_CACHE_SIZE, QUERY_CACHE_TTL, ANSWER_CACHE_ENABLED,
+    RERANK_ENABLED, RERANK_CANDIDATES, WARMUP_LLM, CONTEXT_TOKEN_BUDGET, CHAT_SESSIONS_ENABLED
 )
 
 
@@ -20,70 +31,386 @@ class RAGRetriever:
             model=LLM_MODEL,
             base_url=OLLAMA_BASE_URL,
             temperature=TEMPERATURE,
-            num_predict=MAX_TOKENS
+            num_predict=MAX_TOKENS,
+            num_ctx=MAX_MODEL_LENGTH
         )
+        self.context_packer = ContextPacker()
+        
+        # normalized query -> embedding
+        self.query_embedding_cache = LRUCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        # (embedding, k, filters, collection generation) -> retrieved chunks
+        self.retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE, QUERY_CACHE_TTL)
+        # near-duplicate question -> generated answer
+        self.answer_cache = SemanticAnswerCache() if ANSWER_CACHE_ENABLED else None
+        # chat session id -> Ollama context of the conversation so far
+        self.sessions = SessionStore() if CHAT_SESSIONS_ENABLED else None
+        self._ollama_client = None
+        
+        self.reranker = None
+        if RERANK_ENABLED:
+            from src.reranker import CrossEncoderReranker
+            self.reranker = CrossEncoderReranker()
+        
+        # warm-up step -> seconds taken
+        self.warmup_times = {}
         
         print(f"✓ RAG Retriever initialized with {LLM_MODEL}")
     
-    def retrieve_and_generate(self, query):
+    def warm_up(self, background=True, llm=WARMUP_LLM):
         """
-        RAG pipeline: retrieve context and generate answer.
+        Load models before the first question arrives.
+        
+        Loads the embedding model and the reranker and asks Ollama to load
+        the LLM with this retriever's context size. Queries arriving meanwhile
+        wait only for the model they need.
+        
+        Args:
+            background: Run in a daemon thread and return immediately
+            llm: Include the LLM
+        
+        Returns:
+            The warm-up thread when background=True, else None
+        """
+        if background:
+            thread = threading.Thread(
+                target=self.warm_up, args=(False, llm), name="rag-warmup", daemon=True
+            )
+            thread.start()
+            return thread
+        
+        steps = [("embedding model", lambda: self.vs_manager.embeddings.embed_query("warm up"))]
+        if self.reranker:
+            steps.append(("reranker", self.reranker.warm_up))
+        if llm:
+            steps.append(("LLM", self._load_llm))
+        
+        for name, step in steps:
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                print(f"✗ Warm-up of {name} failed: {e}")
+                continue
+            self.warmup_times[name] = time.perf_counter() - start
+        print("✓ Warm-up complete")
+    
+    def _load_llm(self):
+        """Have Ollama load the model (an empty prompt generates nothing)."""
+        self._get_ollama_client().generate(
+            model=LLM_MODEL, prompt="", options={"num_ctx": MAX_MODEL_LENGTH}
+        )
+    
+    def _get_ollama_client(self):
+        if self._ollama_client is None:
+            from ollama import Client
+            self._ollama_client = Client(host=OLLAMA_BASE_URL)
+        return self._ollama_client
+    
+    def embed_query(self, query):
+        """Embed a query, reusing the embedding of an identical earlier query."""
+        key = normalize_query(query)
+        embedding = self.query_embedding_cache.get(key)
+        if embedding is None:
+            with metrics.span("query_embed", chars=len(query)):
+                embedding = self.vs_manager.embeddings.embed_query(query)
+            self.query_embedding_cache.put(key, embedding)
+        return embedding
+    
+    def retrieve(self, query, k=TOP_K_RESULTS, filters=None):
+        """
+        Retrieve the k chunks most relevant to a query.
+        
+        Vector and BM25 rankings are fused (see VectorStoreManager.hybrid_search)
+        and, with reranking enabled, RERANK_CANDIDATES chunks are rescored by the
+        cross-encoder. Results are cached per (query embedding, k, filters) and
+        keyed on the collection generation, so any index change invalidates them.
+        A rerank that ran out of time budget is not cached.
         
         Args:
             query: User question
+            k: Number of chunks to return
+            filters: Optional Chroma metadata filter
             
         Returns:
-            Dict with 'answer' and 'sources'
+            List of LangChain Document objects
         """
+        embedding = self.embed_query(query)
+        key = (
+            array("f", embedding).tobytes(), k,
+            json.dumps(filters, sort_keys=True) if filters else None,
+            self.vs_manager.generation
+        )
+        docs = self.retrieval_cache.get(key)
+        if docs is None:
+            with metrics.span("search") as span:
+                candidates = self.vs_manager.hybrid_search(
+                    query, embedding, k=max(k, RERANK_CANDIDATES) if self.reranker else k,
+                    filter=filters
+                )
+                span.add(chunks=len(candidates))
+            if self.reranker:
+                with metrics.span("rerank", pairs=len(candidates)):
+                    docs, complete = self.reranker.rerank(query, candidates, k)
+            else:
+                docs, complete = candidates, True
+            if complete:
+                self.retrieval_cache.put(key, docs)
+        return docs
+    
+    def cache_stats(self):
+        """Hit/miss statistics of the query caches."""
+        stats = {
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "retrieval": self.retrieval_cache.stats(),
+        }
+        if self.answer_cache:
+            stats["answers"] = self.answer_cache.stats()
+        if self.sessions:
+            stats["sessions"] = self.sessions.stats()
+        if self.reranker:
+            stats["reranker"] = self.reranker.stats()
+        return stats
+    
+    def build_prompt(self, query, docs):
+        """Construct the LLM prompt from retrieved chunks (see ContextPacker)."""
+        with metrics.span("context_build", chunks=len(docs)) as span:
+            prompt = self.context_packer.build_prompt(query, docs)
+            span.add(chars=len(prompt), tokens=estimate_tokens(prompt))
+        return prompt
+    
+    def _check_answer_cache(self, query, docs, sources):
+        """
+        Look a question up in the answer cache.
+        
+        Returns:
+            Tuple of (cached entry or None, callback storing a newly
+            generated answer or None)
+        """
+        if self.answer_cache is None:
+            return None, None
+        embedding = self.embed_query(query)
+        chunk_ids = [doc.metadata.get("chunk_id") or doc.id for doc in docs]
+        generation = self.vs_manager.generation
+        cached = self.answer_cache.lookup(embedding, LLM_MODEL, chunk_ids, generation)
+        if cached:
+            print(f"  Answer cache hit (similarity {cached['similarity']:.3f})")
+            return cached, None
+        
+        def on_complete(answer):
+            self.answer_cache.store(
+                query, embedding, LLM_MODEL, chunk_ids, generation, answer, sources
+            )
+        return None, on_complete
+    
+    def stream(self, query, use_cache=True, session_id=None):
+        """
+        Streaming RAG pipeline: retrieve context, then yield answer tokens.
+        
+        Retrieval happens before this returns, so sources are available
+        before the first token is generated.
+        
+        Args:
+            query: User question
+            use_cache: Serve near-duplicate questions from the answer cache
+            session_id: Chat session to continue (see stream_in_session)
+            
+        Returns:
+            StreamingAnswer to iterate over for tokens
+        """
+        if session_id is not None and self.sessions is not None:
+            return self.stream_in_session(session_id, query, use_cache=use_cache)
+        
+        start = time.perf_counter()
         print(f"\n Query: {query}")
         
         # Retrieve relevant chunks
-        docs = self.vs_manager.similarity_search(query, k=TOP_K_RESULTS)
+        docs = self.retrieve(query, k=TOP_K_RESULTS)
         
         if not docs:
-            return {
-                "answer": "No relevant documents found in the knowledge base.",
-                "sources": []
-            }
+            return StreamingAnswer(
+                ["No relevant documents found in the knowledge base."], [], start
+            )
         
         print(f"  Retrieved {len(docs)} relevant chunks")
+        sources = list(set([doc.metadata.get('source_file', 'unknown') for doc in docs]))
         
-        # Build context from retrieved chunks
-        context = "\n\n".join([
-            f"[Source: {doc.metadata.get('source_file', 'unknown')}]\n{doc.page_content}"
-            for doc in docs
-        ])
-        
-        # Construct prompt
-        prompt = f"""You are a technical documentation expert. Using the context provided below, give a comprehensive and detailed answer to the question.
-
-Instructions:
-- Provide a thorough explanation with relevant details
-- Include specific examples or technical specifications when available
-- Structure your response with clear paragraphs
-- Aim for 3-5 paragraphs when the context supports it
-- If multiple aspects exist, address each one
-- Use technical terminology appropriately
-- If context is insufficient, explain what information is missing
-Context:
-{context}
-
-Question: {query}
-
-Answer:"""
+        # Skip the LLM for a near-duplicate of an already answered question
+        on_complete = None
+        if use_cache:
+            cached, on_complete = self._check_answer_cache(query, docs, sources)
+            if cached:
+                return StreamingAnswer([cached["answer"]], cached["sources"], start, cached=True)
         
         # Generate response
         print("  Generating answer...")
-        response = self.llm.invoke(prompt)
+        prompt = self.build_prompt(query, docs)
+        tokens = self.llm.stream(prompt)
+        return StreamingAnswer(tokens, sources, start, on_complete=on_complete,
+                               prompt_tokens=estimate_tokens(prompt))
+    
+    def stream_in_session(self, session_id, query, use_cache=True):
+        """
+        Streaming RAG for one turn of a chat session.
+        
+        The first turn is an ordinary prompt. Later turns send Ollama the
+        context it returned with the previous answer plus only the new
+        text (chunks not yet in the conversation and the question), so the
+        instructions, earlier context and answers are not prefilled again
+        and the model sees the conversation so far. A session whose context
+        passed CHAT_SESSION_MAX_TOKENS starts over with a full prompt that
+        carries its last exchange.
+        
+        Args:
+            session_id: Any string identifying the conversation
+            query: User question
+            use_cache: Serve a session's first question from the answer cache
+            
+        Returns:
+            StreamingAnswer to iterate over for tokens
+        """
+        session = self.sessions.get(session_id)
+        turn, context, sent_chunks, last_exchange = session.snapshot()
+        start = time.perf_counter()
+        print(f"\n Query: {query} (turn {turn + 1}, {len(context or [])} context tokens)")
         
+        docs = self.retrieve(query, k=TOP_K_RESULTS)
+        if not docs:
+            return StreamingAnswer(
+                ["No relevant documents found in the knowledge base."], [], start
+            )
+        print(f"  Retrieved {len(docs)} relevant chunks")
         sources = list(set([doc.metadata.get('source_file', 'unknown') for doc in docs]))
         
+        on_complete = None
+        # Only an opening question is independent of the conversation
+        if use_cache and turn == 0:
+            cached, on_complete = self._check_answer_cache(query, docs, sources)
+            if cached:
+                session.record(turn, query, cached["answer"], None, [])
+                return StreamingAnswer([cached["answer"]], cached["sources"], start, cached=True)
+        
+        with metrics.span("context_build") as span:
+            if context is not None:
+                new_docs = [doc for doc in docs
+                            if (doc.metadata.get("chunk_id") or doc.id) not in sent_chunks]
+                budget = min(CONTEXT_TOKEN_BUDGET, MAX_MODEL_LENGTH - MAX_TOKENS - len(context))
+                prompt, included = self.context_packer.compose(query, new_docs, follow_up_budget=budget)
+            else:
+                prompt, included = self.context_packer.compose(query, docs, history=last_exchange)
+            span.add(chunks=len(included), chars=len(prompt), tokens=estimate_tokens(prompt))
+        
+        print("  Generating answer..." if context is None else
+              f"  Generating follow-up ({len(included)} new chunks)...")
+        tokens = self._generate_in_session(
+            session, turn, query, prompt, context,
+            [doc.metadata.get("chunk_id") or doc.id for doc in included]
+        )
+        return StreamingAnswer(tokens, sources, start, on_complete=on_complete,
+                               prompt_tokens=estimate_tokens(prompt), session=session)
+    
+    def _generate_in_session(self, session, turn, query, prompt, context, chunk_ids):
+        """Yield answer tokens from Ollama, then save the returned context to the session."""
+        final = {}
+        parts = []
+        for chunk in self._get_ollama_client().generate(
+            model=LLM_MODEL, prompt=prompt, context=context, stream=True,
+            options={"temperature": TEMPERATURE, "num_predict": MAX_TOKENS,
+                     "num_ctx": MAX_MODEL_LENGTH}
+        ):
+            if chunk.get("response"):
+                parts.append(chunk["response"])
+                yield chunk["response"]
+            if chunk.get("done"):
+                final = chunk
+        session.record(turn, query, "".join(parts).strip(), final.get("context"), chunk_ids,
+                       prefill_tokens=final.get("prompt_eval_count"))
+    
+    def end_session(self, session_id):
+        """Forget a chat session (e.g. the chat was cleared)."""
+        if self.sessions is not None:
+            self.sessions.end(session_id)
+    
+    def retrieve_and_generate(self, query, use_cache=True):
+        """
+        RAG pipeline: retrieve context and generate answer.
+        
+        Args:
+            query: User question
+            use_cache: Serve near-duplicate questions from the answer cache
+            
+        Returns:
+            Dict with 'answer', 'sources', 'cached' and timing 'stats'
+        """
+        response = self.stream(query, use_cache=use_cache)
+        for _ in response:
+            pass
+        
         return {
-            "answer": response.strip(),
-            "sources": sources
+            "answer": response.answer,
+            "sources": response.sources,
+            "cached": response.cached,
+            "stats": response.stats
         }
 
 
+class StreamingAnswer:
+    """
+    Iterable of answer tokens with sources known up front.
+    
+    Once iteration finishes, 'answer' holds the full text and 'stats' holds
+    time-to-first-token (from the start of the request), decode tokens/sec
+    and total latency (plus the turn number and context size for a chat
+    session turn). Answers generated by the LLM (prompt_tokens given)
+    also record llm_prefill and llm_decode metrics.
+    """
+    
+    def __init__(self, tokens, sources, start, cached=False, on_complete=None, prompt_tokens=None,
+                 session=None):
+        self.sources = sources
+        self.cached = cached
+        self.session = session
+        self.answer = None
+        self.stats = None
+        self._tokens = tokens
+        self._start = start
+        self._on_complete = on_complete
+        self._prompt_tokens = prompt_tokens
+    
+    def __iter__(self):
+        parts = []
+        first_token_at = None
+        # The LLM request is sent on the first next()
+        generate_start = time.perf_counter()
+        for token in self._tokens:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            parts.append(token)
+            yield token
+        
+        end = time.perf_counter()
+        first_token_at = first_token_at or end
+        decode_time = end - first_token_at
+        self.answer = "".join(parts).strip()
+        self.stats = {
+            "ttft": first_token_at - self._start,
+            "tokens": len(parts),
+            "tokens_per_sec": (len(parts) - 1) / decode_time if decode_time > 0 else 0.0,
+            "total": end - self._start,
+        }
+        if self.session is not None:
+            self.stats["turn"] = self.session.turns
+            self.stats["context_tokens"] = self.session.tokens
+            self.stats["prefill_tokens"] = self.session.last_prefill_tokens
+        if self._prompt_tokens is not None:
+            metrics.observe("llm_prefill", first_token_at - generate_start, tokens=self._prompt_tokens)
+            metrics.observe("llm_decode", decode_time, tokens=len(parts))
+        print(f"  TTFT {self.stats['ttft']:.2f}s, {self.stats['tokens']} tokens, "
+              f"{self.stats['tokens_per_sec']:.1f} tokens/s")
+        
+        if self._on_complete:
+            self._on_complete(self.answer)
+
+
 if __name__ == "__main__":
     # Test retriever
     rag = RAGRetriever()
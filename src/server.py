@@ -0,0 +1,272 @@
+"""
+Async HTTP API for the RAG pipeline (main.py serve)
+"""
+import asyncio
+import json
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+import httpx
+from ollama import AsyncClient
+from src.retriever import RAGRetriever
+from src import metrics
+from src.query_cache import normalize_query
+from config.settings import (
+    LLM_MODEL, MAX_TOKENS, MAX_MODEL_LENGTH, TEMPERATURE, OLLAMA_BASE_URL,
+    SERVE_HOST, SERVE_PORT, SERVE_MAX_CONCURRENT_GENERATIONS, SERVE_MAX_QUEUE,
+    SERVE_RETRIEVAL_THREADS, SERVE_KEEPALIVE_TIMEOUT, WARMUP_ON_START, WARMUP_LLM
+)
+
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 64 * 1024
+
+
+class Overloaded(Exception):
+    """Raised when too many requests are already waiting for generation."""
+
+
+class RAGServer:
+    """
+    Asyncio HTTP front end sharing one RAGRetriever across all requests.
+
+    Retrieval (embedding + vector search) runs on a thread pool; generation
+    goes through a pooled keep-alive Ollama client and is capped by a
+    semaphore. Identical concurrent questions share a single in-flight
+    request, and once more than max_concurrent + max_queue distinct requests
+    are in progress new ones are shed with 503.
+
+    Endpoints:
+        POST /query   {"query": str, "use_cache": bool} -> answer, sources, cached, stats
+        GET  /health  liveness and load
+        GET  /stats   cache and request counters, per-stage latency summary
+        GET  /metrics per-stage histograms in Prometheus text format
+    """
+
+    def __init__(self, rag=None, ollama_url=OLLAMA_BASE_URL,
+                 max_concurrent=SERVE_MAX_CONCURRENT_GENERATIONS, max_queue=SERVE_MAX_QUEUE,
+                 retrieval_threads=SERVE_RETRIEVAL_THREADS):
+        self.rag = rag or RAGRetriever()
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.client = AsyncClient(
+            host=ollama_url,
+            timeout=httpx.Timeout(300.0, connect=5.0),
+            limits=httpx.Limits(max_connections=max_concurrent,
+                                max_keepalive_connections=max_concurrent)
+        )
+        self._executor = ThreadPoolExecutor(max_workers=retrieval_threads,
+                                            thread_name_prefix="rag-retrieve")
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._inflight = {}
+        self.counters = {
+            "requests": 0, "coalesced": 0, "shed": 0, "errors": 0, "generations": 0,
+        }
+
+    @property
+    def pending(self):
+        """Distinct (non-coalesced) requests currently in progress."""
+        return len(self._inflight)
+
+    async def answer(self, query, use_cache=True):
+        """Answer a question, joining an identical request already in flight."""
+        self.counters["requests"] += 1
+        key = (normalize_query(query), use_cache)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+        else:
+            if self.pending >= self.max_concurrent + self.max_queue:
+                self.counters["shed"] += 1
+                raise Overloaded()
+            task = asyncio.ensure_future(self._answer(query, use_cache))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # Shield so one client disconnecting does not cancel the shared work
+        return await asyncio.shield(task)
+
+    async def _answer(self, query, use_cache):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+
+        docs = await loop.run_in_executor(self._executor, self.rag.retrieve, query)
+        if not docs:
+            return {
+                "answer": "No relevant documents found in the knowledge base.",
+                "sources": [], "cached": False, "stats": None
+            }
+        sources = list(set([doc.metadata.get('source_file', 'unknown') for doc in docs]))
+
+        cache_key = None
+        if use_cache and self.rag.answer_cache is not None:
+            embedding = await loop.run_in_executor(self._executor, self.rag.embed_query, query)
+            cache_key = (embedding, LLM_MODEL,
+                         [doc.metadata.get("chunk_id") or doc.id for doc in docs],
+                         self.rag.vs_manager.generation)
+            cached = await loop.run_in_executor(
+                self._executor, self.rag.answer_cache.lookup, *cache_key
+            )
+            if cached:
+                return {"answer": cached["answer"], "sources": cached["sources"],
+                        "cached": True, "stats": None}
+
+        prompt = self.rag.build_prompt(query, docs)
+        wait_start = time.perf_counter()
+        async with self._semaphore:
+            queued = time.perf_counter() - start
+            metrics.observe("llm_queue", time.perf_counter() - wait_start)
+            response = await self.client.generate(
+                model=LLM_MODEL, prompt=prompt,
+                options={"temperature": TEMPERATURE, "num_predict": MAX_TOKENS,
+                         "num_ctx": MAX_MODEL_LENGTH}
+            )
+        self.counters["generations"] += 1
+        # Ollama reports prefill and decode durations in nanoseconds
+        metrics.observe("llm_prefill", (response.get("prompt_eval_duration") or 0) / 1e9,
+                        tokens=response.get("prompt_eval_count") or 0)
+        metrics.observe("llm_decode", (response.get("eval_duration") or 0) / 1e9,
+                        tokens=response.get("eval_count") or 0)
+        answer = response["response"].strip()
+
+        if cache_key:
+            embedding, model, chunk_ids, generation = cache_key
+            await loop.run_in_executor(
+                self._executor, self.rag.answer_cache.store,
+                query, embedding, model, chunk_ids, generation, answer, sources
+            )
+
+        return {
+            "answer": answer,
+            "sources": sources,
+            "cached": False,
+            "stats": {
+                "queued": queued,
+                "total": time.perf_counter() - start,
+                "tokens": response.get("eval_count"),
+            }
+        }
+
+    async def _dispatch(self, method, path, body):
+        """Route a request. Returns (status, payload, extra headers)."""
+        path = path.split("?", 1)[0]
+
+        if path == "/health" and method == "GET":
+            return HTTPStatus.OK, {
+                "status": "ok", "pending": self.pending,
+                "max_concurrent": self.max_concurrent, "max_queue": self.max_queue,
+            }, {}
+
+        if path == "/stats" and method == "GET":
+            return HTTPStatus.OK, {
+                "requests": self.counters, "pending": self.pending,
+                "caches": self.rag.cache_stats(),
+                "stages": metrics.REGISTRY.summary(),
+            }, {}
+
+        if path == "/metrics" and method == "GET":
+            return HTTPStatus.OK, metrics.REGISTRY.render_prometheus(), {}
+
+        if path == "/query":
+            if method != "POST":
+                return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "use POST"}, {"Allow": "POST"}
+            try:
+                request = json.loads(body or b"{}")
+                query = str(request["query"]).strip()
+            except (ValueError, KeyError, TypeError):
+                return HTTPStatus.BAD_REQUEST, {"error": "body must be JSON with a 'query'"}, {}
+            if not query:
+                return HTTPStatus.BAD_REQUEST, {"error": "empty query"}, {}
+
+            try:
+                result = await self.answer(query, use_cache=bool(request.get("use_cache", True)))
+            except Overloaded:
+                return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "server overloaded"}, {"Retry-After": "1"}
+            except Exception as e:
+                self.counters["errors"] += 1
+                return HTTPStatus.BAD_GATEWAY, {"error": str(e)}, {}
+            return HTTPStatus.OK, result, {}
+
+        return HTTPStatus.NOT_FOUND, {"error": "not found"}, {}
+
+    async def _handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one keep-alive connection."""
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), SERVE_KEEPALIVE_TIMEOUT)
+                if not request_line:
+                    break
+                method, path, version = request_line.decode("latin-1").split()
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    status, payload, extra = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "body too large"}, {}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload, extra = await self._dispatch(method.upper(), path, body)
+                    keep_alive = (version == "HTTP/1.1"
+                                  and headers.get("connection", "").lower() != "close")
+
+                if isinstance(payload, str):
+                    data = payload.encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    data = json.dumps(payload).encode("utf-8")
+                    content_type = "application/json"
+                head = [
+                    f"HTTP/1.1 {status.value} {status.phrase}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {len(data)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ] + [f"{name}: {value}" for name, value in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVE_HOST, port=SERVE_PORT):
+        """Run until SIGINT/SIGTERM, then finish in-flight requests."""
+        server = await asyncio.start_server(self._handle_connection, host, port, backlog=1024)
+        print(f"✓ Serving on http://{host}:{port} "
+              f"(max {self.max_concurrent} generations, queue {self.max_queue})")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                pass
+
+        async with server:
+            await stop.wait()
+            print("\nShutting down, waiting for in-flight requests...")
+            server.close()
+            await server.wait_closed()
+            if self._inflight:
+                await asyncio.gather(*self._inflight.values(), return_exceptions=True)
+
+        self._executor.shutdown(wait=False)
+
+
+def run_server(host=SERVE_HOST, port=SERVE_PORT, ollama_url=OLLAMA_BASE_URL):
+    """Start the HTTP API (blocking)."""
+    server = RAGServer(ollama_url=ollama_url)
+    # Accept connections while models load; the retriever warms the default Ollama only
+    if WARMUP_ON_START:
+        server.rag.warm_up(llm=WARMUP_LLM and ollama_url == OLLAMA_BASE_URL)
+    asyncio.run(server.serve(host, port))
@@ -0,0 +1,310 @@
+"""
+Vector store split into independent shards searched in parallel (VECTOR_SHARDS > 1)
+"""
+import fnmatch
+import hashlib
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+from langchain_core.documents import Document
+from config.settings import SHARD_GROUPS, SHARD_SEARCH_WORKERS
+
+
+def source_key(source_file):
+    """Hash of a source filename; chunk ids start with it (see chunk_id)."""
+    return hashlib.sha1(source_file.encode("utf-8")).hexdigest()[:16]
+
+
+class ShardRouter:
+    """
+    Assigns source files, and so their chunks, to shards.
+
+    Files matching a SHARD_GROUPS pattern (first match wins) go to that
+    group's shard, so one department's documents can be rebuilt together;
+    every other file goes to the shard picked by its filename hash. Chunk
+    ids begin with that hash, so a chunk id alone is enough to route a
+    delete or get once the file is known. With groups configured, ids of
+    files never seen by this process are sent to every shard.
+    """
+
+    def __init__(self, shards, groups=SHARD_GROUPS):
+        for pattern, shard in groups.items():
+            if not 0 <= shard < shards:
+                raise ValueError(f"SHARD_GROUPS[{pattern!r}] = {shard} is not a shard (0-{shards - 1})")
+        self.shards = shards
+        self.groups = groups
+        # source key -> shard of every file seen so far
+        self._keys = {}
+
+    def shard_of_file(self, filename):
+        key = source_key(filename)
+        shard = self._keys.get(key)
+        if shard is None:
+            shard = int(key, 16) % self.shards
+            for pattern, group_shard in self.groups.items():
+                if fnmatch.fnmatch(filename, pattern):
+                    shard = group_shard
+                    break
+            self._keys[key] = shard
+        return shard
+
+    def shard_of_id(self, chunk_id):
+        """Shard holding a chunk, or None if it may be in any shard."""
+        key = chunk_id.split("-", 1)[0]
+        shard = self._keys.get(key)
+        if shard is None and not self.groups:
+            shard = int(key, 16) % self.shards
+        return shard
+
+    def register(self, filenames):
+        """Learn the routes of already indexed files."""
+        for filename in filenames:
+            self.shard_of_file(filename)
+
+    def layout(self):
+        """Settings that decide routing; the store must be rebuilt when they change."""
+        return {"shards": self.shards, "groups": dict(sorted(self.groups.items()))}
+
+
+class ShardedVectorStore:
+    """
+    N complete stores behind one Chroma-style interface.
+
+    Each shard is a store of its own (a Chroma persist directory or a flat
+    store directory) with its own files and locks, so writes to different
+    shards do not contend and one shard can be rebuilt or compacted while
+    the others keep serving. Writes are grouped by shard and applied in
+    parallel; queries fan out to every shard on a thread pool, and the
+    per-shard top-k lists, each already sorted by distance, are merged with
+    a heap. Like FlatVectorStore, the methods mirror the parts of Chroma's
+    API that VectorStoreManager uses, so it serves as both vector_store and
+    collection.
+    """
+
+    def __init__(self, open_shard, router, embedding_function=None, workers=SHARD_SEARCH_WORKERS):
+        """
+        Args:
+            open_shard: Callable returning (store, collection) for a shard number
+            router: ShardRouter deciding which shard each chunk belongs to
+            embedding_function: Embeddings used by add_documents() and similarity_search()
+            workers: Threads running per-shard queries and writes
+        """
+        self.open_shard = open_shard
+        self.router = router
+        self.embedding_function = embedding_function
+        self.stores = []
+        self.collections = []
+        for shard in range(router.shards):
+            store, collection = open_shard(shard)
+            self.stores.append(store)
+            self.collections.append(collection)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, min(workers, router.shards)), thread_name_prefix="shard"
+        )
+
+    def __len__(self):
+        return len(self.collections)
+
+    def _map(self, fn, items):
+        """fn(shard, item) for each (shard, item) pair, in parallel when there are several."""
+        items = list(items)
+        if len(items) == 1:
+            return [fn(*items[0])]
+        return list(self._executor.map(lambda pair: fn(*pair), items))
+
+    def _route_ids(self, ids):
+        """shard -> ids; ids whose shard is unknown go to every shard."""
+        routed = {}
+        unknown = []
+        for cid in ids:
+            shard = self.router.shard_of_id(cid)
+            if shard is None:
+                unknown.append(cid)
+            else:
+                routed.setdefault(shard, []).append(cid)
+        if unknown:
+            for shard in range(len(self.collections)):
+                routed.setdefault(shard, []).extend(unknown)
+        return routed
+
+    def reopen(self, shard):
+        """Reopen a shard whose collection was replaced, e.g. rebuilt by another process."""
+        with self._lock:
+            self.stores[shard], self.collections[shard] = self.open_shard(shard)
+
+    def reset_shard(self, shard):
+        """Delete every chunk in one shard and start it empty; other shards are untouched."""
+        store = self.stores[shard]
+        if hasattr(store, "reset_collection"):
+            store.reset_collection()
+            self.collections[shard] = store._collection
+        else:
+            store.delete_collection()
+
+    # Writes
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        """Insert or overwrite chunks, each in the shard of its source file."""
+        if not len(ids):
+            return
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [None] * len(ids)
+
+        groups = {}
+        for i, (cid, meta) in enumerate(zip(ids, metadatas)):
+            source = (meta or {}).get("source_file")
+            shard = self.router.shard_of_file(source) if source else self.router.shard_of_id(cid)
+            groups.setdefault(shard if shard is not None else 0, []).append(i)
+
+        def write(shard, rows):
+            self.collections[shard].upsert(
+                ids=[ids[i] for i in rows],
+                embeddings=[embeddings[i] for i in rows],
+                documents=[documents[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows]
+            )
+
+        self._map(write, groups.items())
+
+    def add_documents(self, documents, ids):
+        """Embed and upsert LangChain Documents."""
+        self.upsert(
+            list(ids),
+            self.embedding_function.embed_documents([doc.page_content for doc in documents]),
+            [doc.page_content for doc in documents],
+            [doc.metadata for doc in documents]
+        )
+        return list(ids)
+
+    def delete(self, ids):
+        """Delete chunks by id from the shards holding them."""
+        self._map(lambda shard, shard_ids: self.collections[shard].delete(ids=shard_ids),
+                  self._route_ids(ids).items())
+
+    def delete_collection(self):
+        """Empty every shard; the store stays usable."""
+        for shard in range(len(self.stores)):
+            self.reset_shard(shard)
+
+    # Reads
+
+    def count(self):
+        return sum(self.shard_counts())
+
+    def shard_counts(self):
+        """Chunks in each shard."""
+        return self._map(lambda shard, collection: collection.count(), enumerate(self.collections))
+
+    def _query_shard(self, shard, request):
+        """One shard's results; a shard that keeps failing contributes nothing."""
+        for attempt in range(2):
+            try:
+                return self.collections[shard].query(**request)
+            except Exception as e:
+                if attempt:
+                    print(f"✗ Shard {shard} skipped: {e}")
+                    return None
+                self.reopen(shard)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas")):
+        """
+        Chroma-style batched query over every shard.
+
+        Returns:
+            Dict of 'ids', 'documents', 'metadatas' and 'distances', one list
+            per query embedding, best first
+        """
+        request = {
+            "query_embeddings": query_embeddings, "n_results": n_results, "where": where,
+            "include": sorted(set(include) | {"documents", "metadatas", "distances"}),
+        }
+        results = [result for result in self._map(
+            lambda shard, _: self._query_shard(shard, request), enumerate(self.collections)
+        ) if result is not None]
+
+        merged = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        for q in range(len(query_embeddings)):
+            # Each shard's list is sorted by distance, so a k-way heap merge
+            # yields the global top n_results without sorting everything
+            runs = [zip(result["distances"][q], result["ids"][q],
+                        result["documents"][q], result["metadatas"][q])
+                    for result in results]
+            hits = list(islice(heapq.merge(*runs, key=lambda hit: hit[0]), n_results))
+            merged["distances"].append([hit[0] for hit in hits])
+            merged["ids"].append([hit[1] for hit in hits])
+            merged["documents"].append([hit[2] for hit in hits])
+            merged["metadatas"].append([hit[3] for hit in hits])
+        return merged
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None):
+        result = self.query([embedding], n_results=k, where=filter)
+        return [
+            Document(page_content=text, metadata=meta or {}, id=cid)
+            for cid, text, meta in zip(result["ids"][0], result["documents"][0], result["metadatas"][0])
+        ]
+
+    def similarity_search(self, query, k=4, filter=None):
+        return self.similarity_search_by_vector(
+            self.embedding_function.embed_query(query), k=k, filter=filter
+        )
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas"), limit=None, offset=None):
+        """
+        Chroma-style get across shards.
+
+        With limit/offset (and no ids), pages run through the shards in
+        order, so a full scan reads each shard once.
+        """
+        include = list(include)
+        if ids is not None:
+            parts = self._map(
+                lambda shard, shard_ids: self.collections[shard].get(
+                    ids=shard_ids, where=where, include=include),
+                self._route_ids(list(ids)).items()
+            )
+        elif limit is None:
+            parts = self._map(lambda shard, collection: collection.get(where=where, include=include),
+                              enumerate(self.collections))
+        else:
+            parts = self._page(where, include, limit, offset or 0)
+
+        embeddings = None
+        if "embeddings" in include:
+            arrays = [np.asarray(part["embeddings"], dtype=np.float32) for part in parts if len(part["ids"])]
+            embeddings = np.concatenate(arrays) if arrays else np.empty((0, 0), dtype=np.float32)
+        return {
+            "ids": [cid for part in parts for cid in part["ids"]],
+            "documents": ([doc for part in parts for doc in part["documents"]]
+                          if "documents" in include else None),
+            "metadatas": ([meta for part in parts for meta in part["metadatas"]]
+                          if "metadatas" in include else None),
+            "embeddings": embeddings,
+        }
+
+    def _page(self, where, include, limit, offset):
+        parts = []
+        for collection in self.collections:
+            if limit <= 0:
+                break
+            if where is None:
+                size = collection.count()
+                if offset >= size:
+                    offset -= size
+                    continue
+                part = collection.get(include=include, limit=limit, offset=offset)
+                offset = 0
+            else:
+                part = collection.get(where=where, include=include)
+                size = len(part["ids"])
+                if offset >= size:
+                    offset -= size
+                    continue
+                part = {key: (part[key][offset:offset + limit] if part.get(key) is not None else None)
+                        for key in ("ids", "documents", "metadatas", "embeddings")}
+                offset = 0
+            limit -= len(part["ids"])
+            parts.append(part)
+        return parts
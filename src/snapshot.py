@@ -0,0 +1,405 @@
+"""
+Single-file index snapshots: export a built index, import it elsewhere without re-embedding
+"""
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+from array import array
+from pathlib import Path
+import numpy as np
+from langchain_core.documents import Document
+from config.settings import EMBEDDING_MODEL
+
+MAGIC = b"RAGSNAP\x00"
+FORMAT_VERSION = 1
+# Sections start on this boundary so every array can be memory-mapped in place
+ALIGN = 64
+# Chunks read from the store, or written to it, per call
+SNAPSHOT_BATCH_SIZE = 4096
+# Bytes copied or hashed per read
+COPY_BLOCK_SIZE = 1 << 24
+# A string metadata field is stored as codes into a table of its distinct
+# values when there are at most this many rows per distinct value
+CATEGORY_MIN_REPEAT = 2
+
+
+def _aligned(offset):
+    return -(-offset // ALIGN) * ALIGN
+
+
+class _Section:
+    """A section being spooled to a temporary file, hashed as it is written."""
+
+    def __init__(self, spool_dir, name, dtype, shape=None):
+        self.name = name
+        self.dtype = dtype
+        self.shape = shape
+        self.path = Path(spool_dir) / name
+        self.file = open(self.path, "wb")
+        self.digest = hashlib.blake2b()
+        self.nbytes = 0
+
+    def write(self, data):
+        data = memoryview(data).cast("B")
+        self.file.write(data)
+        self.digest.update(data)
+        self.nbytes += len(data)
+
+    def close(self):
+        self.file.close()
+        return {
+            "dtype": self.dtype, "shape": self.shape, "nbytes": self.nbytes,
+            "checksum": f"blake2b:{self.digest.hexdigest()}",
+        }
+
+
+class _StringSection:
+    """UTF-8 strings as one data section plus uint64 end offsets."""
+
+    def __init__(self, spool_dir, name):
+        self.data = _Section(spool_dir, f"{name}.data", "uint8")
+        self.name = name
+        self.ends = array("Q")
+
+    def extend(self, values):
+        for value in values:
+            encoded = value.encode("utf-8")
+            self.data.write(encoded)
+            self.ends.append(self.data.nbytes)
+
+    def close(self, spool_dir):
+        self.data.shape = [self.data.nbytes]
+        offsets = _Section(spool_dir, f"{self.name}.offsets", "uint64", [len(self.ends) + 1])
+        offsets.write(array("Q", [0]))
+        offsets.write(self.ends)
+        return [self.data, offsets]
+
+
+def _metadata_columns(metadatas):
+    """
+    Split metadata dicts into typed columns.
+
+    A field present in every row with one value type becomes a column:
+    int64 or float64 for numbers, a code column into a table of distinct
+    values for repetitive strings (e.g. source_file), plain strings
+    otherwise. Anything else is kept per row as JSON in an 'extra' column.
+
+    Returns:
+        (columns, extra) where columns is a list of (name, kind, values) and
+        extra is a list of per-row JSON strings, or None if not needed
+    """
+    count = len(metadatas)
+    types = {}
+    seen = {}
+    for meta in metadatas:
+        for key, value in meta.items():
+            seen[key] = seen.get(key, 0) + 1
+            types.setdefault(key, set()).add(type(value))
+
+    columns = []
+    for key, value_types in types.items():
+        if seen[key] != count:
+            continue
+        values = [meta[key] for meta in metadatas]
+        if value_types == {int}:
+            columns.append((key, "int64", values))
+        elif value_types <= {int, float}:
+            columns.append((key, "float64", values))
+        elif value_types == {str}:
+            distinct = len(set(values))
+            kind = "category" if distinct * CATEGORY_MIN_REPEAT <= count else "str"
+            columns.append((key, kind, values))
+
+    columnar = {name for name, _, _ in columns}
+    extra = [
+        json.dumps({key: value for key, value in meta.items() if key not in columnar}, sort_keys=True)
+        if set(meta) - columnar else ""
+        for meta in metadatas
+    ]
+    return columns, (extra if any(extra) else None)
+
+
+def export_snapshot(vsm, path, dtype="float32", batch_size=SNAPSHOT_BATCH_SIZE):
+    """
+    Write every chunk, its vector and the file manifest to one snapshot file.
+
+    Layout: MAGIC, a little-endian uint64 header length, a JSON header and
+    then the sections, each 64-byte aligned: 'vectors' (a row-major
+    count x dim matrix), 'ids' and 'text' (UTF-8 data with uint64 offsets),
+    one section set per metadata column and a JSON 'manifest'. The header
+    records every section's offset, dtype, shape and checksum. Sections are
+    spooled to temporary files first and the snapshot is renamed into place
+    only when complete.
+
+    Args:
+        vsm: VectorStoreManager
+        path: Snapshot file to write
+        dtype: "float32", or "float16" to halve the vector section
+        batch_size: Chunks read from the store per call
+
+    Returns:
+        Dict with 'chunks', 'files', 'dim' and 'bytes'
+    """
+    if dtype not in ("float32", "float16"):
+        raise ValueError(f"Unsupported snapshot dtype: {dtype}")
+    if not vsm.vector_store:
+        vsm.create_or_load()
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    generation = vsm.generation
+
+    with tempfile.TemporaryDirectory(dir=path.parent, prefix=".snapshot-") as spool_dir:
+        vectors = _Section(spool_dir, "vectors", dtype)
+        ids = _StringSection(spool_dir, "ids")
+        text = _StringSection(spool_dir, "text")
+        metadatas = []
+        dim = None
+        offset = 0
+        while True:
+            batch = vsm.vector_store.get(
+                include=["embeddings", "documents", "metadatas"], limit=batch_size, offset=offset
+            )
+            if len(batch["ids"]):
+                block = np.ascontiguousarray(batch["embeddings"], dtype=dtype)
+                dim = block.shape[1]
+                vectors.write(block)
+                ids.extend(batch["ids"])
+                text.extend(doc or "" for doc in batch["documents"])
+                metadatas.extend(meta or {} for meta in batch["metadatas"])
+            if len(batch["ids"]) < batch_size:
+                break
+            offset += batch_size
+
+        if vsm.generation != generation:
+            raise RuntimeError("The index changed during export; run it again once indexing is done")
+
+        count = len(metadatas)
+        vectors.shape = [count, dim or 0]
+        sections = [vectors] + ids.close(spool_dir) + text.close(spool_dir)
+
+        columns, extra = _metadata_columns(metadatas)
+        del metadatas
+        header_columns = []
+        for name, kind, values in columns:
+            header_columns.append({"name": name, "kind": kind})
+            prefix = f"meta.{name}"
+            if kind in ("int64", "float64"):
+                section = _Section(spool_dir, prefix, kind, [count])
+                section.write(np.asarray(values, dtype=kind))
+                sections.append(section)
+            elif kind == "category":
+                table = {}
+                codes = np.fromiter((table.setdefault(v, len(table)) for v in values),
+                                    dtype=np.uint32, count=count)
+                section = _Section(spool_dir, f"{prefix}.codes", "uint32", [count])
+                section.write(codes)
+                strings = _StringSection(spool_dir, f"{prefix}.values")
+                strings.extend(table)
+                sections += [section] + strings.close(spool_dir)
+            else:
+                strings = _StringSection(spool_dir, prefix)
+                strings.extend(values)
+                sections += strings.close(spool_dir)
+        if extra is not None:
+            header_columns.append({"name": "extra", "kind": "json"})
+            strings = _StringSection(spool_dir, "meta.extra")
+            strings.extend(extra)
+            sections += strings.close(spool_dir)
+        del columns, extra
+
+        manifest = vsm.manifest.dump()
+        section = _Section(spool_dir, "manifest", "json")
+        section.write(json.dumps(manifest).encode("utf-8"))
+        sections.append(section)
+
+        layout = {}
+        position = 0
+        for section in sections:
+            layout[section.name] = dict(section.close(), offset=position)
+            position = _aligned(position + section.nbytes)
+        header = json.dumps({
+            "format_version": FORMAT_VERSION,
+            "created": time.time(),
+            "embedding_model": EMBEDDING_MODEL,
+            "backend": vsm.backend,
+            "count": count,
+            "dim": dim or 0,
+            "columns": header_columns,
+            "sections": layout,
+        }).encode("utf-8")
+        # Section offsets are relative to the first aligned byte after the header
+        data_start = _aligned(len(MAGIC) + 8 + len(header))
+
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as out:
+            out.write(MAGIC + struct.pack("<Q", len(header)) + header)
+            for section in sections:
+                out.write(b"\0" * (data_start + layout[section.name]["offset"] - out.tell()))
+                with open(section.path, "rb") as f:
+                    shutil.copyfileobj(f, out, COPY_BLOCK_SIZE)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+
+    return {"chunks": count, "files": len(manifest["files"]), "dim": dim or 0,
+            "bytes": os.path.getsize(path)}
+
+
+class Snapshot:
+    """
+    Read-only view of a snapshot file.
+
+    The file is memory-mapped once; arrays are zero-copy views into it, so
+    opening a snapshot of any size is instant and only the rows touched are
+    read from disk.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not an index snapshot")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(header_length))
+        if self.header["format_version"] > FORMAT_VERSION:
+            raise ValueError(
+                f"{self.path} is snapshot format {self.header['format_version']}; "
+                f"this version reads up to {FORMAT_VERSION}"
+            )
+        self._data_start = _aligned(len(MAGIC) + 8 + header_length)
+        self._map = np.memmap(self.path, dtype=np.uint8, mode="r")
+        self.count = self.header["count"]
+        self.dim = self.header["dim"]
+        self.sections = self.header["sections"]
+        self._tables = {}
+
+    def _bytes(self, name):
+        section = self.sections[name]
+        start = self._data_start + section["offset"]
+        return self._map[start:start + section["nbytes"]]
+
+    def array(self, name):
+        """A numeric section as a memory-mapped array."""
+        section = self.sections[name]
+        return self._bytes(name).view(section["dtype"]).reshape(section["shape"])
+
+    @property
+    def vectors(self):
+        return self.array("vectors")
+
+    def strings(self, name, start=0, stop=None):
+        """Rows start:stop of a string section."""
+        offsets = self.array(f"{name}.offsets")
+        stop = len(offsets) - 1 if stop is None else stop
+        ends = offsets[start:stop + 1].astype(np.int64)
+        data = self._bytes(f"{name}.data")[ends[0]:ends[-1]].tobytes()
+        ends -= ends[0]
+        return [data[a:b].decode("utf-8") for a, b in zip(ends[:-1], ends[1:])]
+
+    def metadatas(self, start, stop):
+        """Metadata dicts of rows start:stop."""
+        rows = [{} for _ in range(stop - start)]
+        for column in self.header["columns"]:
+            name, kind = column["name"], column["kind"]
+            prefix = f"meta.{name}"
+            if kind in ("int64", "float64"):
+                values = self.array(prefix)[start:stop].tolist()
+            elif kind == "category":
+                table = self._tables.get(prefix)
+                if table is None:
+                    table = self._tables[prefix] = self.strings(f"{prefix}.values")
+                values = [table[code] for code in self.array(f"{prefix}.codes")[start:stop]]
+            elif kind == "str":
+                values = self.strings(prefix, start, stop)
+            else:
+                for row, value in zip(rows, self.strings(prefix, start, stop)):
+                    if value:
+                        row.update(json.loads(value))
+                continue
+            for row, value in zip(rows, values):
+                row[name] = value
+        return rows
+
+    def manifest(self):
+        return json.loads(self._bytes("manifest").tobytes())
+
+    def verify(self):
+        """Check every section's checksum; raises ValueError on a mismatch."""
+        for name, section in self.sections.items():
+            algorithm, expected = section["checksum"].split(":", 1)
+            digest = hashlib.new(algorithm)
+            data = self._bytes(name)
+            for start in range(0, len(data), COPY_BLOCK_SIZE):
+                digest.update(data[start:start + COPY_BLOCK_SIZE])
+            if digest.hexdigest() != expected:
+                raise ValueError(f"{self.path}: section '{name}' is corrupt (checksum mismatch)")
+
+    def close(self):
+        # Arrays handed out keep the mapping alive until they are released
+        self._map = None
+
+
+def import_snapshot(vsm, path, replace=False, verify=True, batch_size=SNAPSHOT_BATCH_SIZE):
+    """
+    Bulk-load a snapshot into the configured vector store.
+
+    Vectors are written as stored, so nothing is embedded; the embedding
+    model is never loaded. Chunks are routed to shards as usual, so a
+    snapshot can be imported into any backend and shard count. The manifest
+    is loaded last, so an interrupted import leaves no file recorded as
+    indexed.
+
+    Args:
+        vsm: VectorStoreManager
+        path: Snapshot file
+        replace: Delete the current contents first; otherwise the store
+            must be empty
+        verify: Check section checksums before loading
+        batch_size: Chunks written per call
+
+    Returns:
+        Dict with 'chunks' and 'files'
+    """
+    snapshot = Snapshot(path)
+    try:
+        header = snapshot.header
+        if header["embedding_model"] != EMBEDDING_MODEL:
+            raise ValueError(
+                f"Snapshot was embedded with {header['embedding_model']}, "
+                f"but EMBEDDING_MODEL is {EMBEDDING_MODEL}"
+            )
+        if verify:
+            snapshot.verify()
+        if not vsm.vector_store:
+            vsm.create_or_load()
+        if vsm.get_collection_count() or vsm.list_indexed_files():
+            if not replace:
+                raise ValueError("The vector store is not empty; import with --replace to overwrite it")
+            vsm.delete_collection()
+
+        vectors = snapshot.vectors
+        for start in range(0, snapshot.count, batch_size):
+            stop = min(start + batch_size, snapshot.count)
+            docs = [
+                Document(page_content=text, metadata=meta)
+                for text, meta in zip(snapshot.strings("text", start, stop),
+                                      snapshot.metadatas(start, stop))
+            ]
+            for cid, doc in zip(snapshot.strings("ids", start, stop), docs):
+                doc.metadata["chunk_id"] = cid
+            vsm.add_embedded_documents(docs, vectors[start:stop].astype(np.float32).tolist())
+
+        manifest = snapshot.manifest()
+        vsm.manifest.load(manifest)
+        if vsm.router:
+            vsm.router.register(vsm.manifest.filenames())
+        vsm.manifest.bump_generation()
+        vsm.save_lexical_index()
+        return {"chunks": snapshot.count, "files": len(manifest["files"])}
+    finally:
+        snapshot.close()
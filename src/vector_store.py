@@ -1,88 +1,439 @@
 """
-ChromaDB vector store management with incremental indexing
+Vector store management (ChromaDB or flat memory-mapped) with incremental indexing
 """
-from langchain_chroma import Chroma
-from src.embeddings import get_embeddings
-from config.settings import VECTOR_STORE_DIR, COLLECTION_NAME
+from langchain_core.documents import Document
+from src.chunker import Chunk
+from src.flat_store import FlatVectorStore
+from src.ivfpq import IVFPQVectorStore
+from src.sharded_store import ShardedVectorStore, ShardRouter, source_key
+from src.embeddings import get_embeddings, LazyEmbeddings
+from src.embedding_cache import EmbeddingCache, CachedEmbeddings
+from src.manifest import ManifestStore, hash_file, rehash_files, normalize_hash, backend_store_dir, manifest_path
+from src.lexical_index import LexicalIndex, reciprocal_rank_fusion, has_exact_terms
+from config.settings import (
+    COLLECTION_NAME, EMBEDDING_MODEL, EMBEDDING_CACHE_ENABLED,
+    HYBRID_SEARCH_ENABLED, HYBRID_CANDIDATES,
+    VECTOR_BACKEND, FLAT_STORE_DTYPE, VECTOR_SHARDS
+)
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import hashlib
 from tqdm import tqdm
 
+# Max ids per Chroma delete call
+DELETE_BATCH_SIZE = 5000
+# Chunks read per Chroma get() when rebuilding the lexical index
+SCAN_BATCH_SIZE = 5000
+
+
+def chunk_id(chunk):
+    """Deterministic id from (source file, page, offset in page, content hash)."""
+    meta = chunk.metadata
+    source = source_key(meta.get("source_file", ""))
+    content = hashlib.sha1(chunk.page_content.encode("utf-8")).hexdigest()[:16]
+    return f"{source}-{meta.get('page', 0)}-{meta.get('start_index', 0)}-{content}"
+
+
+def as_documents(chunks):
+    """LangChain Documents for Chunk records; Documents pass through unchanged."""
+    return [chunk.to_document() if isinstance(chunk, Chunk) else chunk for chunk in chunks]
+
+
+def _stat_key(stat):
+    """Fields of os.stat() that identify an unchanged file."""
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
 
 class VectorStoreManager:
-    """Manages ChromaDB vector store operations with file tracking"""
+    """
+    Manages vector store operations with file tracking.
+    
+    VECTOR_BACKEND selects Chroma, the memory-mapped FlatVectorStore, or
+    IVFPQVectorStore (the flat store searched through an IVF-PQ index, in
+    the same directory). All are driven through the same calls (vector_store for LangChain-style
+    methods, collection for raw upsert/query/count); the file manifest and
+    lexical index are kept next to the selected store.
+    
+    With VECTOR_SHARDS > 1 the store is split into shard_NN subdirectories
+    behind a ShardedVectorStore; the manifest and lexical index stay shared.
+    """
     
     def __init__(self):
-        self.embeddings = get_embeddings()
+        if VECTOR_BACKEND not in ("chroma", "flat", "ivfpq"):
+            raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+        self.backend = VECTOR_BACKEND
+        self.store_dir = backend_store_dir(self.backend)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.lexical_index_path = self.store_dir / "bm25_index.pkl"
+        
+        # The embedding model is only loaded once something is embedded
+        self.embeddings = LazyEmbeddings(self._load_embeddings)
+        self.embedding_cache = None
         self.vector_store = None
-        self.index_log_path = VECTOR_STORE_DIR / "indexed_files.json"
-        self.indexed_files = self._load_index_log()
-    
-    def _load_index_log(self):
-        """Load log of previously indexed files."""
-        if self.index_log_path.exists():
-            with open(self.index_log_path, 'r') as f:
-                return json.load(f)
-        return {}
-    
-    def _save_index_log(self):
-        """Save log of indexed files."""
-        self.index_log_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.index_log_path, 'w') as f:
-            json.dump(self.indexed_files, f, indent=2)
-    
-    def _file_hash(self, filepath):
-        """Generate hash of file for change detection."""
-        hash_md5 = hashlib.md5()
-        with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        self.collection = None
+        self.manifest = ManifestStore(manifest_path(self.backend))
+        self.manifest.import_legacy(
+            self.store_dir / "indexed_files.json",
+            self.store_dir / "chunk_manifest.json"
+        )
+        # path -> (stat, hash) computed during change detection
+        self._file_hashes = {}
+        self._pending_updates = {}
+        
+        self.router = ShardRouter(VECTOR_SHARDS) if VECTOR_SHARDS > 1 else None
+        self._check_shard_layout()
+        
+        self.lexical_index = None
+        self._lexical_mtime = None
+        self._lexical_synced = False
+        self._search_executor = None
+        if HYBRID_SEARCH_ENABLED:
+            self.lexical_index = LexicalIndex.load(self.lexical_index_path)
+            self._lexical_mtime = self._lexical_index_mtime()
     
-    def is_file_indexed(self, pdf_path):
-        """Check if file is already indexed and unchanged."""
-        filename = Path(pdf_path).name
+    def _check_shard_layout(self):
+        """Refuse to open a store indexed with different shard routing."""
+        layout = self.router.layout() if self.router else {"shards": 1, "groups": {}}
+        if not self.manifest.filenames():
+            self.manifest.set_meta("shard_layout", json.dumps(layout))
+            return
+        recorded = self.manifest.get_meta("shard_layout")
+        # Stores indexed before sharding existed are a single shard
+        recorded = json.loads(recorded) if recorded else {"shards": 1, "groups": {}}
+        if recorded != layout:
+            raise ValueError(
+                f"Vector store was indexed with {recorded} but VECTOR_SHARDS/SHARD_GROUPS "
+                f"give {layout}; run 'python3 main.py reset' and re-index"
+            )
+    
+    def _load_embeddings(self):
+        embeddings = get_embeddings()
+        if EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = EmbeddingCache(EMBEDDING_MODEL)
+            embeddings = CachedEmbeddings(embeddings, self.embedding_cache)
+        return embeddings
+    
+    def _fingerprint(self, pdf_path):
+        """Stat and content hash of a file, reusing a hash from change detection."""
+        stat = os.stat(pdf_path)
+        cached = self._file_hashes.pop(str(pdf_path), None)
+        if cached and _stat_key(cached[0]) == _stat_key(stat):
+            return stat, cached[1]
+        return stat, hash_file(pdf_path)
+    
+    def find_changed_files(self, pdf_paths):
+        """
+        Return the PDFs that are new or changed since they were indexed.
         
-        if filename not in self.indexed_files:
-            return False
+        Files are stat'ed first; content is only hashed (in parallel) when
+        the size matches but mtime or inode differ.
+        """
+        records = self.manifest.files()
+        changed = []
+        suspects = []
+        for path in pdf_paths:
+            record = records.get(Path(path).name)
+            if record is None:
+                changed.append(path)
+                continue
+            stat = os.stat(path)
+            if (record.size, record.mtime_ns, record.inode) == _stat_key(stat):
+                continue
+            if record.size is not None and record.size != stat.st_size:
+                changed.append(path)
+                continue
+            suspects.append((path, stat, record))
+        
+        if suspects:
+            current = rehash_files([(path, record.hash) for path, _, record in suspects])
+            touched = []
+            for (path, stat, record), file_hash in zip(suspects, current):
+                if file_hash == normalize_hash(record.hash):
+                    touched.append((record.filename, stat))
+                else:
+                    self._file_hashes[str(path)] = (stat, file_hash)
+                    changed.append(path)
+            if touched:
+                self.manifest.update_stats(touched)
         
-        current_hash = self._file_hash(pdf_path)
-        return self.indexed_files[filename] == current_hash
+        return changed
+    
+    def is_file_indexed(self, pdf_path):
+        """Check if file is already indexed and unchanged."""
+        return not self.find_changed_files([pdf_path])
     
-    def mark_file_indexed(self, pdf_path):
-        """Mark file as indexed with its hash."""
+    def mark_file_indexed(self, pdf_path, pages=None):
+        """
+        Record a file as indexed with its fingerprint.
+        
+        Args:
+            pdf_path: Path to the source PDF
+            pages: Chunk ids per page (defaults to the ones already recorded)
+        """
         filename = Path(pdf_path).name
-        self.indexed_files[filename] = self._file_hash(pdf_path)
-        self._save_index_log()
+        if pages is None:
+            pages = self.manifest.chunk_ids(filename)
+        stat, file_hash = self._fingerprint(pdf_path)
+        self.manifest.commit_file(filename, pdf_path, stat, file_hash, pages)
     
     def create_or_load(self):
         """Load existing vector store or create new one."""
-        print(f"Loading vector store from {VECTOR_STORE_DIR}...")
+        print(f"Loading vector store from {self.store_dir}...")
+        
+        if self.router:
+            self.router.register(self.manifest.filenames())
+            self.vector_store = ShardedVectorStore(
+                lambda shard: self._open_store(self.shard_dir(shard)),
+                self.router, embedding_function=self.embeddings
+            )
+            self.collection = self.vector_store
+            print(f"✓ Vector store loaded: {COLLECTION_NAME} ({self.backend}, "
+                  f"{len(self.vector_store)} shards)")
+        else:
+            self.vector_store, self.collection = self._open_store(self.store_dir)
+            print(f"✓ Vector store loaded: {COLLECTION_NAME} ({self.backend})")
+        return self.vector_store
+    
+    def _open_store(self, store_dir):
+        """Open one store of the configured backend; returns (vector_store, collection)."""
+        if self.backend in ("flat", "ivfpq"):
+            store_class = IVFPQVectorStore if self.backend == "ivfpq" else FlatVectorStore
+            store = store_class(store_dir, embedding_function=self.embeddings, dtype=FLAT_STORE_DTYPE)
+            return store, store
         
-        self.vector_store = Chroma(
+        from langchain_chroma import Chroma
+        store = Chroma(
             collection_name=COLLECTION_NAME,
             embedding_function=self.embeddings,
-            persist_directory=str(VECTOR_STORE_DIR)
+            persist_directory=str(store_dir)
         )
+        return store, store._collection
+    
+    def shard_dir(self, shard):
+        return self.store_dir / f"shard_{shard:02d}"
+    
+    def shard_of(self, pdf_path):
+        """Shard a file's chunks are stored in (None when the store is not sharded)."""
+        return self.router.shard_of_file(Path(pdf_path).name) if self.router else None
+    
+    def shard_stats(self):
+        """
+        Per-shard chunk and file counts.
         
-        print(f"✓ Vector store loaded: {COLLECTION_NAME}")
-        return self.vector_store
+        Returns:
+            List of {'shard', 'chunks', 'files'} dicts (empty when not sharded)
+        """
+        if not self.router:
+            return []
+        if not self.vector_store:
+            self.create_or_load()
+        files = [0] * len(self.vector_store)
+        for filename in self.manifest.filenames():
+            files[self.router.shard_of_file(filename)] += 1
+        return [
+            {"shard": shard, "chunks": chunks, "files": files[shard]}
+            for shard, chunks in enumerate(self.vector_store.shard_counts())
+        ]
+    
+    def rebuild_shard(self, shard):
+        """
+        Empty one shard and forget its files so they are re-indexed from scratch.
+        
+        Queries keep being answered from the other shards throughout. The
+        embedding cache makes re-adding the files cheap.
+        
+        Args:
+            shard: Shard number
+        
+        Returns:
+            Paths of the shard's files that still exist, to pass to the indexer
+        """
+        if not self.router:
+            raise ValueError("The vector store is not sharded (VECTOR_SHARDS = 1)")
+        if not self.vector_store:
+            self.create_or_load()
+        
+        filenames = [
+            filename for filename in set(self.manifest.filenames()) | set(self.manifest.pending_files())
+            if self.router.shard_of_file(filename) == shard
+        ]
+        records = self.manifest.files()
+        paths = [records[f].path for f in filenames if f in records and records[f].path]
+        ids = [cid for f in filenames for page_ids in self.manifest.chunk_ids(f).values() for cid in page_ids]
+        
+        lexical_index = self._lexical_index_for_write()
+        self.vector_store.reset_shard(shard)
+        if lexical_index is not None:
+            for cid in ids:
+                lexical_index.remove(cid)
+        self.manifest.forget_files(filenames)
+        self.manifest.bump_generation()
+        self.save_lexical_index()
+        print(f"✓ Emptied shard {shard}: {len(ids)} chunks from {len(filenames)} file(s)")
+        return [path for path in paths if os.path.exists(path)]
+    
+    def compact_shard(self, shard):
+        """
+        Reclaim space held by deleted chunks in one shard.
+        
+        Flat and IVF-PQ shards are compacted in place; Chroma has no
+        compaction, so its shards are compacted by rebuilding them.
+        
+        Returns:
+            Paths to re-index (only for a Chroma shard)
+        """
+        if not self.router:
+            raise ValueError("The vector store is not sharded (VECTOR_SHARDS = 1)")
+        if self.backend == "chroma":
+            return self.rebuild_shard(shard)
+        if not self.vector_store:
+            self.create_or_load()
+        self.vector_store.collections[shard].compact()
+        print(f"✓ Compacted shard {shard}")
+        return []
+    
+    def plan_file_update(self, pdf_path, chunks, force=False, complete=True):
+        """
+        Diff a file's fresh chunks against its page manifest.
+        
+        Assigns deterministic ids to the chunks and holds the new manifest
+        until commit_file_update() is called for the file. A file chunked in
+        page-range shards is planned one shard at a time: pass complete=False
+        for every shard but the last, so changed chunks can be written before
+        the whole file has been extracted.
+        
+        Args:
+            pdf_path: Path to the source PDF
+            chunks: Chunk records or Documents currently extracted from the file
+                (or one shard of it)
+            force: Rewrite every chunk, not just new or changed ones
+            complete: Whether these are the file's last chunks
+        
+        Returns:
+            Tuple of (chunks to embed and write, number of stale chunks;
+            0 until the file is complete)
+        """
+        filename = Path(pdf_path).name
+        chunks = as_documents(chunks)
+        
+        update = self._pending_updates.get(filename)
+        if update is None:
+            old_ids = {cid for ids in self.manifest.chunk_ids(filename).values() for cid in ids}
+            # A file still pending from an earlier run was interrupted (or indexed
+            # before chunk ids were deterministic) and may have unrecorded chunks.
+            sweep = self.manifest.is_pending(filename)
+            self.manifest.mark_pending(filename)
+            update = self._pending_updates[filename] = {
+                "pages": {}, "old_ids": old_ids, "stale_ids": None, "sweep": sweep
+            }
+        
+        pages = update["pages"]
+        for chunk in chunks:
+            cid = chunk_id(chunk)
+            chunk.metadata["chunk_id"] = cid
+            pages.setdefault(str(chunk.metadata.get("page", 0)), []).append(cid)
+        
+        stale = 0
+        if complete:
+            new_ids = {cid for ids in pages.values() for cid in ids}
+            update["stale_ids"] = update["old_ids"] - new_ids
+            stale = len(update["stale_ids"])
+        
+        if force:
+            return chunks, stale
+        old_ids = update["old_ids"]
+        return [chunk for chunk in chunks if chunk.metadata["chunk_id"] not in old_ids], stale
+    
+    def discard_file_update(self, pdf_path):
+        """
+        Drop a planned update that will not be completed.
+        
+        The file stays pending in the manifest, so its next update sweeps
+        any chunks already written.
+        """
+        self._pending_updates.pop(Path(pdf_path).name, None)
+    
+    def commit_file_update(self, pdf_path):
+        """
+        Finish a planned update: delete stale chunks and save the manifest.
+        
+        Call only after the chunks returned by plan_file_update() are written
+        and its last call was made with complete=True.
+        """
+        filename = Path(pdf_path).name
+        update = self._pending_updates.pop(filename)
+        pages, stale_ids = update["pages"], update["stale_ids"]
+        
+        if update["sweep"]:
+            if not self.vector_store:
+                self.create_or_load()
+            new_ids = {cid for ids in pages.values() for cid in ids}
+            existing = self.vector_store.get(where={"source_file": filename}, include=[])["ids"]
+            stale_ids = stale_ids | (set(existing) - new_ids)
+        
+        self.delete_chunks(stale_ids)
+        self.mark_file_indexed(pdf_path, pages)
+    
+    def remove_file(self, pdf_path):
+        """
+        Delete every chunk of a file and forget it (the PDF was deleted or moved away).
+        
+        Returns:
+            Number of chunks deleted
+        """
+        filename = Path(pdf_path).name
+        ids = {cid for page_ids in self.manifest.chunk_ids(filename).values() for cid in page_ids}
+        if self.manifest.is_pending(filename):
+            # An interrupted update may have written chunks the manifest never recorded
+            if not self.vector_store:
+                self.create_or_load()
+            ids.update(self.vector_store.get(where={"source_file": filename}, include=[])["ids"])
+        
+        self.delete_chunks(ids)
+        self.manifest.forget_files([filename])
+        self.manifest.bump_generation()
+        self.save_lexical_index()
+        return len(ids)
+    
+    def delete_chunks(self, ids):
+        """Delete chunks by id."""
+        ids = list(ids)
+        if not ids:
+            return
+        if not self.vector_store:
+            self.create_or_load()
+        lexical_index = self._lexical_index_for_write()
+        
+        for i in range(0, len(ids), DELETE_BATCH_SIZE):
+            self.vector_store.delete(ids=ids[i:i + DELETE_BATCH_SIZE])
+        if lexical_index is not None:
+            for cid in ids:
+                lexical_index.remove(cid)
+        self.manifest.bump_generation()
     
     def add_documents(self, chunks, source_file=None, batch_size=100):
         """
         Add document chunks to vector store in batches with progress bar.
         
+        With a source_file, only chunks that are new or changed since the
+        file was last indexed are written and vanished ones are deleted.
+        
         Args:
-            chunks: List of LangChain Document objects
+            chunks: List of Chunk records or LangChain Document objects
             source_file: Optional path to source PDF for tracking
             batch_size: Number of chunks to process at once
         """
         if not self.vector_store:
             self.create_or_load()
+        lexical_index = self._lexical_index_for_write()
         
-        total_batches = (len(chunks) - 1) // batch_size + 1
         file_name = Path(source_file).name if source_file else "documents"
+        chunks = as_documents(chunks)
+        if source_file:
+            chunks, stale = self.plan_file_update(source_file, chunks)
+            print(f"\n{file_name}: {len(chunks)} new/changed chunks, {stale} stale")
         
         print(f"\nIndexing {len(chunks)} chunks from {file_name}")
         
@@ -91,19 +442,57 @@ class VectorStoreManager:
             for i in range(0, len(chunks), batch_size):
                 batch = chunks[i:i + batch_size]
                 
-                ids = self.vector_store.add_documents(batch)
+                ids = self.vector_store.add_documents(
+                    batch, ids=[chunk.metadata.get("chunk_id") or chunk_id(chunk) for chunk in batch]
+                )
                 all_ids.extend(ids)
+                if lexical_index is not None:
+                    for cid, chunk in zip(ids, batch):
+                        lexical_index.add(cid, chunk.page_content)
                 
                 pbar.update(len(batch))
         
+        if all_ids:
+            self.manifest.bump_generation()
+        
         print(f"✓ Successfully indexed {len(all_ids)} chunks\n")
         
-        # Mark file as indexed if source provided
+        # Delete stale chunks and mark file as indexed if source provided
         if source_file:
-            self.mark_file_indexed(source_file)
+            self.commit_file_update(source_file)
+        self.save_lexical_index()
         
         return all_ids
     
+    def add_embedded_documents(self, chunks, embeddings):
+        """
+        Upsert chunks whose embeddings were already computed upstream.
+        
+        Args:
+            chunks: List of Chunk records or LangChain Document objects
+            embeddings: One embedding vector per chunk
+        
+        Returns:
+            List of chunk ids written
+        """
+        if not self.vector_store:
+            self.create_or_load()
+        lexical_index = self._lexical_index_for_write()
+        chunks = as_documents(chunks)
+        
+        ids = [chunk.metadata.get("chunk_id") or chunk_id(chunk) for chunk in chunks]
+        self.collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=[chunk.page_content for chunk in chunks],
+            metadatas=[chunk.metadata for chunk in chunks]
+        )
+        if lexical_index is not None:
+            for cid, chunk in zip(ids, chunks):
+                lexical_index.add(cid, chunk.page_content)
+        self.manifest.bump_generation()
+        return ids
+    
     def similarity_search(self, query, k=3):
         """Retrieve k most similar chunks."""
         if not self.vector_store:
@@ -111,24 +500,234 @@ class VectorStoreManager:
         
         return self.vector_store.similarity_search(query, k=k)
     
+    def similarity_search_by_vector(self, embedding, k=3, filter=None):
+        """Retrieve k chunks most similar to a query embedding."""
+        if not self.vector_store:
+            self.create_or_load()
+        
+        return self.vector_store.similarity_search_by_vector(embedding, k=k, filter=filter)
+    
+    def similarity_search_by_vectors(self, embeddings, k=3, filter=None):
+        """
+        Retrieve the k most similar chunks for many query embeddings at once.
+        
+        Returns:
+            One list of LangChain Document objects per embedding
+        """
+        if not self.vector_store:
+            self.create_or_load()
+        if not len(embeddings):
+            return []
+        
+        results = self.collection.query(
+            query_embeddings=[list(map(float, e)) for e in embeddings],
+            n_results=k,
+            where=filter,
+            include=["documents", "metadatas"]
+        )
+        return [
+            [Document(page_content=text, metadata=meta or {}, id=cid)
+             for cid, text, meta in zip(ids, texts, metas)]
+            for ids, texts, metas in zip(results["ids"], results["documents"], results["metadatas"])
+        ]
+    
+    def get_chunks(self, ids):
+        """Fetch chunks by id, in the given order (missing ids are skipped)."""
+        if not self.vector_store:
+            self.create_or_load()
+        if not ids:
+            return []
+        
+        result = self.vector_store.get(ids=list(ids), include=["documents", "metadatas"])
+        found = {
+            cid: Document(page_content=text, metadata=meta or {}, id=cid)
+            for cid, text, meta in zip(result["ids"], result["documents"], result["metadatas"])
+        }
+        return [found[cid] for cid in ids if cid in found]
+    
+    def hybrid_search(self, query, embedding, k=3, filter=None, candidates=HYBRID_CANDIDATES):
+        """
+        Retrieve k chunks by fusing vector and BM25 rankings.
+        
+        The vector query runs on a worker thread while BM25 is scored on the
+        calling thread; the two candidate lists are merged with reciprocal-rank
+        fusion. Falls back to vector search alone when hybrid search is
+        disabled or a metadata filter is given (BM25 cannot apply one).
+        
+        Args:
+            query: Query text, for BM25
+            embedding: Query embedding, for vector search
+            k: Number of chunks to return
+            filter: Optional Chroma metadata filter
+            candidates: Candidates taken from each ranking before fusion
+        
+        Returns:
+            List of LangChain Document objects
+        """
+        if self.lexical_index is None or filter:
+            return self.similarity_search_by_vector(embedding, k=k, filter=filter)
+        
+        n = max(k, candidates)
+        dense = self._get_search_executor().submit(self.similarity_search_by_vector, embedding, n)
+        lexical = self._search_lexical(query, n)
+        return self._fuse([query], [dense.result()], [lexical], k)[0]
+    
+    def hybrid_search_by_vectors(self, queries, embeddings, k=3, candidates=HYBRID_CANDIDATES):
+        """
+        Batched hybrid_search(): one multi-query vector call plus BM25 per query.
+        
+        Returns:
+            One list of LangChain Document objects per query
+        """
+        if self.lexical_index is None:
+            return self.similarity_search_by_vectors(embeddings, k=k)
+        
+        n = max(k, candidates)
+        dense = self._get_search_executor().submit(self.similarity_search_by_vectors, embeddings, n)
+        lexical = [self._search_lexical(query, n) for query in queries]
+        return self._fuse(queries, dense.result(), lexical, k)
+    
+    def _search_lexical(self, query, k):
+        self._sync_lexical_index()
+        return [cid for cid, _ in self.lexical_index.search(query, k)]
+    
+    def _fuse(self, queries, dense_results, lexical_results, k):
+        """
+        Merge per-query rankings, fetching lexical-only hits from Chroma in one call.
+        
+        Rank ties go to BM25 when the query names a part number or error code,
+        and to vector search otherwise.
+        """
+        docs = {}
+        rankings = []
+        for query, dense, lexical in zip(queries, dense_results, lexical_results):
+            dense_ids = []
+            for doc in dense:
+                cid = doc.metadata.get("chunk_id") or doc.id
+                docs[cid] = doc
+                dense_ids.append(cid)
+            order = [lexical, dense_ids] if has_exact_terms(query) else [dense_ids, lexical]
+            rankings.append(reciprocal_rank_fusion(order)[:k])
+        
+        missing = list({cid for ranking in rankings for cid in ranking if cid not in docs})
+        for doc in self.get_chunks(missing):
+            docs[doc.id] = doc
+        return [[docs[cid] for cid in ranking if cid in docs] for ranking in rankings]
+    
+    def _get_search_executor(self):
+        if self._search_executor is None:
+            self._search_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="vector-search")
+        return self._search_executor
+    
+    def _lexical_index_mtime(self):
+        try:
+            return os.stat(self.lexical_index_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def _sync_lexical_index(self):
+        """
+        Keep a reader's BM25 index in step with the collection.
+        
+        Reloads the saved index when another process has rewritten it, and
+        rebuilds from Chroma when no index was ever saved for this collection.
+        A saved index that is merely behind (an indexing run is still in
+        progress) is used as is until the writer saves it.
+        """
+        if self.lexical_index.dirty or self.lexical_index.generation == self.generation:
+            return
+        
+        mtime = self._lexical_index_mtime()
+        if mtime != self._lexical_mtime:
+            self.lexical_index = LexicalIndex.load(self.lexical_index_path)
+            self._lexical_mtime = mtime
+        if self.lexical_index.generation is None:
+            self.rebuild_lexical_index()
+    
+    def _lexical_index_for_write(self):
+        """Lexical index to update, first caught up if a previous run crashed."""
+        if self.lexical_index is None:
+            return None
+        if not self._lexical_synced:
+            self.sync_lexical_index()
+        return self.lexical_index
+    
+    def sync_lexical_index(self):
+        """Rebuild the saved lexical index if it is behind the collection."""
+        if self.lexical_index is None:
+            return
+        self._lexical_synced = True
+        if not self.lexical_index.dirty and self.lexical_index.generation != self.generation:
+            self.rebuild_lexical_index()
+    
+    def rebuild_lexical_index(self):
+        """Rebuild the BM25 index from every chunk in the collection and save it."""
+        if not self.vector_store:
+            self.create_or_load()
+        
+        generation = self.generation
+        index = LexicalIndex()
+        offset = 0
+        while True:
+            batch = self.vector_store.get(include=["documents"], limit=SCAN_BATCH_SIZE, offset=offset)
+            for cid, text in zip(batch["ids"], batch["documents"]):
+                index.add(cid, text or "")
+            if len(batch["ids"]) < SCAN_BATCH_SIZE:
+                break
+            offset += SCAN_BATCH_SIZE
+        
+        self.lexical_index = index
+        self._save_lexical_index(generation)
+        print(f"✓ Rebuilt lexical index: {len(index)} chunks")
+    
+    def save_lexical_index(self):
+        """Persist lexical index changes made by this process."""
+        if self.lexical_index is not None and self.lexical_index.dirty:
+            self._save_lexical_index(self.generation)
+    
+    def _save_lexical_index(self, generation):
+        self.lexical_index.save(self.lexical_index_path, generation)
+        self._lexical_mtime = self._lexical_index_mtime()
+    
+    def embed_queries(self, queries):
+        """Embed many queries in one call, bypassing the chunk embedding cache."""
+        engine = self.embeddings.engine
+        if isinstance(engine, CachedEmbeddings):
+            engine = engine.embeddings
+        return engine.embed_documents(list(queries))
+    
+    @property
+    def generation(self):
+        """Collection generation; changes whenever chunks are added or deleted."""
+        return self.manifest.generation()
+    
     def get_collection_count(self):
         """Get number of documents in collection."""
         if not self.vector_store:
             self.create_or_load()
         
-        return self.vector_store._collection.count()
+        return self.collection.count()
     
     def delete_collection(self):
-        """Delete the entire collection and index log."""
+        """Delete every chunk and the index log; the store stays usable for new chunks."""
         if self.vector_store:
-            self.vector_store.delete_collection()
+            if hasattr(self.vector_store, "reset_collection"):
+                self.vector_store.reset_collection()
+                self.collection = self.vector_store._collection
+            else:
+                self.vector_store.delete_collection()
             print(f"✓ Deleted collection: {COLLECTION_NAME}")
         
-        # Clear index log
-        self.indexed_files = {}
-        self._save_index_log()
-        print("✓ Cleared index log")
+        # Clear file manifest
+        self.manifest.clear()
+        self.manifest.bump_generation()
+        print("✓ Cleared index manifest")
+        
+        if self.lexical_index is not None:
+            self.lexical_index.clear()
+            self._save_lexical_index(self.generation)
+            print("✓ Cleared lexical index")
     
     def list_indexed_files(self):
         """Return list of indexed files."""
-        return list(self.indexed_files.keys())
+        return self.manifest.filenames()
@@ -0,0 +1,344 @@
+"""
+Watch mode: keep the index in step with DATA_DIR as PDFs are added, changed or removed (main.py watch)
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import json
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from src import metrics
+from config.settings import (
+    DATA_DIR, WATCH_BACKEND, WATCH_DEBOUNCE_SECONDS, WATCH_POLL_INTERVAL, WATCH_STATUS_PATH
+)
+
+# inotify(7) event flags
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+# Bytes at the end of a PDF searched for its %%EOF marker
+PDF_TAIL_BYTES = 1024
+
+
+def is_watched(name):
+    """Same files as the index command's glob('*.pdf')."""
+    return fnmatch.fnmatch(name, "*.pdf") and not name.startswith(".")
+
+
+def is_complete_pdf(path):
+    """False for a PDF that is still being written (no %%EOF near its end yet)."""
+    try:
+        with open(path, "rb") as f:
+            f.seek(max(0, os.fstat(f.fileno()).st_size - PDF_TAIL_BYTES))
+            return b"%%EOF" in f.read()
+    except OSError:
+        return False
+
+
+class InotifyWatcher:
+    """Directory change events from Linux inotify, read through ctypes."""
+
+    name = "inotify"
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(str(directory)), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"Cannot watch {directory}: {os.strerror(errno)}")
+
+    def read(self, timeout):
+        """
+        Wait up to timeout seconds (None: forever) for events.
+
+        Returns:
+            Set of names of PDFs that changed, or None if events were lost
+            and the directory must be rescanned
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    raise RuntimeError("The watched directory was deleted or moved")
+                if is_watched(name):
+                    names.add(name)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Change detection by comparing stat() of every PDF between periodic scans."""
+
+    name = "poll"
+
+    def __init__(self, directory, interval=WATCH_POLL_INTERVAL):
+        self.directory = Path(directory)
+        self.interval = interval
+        self._stats = self._scan()
+        self._next = time.monotonic() + interval
+
+    def _scan(self):
+        with os.scandir(self.directory) as entries:
+            return {
+                entry.name: (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+                for entry in entries if is_watched(entry.name)
+                for stat in [entry.stat()]
+            }
+
+    def read(self, timeout):
+        wait = self._next - time.monotonic()
+        if timeout is not None and timeout < wait:
+            time.sleep(max(0.0, timeout))
+            return set()
+        time.sleep(max(0.0, wait))
+        self._next = time.monotonic() + self.interval
+        stats = self._scan()
+        changed = {name for name in stats.keys() | self._stats.keys()
+                   if stats.get(name) != self._stats.get(name)}
+        self._stats = stats
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(directory, backend=WATCH_BACKEND):
+    """inotify where available (unless backend = "poll"), otherwise polling."""
+    if backend not in ("auto", "inotify", "poll"):
+        raise ValueError(f"Unknown WATCH_BACKEND: {backend}")
+    if backend != "poll":
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            if backend == "inotify":
+                raise
+            print(f"  inotify unavailable ({e}); polling every {WATCH_POLL_INTERVAL:g}s")
+    return PollingWatcher(directory)
+
+
+class DocumentWatcher:
+    """
+    Long-running incremental indexer driven by file system events.
+
+    Every event only marks a file as pending. A file is processed once it
+    has had no events for the debounce period, its size and mtime are the
+    same as at its last event and, if it still exists, it ends in a PDF
+    %%EOF marker, so bursts of writes and half-copied files are indexed
+    once, when complete. Files that exist go through find_changed_files()
+    and the indexing pipeline (only changed chunks are embedded); files
+    that are gone have their chunks deleted. Between events the process
+    blocks in select() (or sleeps between polls), so it uses no CPU while
+    idle.
+
+    Queue depth and lag are written to WATCH_STATUS_PATH after every change
+    (see main.py watch --status), and the delay from a file's first event
+    to it being searchable is recorded as the 'watch_lag' metrics stage.
+    """
+
+    def __init__(self, vsm, chunk_size, chunk_overlap, directory=DATA_DIR,
+                 debounce=WATCH_DEBOUNCE_SECONDS, backend=WATCH_BACKEND, status_path=WATCH_STATUS_PATH):
+        """
+        Args:
+            vsm: Loaded VectorStoreManager
+            chunk_size: Characters per chunk
+            chunk_overlap: Overlap between chunks
+            directory: Directory of PDFs to watch
+            debounce: Quiet seconds after a file's last event before it is processed
+            backend: "auto", "inotify" or "poll"
+            status_path: JSON file receiving queue depth and lag, or None
+        """
+        self.vsm = vsm
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.directory = Path(directory)
+        self.debounce = debounce
+        self.backend = backend
+        self.status_path = Path(status_path) if status_path else None
+        self.watcher = None
+        # filename -> {'first', 'last' (event times), 'stat' (at the last event), 'incomplete'}
+        self.pending = {}
+        self.totals = {"indexed": 0, "removed": 0, "failed": 0, "chunks": 0}
+        self.last_batch = None
+
+    def _stat(self, name):
+        try:
+            stat = os.stat(self.directory / name)
+        except FileNotFoundError:
+            return None
+        return (stat.st_size, stat.st_mtime_ns)
+
+    def note(self, names, now=None):
+        """Mark files as changed now."""
+        now = time.monotonic() if now is None else now
+        for name in names:
+            entry = self.pending.setdefault(name, {"first": now, "incomplete": False})
+            entry["last"] = now
+            entry["stat"] = self._stat(name)
+
+    def rescan(self):
+        """Queue every PDF on disk and every indexed file no longer on disk."""
+        with os.scandir(self.directory) as entries:
+            on_disk = {entry.name for entry in entries if is_watched(entry.name)}
+        self.note(on_disk | (set(self.vsm.list_indexed_files()) - on_disk)
+                  | set(self.vsm.manifest.pending_files()))
+
+    def take_ready(self, now=None):
+        """Remove and return files that have settled; waiting ones are kept."""
+        now = time.monotonic() if now is None else now
+        ready = {}
+        for name, entry in list(self.pending.items()):
+            if now - entry["last"] < self.debounce:
+                continue
+            stat = self._stat(name)
+            if stat != entry["stat"]:
+                # Changed without an event reaching us yet (or between polls)
+                entry["last"], entry["stat"] = now, stat
+                continue
+            if stat is not None and not is_complete_pdf(self.directory / name):
+                if not entry["incomplete"]:
+                    entry["incomplete"] = True
+                    print(f"  Waiting for {name} to be completely written")
+                # Checked again on its next event
+                entry["last"] = float("inf")
+                continue
+            ready[name] = self.pending.pop(name)
+        return ready
+
+    def next_timeout(self, now=None):
+        """Seconds until the next pending file may settle, or None if nothing is waiting."""
+        now = time.monotonic() if now is None else now
+        waits = [entry["last"] + self.debounce - now for entry in self.pending.values()
+                 if entry["last"] != float("inf")]
+        return max(0.0, min(waits)) if waits else None
+
+    def process(self, ready):
+        """Index or remove settled files."""
+        from src.indexing_pipeline import run_indexing_pipeline
+
+        start = time.perf_counter()
+        present = [str(self.directory / name) for name in ready if self._stat(name) is not None]
+        removed = [name for name in ready if self._stat(name) is None]
+        indexed = set(self.vsm.list_indexed_files()) | set(self.vsm.manifest.pending_files())
+
+        deleted = 0
+        for name in removed:
+            if name in indexed:
+                chunks = self.vsm.remove_file(name)
+                deleted += chunks
+                self.totals["removed"] += 1
+                print(f"  {name}: removed, {chunks} chunks deleted")
+
+        changed = self.vsm.find_changed_files(present)
+        stats = {"chunks": 0, "failed_files": []}
+        if changed:
+            stats = run_indexing_pipeline(changed, self.vsm, self.chunk_size, self.chunk_overlap)
+        failed = {os.path.basename(path) for path in stats["failed_files"]}
+        self.totals["indexed"] += len(changed) - len(failed)
+        self.totals["failed"] += len(failed)
+        self.totals["chunks"] += stats["chunks"]
+
+        done = time.monotonic()
+        lags = []
+        for name in [os.path.basename(path) for path in changed] + removed:
+            if name not in failed:
+                lags.append(done - ready[name]["first"])
+                metrics.observe("watch_lag", lags[-1], files=1)
+        self.last_batch = {
+            "finished": time.time(), "seconds": round(time.perf_counter() - start, 3),
+            "indexed": len(changed) - len(failed), "removed": len(removed), "failed": sorted(failed),
+            "unchanged": len(present) - len(changed), "chunks": stats["chunks"], "stale": deleted,
+            "max_lag_seconds": round(max(lags), 3) if lags else None,
+        }
+        if changed or removed:
+            print(f"✓ {self.last_batch['indexed']} indexed, {len(removed)} removed, "
+                  f"{len(failed)} failed in {self.last_batch['seconds']:.1f}s"
+                  + (f" (lag {max(lags):.1f}s)" if lags else ""))
+
+    def status(self):
+        """Queue depth and lag, as written to WATCH_STATUS_PATH."""
+        now = time.monotonic()
+        oldest = min((entry["first"] for entry in self.pending.values()), default=None)
+        return {
+            "pid": os.getpid(),
+            "directory": str(self.directory),
+            "backend": self.watcher.name if self.watcher else None,
+            "updated": time.time(),
+            "pending": len(self.pending),
+            "incomplete": sum(entry["incomplete"] for entry in self.pending.values()),
+            # Wall-clock time of the oldest unprocessed event; lag = now - this
+            "oldest_pending_since": time.time() - (now - oldest) if oldest is not None else None,
+            "totals": self.totals,
+            "last_batch": self.last_batch,
+        }
+
+    def write_status(self):
+        if self.status_path is None:
+            return
+        self.status_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.status_path.with_suffix(self.status_path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.status(), f, indent=2)
+        os.replace(tmp_path, self.status_path)
+
+    def run(self, stop=None):
+        """
+        Catch up with changes made while not watching, then process events until stopped.
+
+        Args:
+            stop: Optional threading.Event ending the loop (Ctrl-C also does)
+        """
+        self.watcher = open_watcher(self.directory, self.backend)
+        print(f"Watching {self.directory} ({self.watcher.name}, {self.debounce:g}s debounce)")
+        try:
+            # Start watching before the scan so nothing changed during it is missed
+            self.rescan()
+            self.write_status()
+            while stop is None or not stop.is_set():
+                timeout = self.next_timeout()
+                if stop is not None:
+                    timeout = 1.0 if timeout is None else min(timeout, 1.0)
+                names = self.watcher.read(timeout)
+                if names is None:
+                    print("  Event queue overflowed; rescanning")
+                    self.rescan()
+                else:
+                    self.note(names)
+                ready = self.take_ready()
+                if ready:
+                    self.process(ready)
+                if names or ready or names is None:
+                    self.write_status()
+        finally:
+            self.watcher.close()
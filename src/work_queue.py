@@ -0,0 +1,641 @@
+"""
+Lease-based work queue for indexing with many workers (main.py enqueue / worker)
+"""
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+from src import metrics
+from src.embeddings import get_embeddings, LazyEmbeddings
+from src.embedding_cache import EmbeddingCache, CachedEmbeddings
+from src.manifest import ManifestStore, manifest_path
+from src.pdf_chunker import chunk_pdf_shard, plan_shards
+from src.vector_store import as_documents, chunk_id
+from config.settings import (
+    QUEUE_DB_PATH, QUEUE_STAGING_DIR, QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS,
+    QUEUE_POLL_INTERVAL, PDF_SHARD_PAGES, EMBED_BATCH_SIZE,
+    EMBEDDING_MODEL, EMBEDDING_CACHE_ENABLED
+)
+
+# Lock held by the one worker applying staged results to the vector store
+COMMIT_LOCK = "commit"
+
+
+def worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class CommitLockLost(RuntimeError):
+    """The commit lock expired and another worker took it mid-commit."""
+
+
+class LeaseKeeper:
+    """
+    Renews a lease from a background thread while a block runs.
+
+    'lost' is set once a renewal fails (another worker took the lease over);
+    the block should check it and stop writing.
+    """
+
+    def __init__(self, renew, interval):
+        self.lost = threading.Event()
+        self._renew = renew
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-renew", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            if not self._renew():
+                self.lost.set()
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+class WorkQueue:
+    """
+    Indexing jobs and their tasks in a SQLite file shared by all workers.
+
+    A job is one file to (re)index, split into tasks of at most
+    PDF_SHARD_PAGES pages. A worker claims a task by taking a lease that
+    expires after QUEUE_LEASE_SECONDS unless renewed; a worker that dies
+    simply stops renewing, and its task is handed to the next claimant
+    (up to max_attempts times, so a file that keeps killing its worker
+    fails instead of being retried forever). Every state change after the
+    claim checks that the caller still holds the lease, so a worker that
+    stalled past its lease cannot overwrite a retry's result.
+
+    Uses a rollback journal rather than WAL so the file works on a network
+    filesystem, and wall-clock lease times, so worker clocks must be in
+    sync (NTP).
+    """
+
+    def __init__(self, db_path=QUEUE_DB_PATH, staging_dir=QUEUE_STAGING_DIR,
+                 lease_seconds=QUEUE_LEASE_SECONDS, max_attempts=QUEUE_MAX_ATTEMPTS):
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.staging_dir = Path(staging_dir)
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(db_path), timeout=60, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                force INTEGER NOT NULL DEFAULT 0,
+                parts INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'open',
+                error TEXT,
+                enqueued_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state);
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY,
+                job INTEGER NOT NULL,
+                part INTEGER NOT NULL,
+                start_page INTEGER NOT NULL,
+                end_page INTEGER,
+                state TEXT NOT NULL DEFAULT 'queued',
+                owner TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS tasks_state ON tasks(state, lease_expires);
+            CREATE INDEX IF NOT EXISTS tasks_job ON tasks(job);
+            CREATE TABLE IF NOT EXISTS locks (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+        """)
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    # Producers
+
+    def enqueue(self, pdf_paths, force=False, shard_pages=PDF_SHARD_PAGES):
+        """
+        Add a job per file, split into page-range tasks.
+
+        Files that already have an open job are skipped.
+
+        Returns:
+            Number of jobs added
+        """
+        added = 0
+        for path in pdf_paths:
+            path = os.path.abspath(path)
+            ranges = plan_shards(path, shard_pages)
+            with self.transaction() as db:
+                if db.execute("SELECT 1 FROM jobs WHERE path = ? AND state = 'open'", (path,)).fetchone():
+                    continue
+                job = db.execute(
+                    "INSERT INTO jobs (path, force, parts, enqueued_at) VALUES (?, ?, ?, ?)",
+                    (path, int(force), len(ranges), time.time())
+                ).lastrowid
+                db.executemany(
+                    "INSERT INTO tasks (job, part, start_page, end_page) VALUES (?, ?, ?, ?)",
+                    [(job, part, start, end) for part, (start, end) in enumerate(ranges)]
+                )
+            added += 1
+        return added
+
+    # Workers
+
+    def claim(self, owner):
+        """
+        Lease the oldest queued task, or one whose lease expired.
+
+        A task whose lease expired on its last attempt fails its job: its
+        worker died without reporting an error (killed, out of memory, a
+        crash in the PDF library), and would most likely die again.
+
+        Returns:
+            Task dict ('id', 'job', 'path', 'force', 'part', 'start_page',
+            'end_page', 'attempts') or None if nothing is claimable
+        """
+        now = time.time()
+        with self.transaction() as db:
+            for task_id, job, start_page, attempts in db.execute(
+                "SELECT id, job, start_page, attempts FROM tasks "
+                "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts)
+            ).fetchall():
+                error = f"worker lost its lease {attempts} times (killed or crashed?)"
+                # An earlier task of the same job may have failed it already
+                if db.execute(
+                    "UPDATE tasks SET state = 'failed', error = ? WHERE id = ? AND state = 'leased'",
+                    (error, task_id)
+                ).rowcount:
+                    self._finish_job(db, job, "failed", f"page {start_page + 1}+: {error}")
+
+            row = db.execute(
+                "SELECT t.id, t.job, j.path, j.force, t.part, t.start_page, t.end_page, t.attempts "
+                "FROM tasks t JOIN jobs j ON j.id = t.job "
+                "WHERE t.state = 'queued' OR (t.state = 'leased' AND t.lease_expires < ?) "
+                "ORDER BY t.id LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE tasks SET state = 'leased', owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (owner, now + self.lease_seconds, row[0])
+            )
+        keys = ("id", "job", "path", "force", "part", "start_page", "end_page", "attempts")
+        task = dict(zip(keys, row))
+        task["attempts"] += 1
+        return task
+
+    def renew(self, task_id, owner):
+        """Extend a lease; returns False if it was lost to another worker."""
+        with self.transaction() as db:
+            return db.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                (time.time() + self.lease_seconds, task_id, owner)
+            ).rowcount == 1
+
+    def stage(self, task, owner, chunks, vectors, stat_key):
+        """
+        Atomically publish a task's result for the committer.
+
+        The result is written under a temporary name and renamed into place;
+        the task only moves to 'staged' if owner still holds the lease.
+
+        Args:
+            vectors: One per chunk; None for chunks that were already indexed
+                and so were not embedded
+
+        Returns:
+            True if the result was accepted
+        """
+        embedded = [i for i, vector in enumerate(vectors) if vector is not None]
+        path = self.staging_dir / f"task-{task['id']}-{task['attempts']}.pkl"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"chunks": chunks, "embedded": embedded,
+                         "vectors": np.asarray([vectors[i] for i in embedded], dtype=np.float32),
+                         "stat": stat_key}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+        with self.transaction() as db:
+            accepted = db.execute(
+                "UPDATE tasks SET state = 'staged', result = ?, lease_expires = NULL "
+                "WHERE id = ? AND owner = ? AND state = 'leased'",
+                (str(path), task["id"], owner)
+            ).rowcount == 1
+        if not accepted:
+            path.unlink(missing_ok=True)
+        return accepted
+
+    def fail(self, task, owner, error):
+        """
+        Return a task to the queue, or fail its job after max_attempts.
+
+        Returns:
+            'retried' or 'failed', or None if the caller no longer held the lease
+        """
+        with self.transaction() as db:
+            if task["attempts"] < self.max_attempts:
+                updated = db.execute(
+                    "UPDATE tasks SET state = 'queued', owner = NULL, lease_expires = NULL, error = ? "
+                    "WHERE id = ? AND owner = ? AND state = 'leased'",
+                    (str(error), task["id"], owner)
+                ).rowcount
+                return "retried" if updated else None
+            updated = db.execute(
+                "UPDATE tasks SET state = 'failed', error = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                (str(error), task["id"], owner)
+            ).rowcount
+            if not updated:
+                return None
+            self._finish_job(db, task["job"], "failed", f"page {task['start_page'] + 1}+: {error}")
+            return "failed"
+
+    def _finish_job(self, db, job, state, error=None):
+        """Close a job; staged results of its other tasks are deleted."""
+        for (result,) in db.execute(
+            "SELECT result FROM tasks WHERE job = ? AND result IS NOT NULL", (job,)
+        ).fetchall():
+            Path(result).unlink(missing_ok=True)
+        db.execute("UPDATE jobs SET state = ?, error = ?, finished_at = ? WHERE id = ?",
+                   (state, error, time.time(), job))
+        db.execute(
+            "UPDATE tasks SET state = CASE WHEN state = 'failed' THEN 'failed' ELSE ? END, "
+            "owner = NULL, lease_expires = NULL, result = NULL WHERE job = ?",
+            ("done" if state == "done" else "cancelled", job)
+        )
+
+    # Committer
+
+    def acquire_lock(self, name, owner):
+        """Take or renew a named lease; False while another owner holds it."""
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute("SELECT owner, expires FROM locks WHERE name = ?", (name,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                return False
+            db.execute("INSERT OR REPLACE INTO locks (name, owner, expires) VALUES (?, ?, ?)",
+                       (name, owner, now + self.lease_seconds))
+            return True
+
+    def release_lock(self, name, owner):
+        with self.transaction() as db:
+            db.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, owner))
+
+    def ready_jobs(self):
+        """Open jobs whose every task is staged: [(job id, path, force)]."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT j.id, j.path, j.force FROM jobs j WHERE j.state = 'open' AND j.parts = "
+                "(SELECT COUNT(*) FROM tasks t WHERE t.job = j.id AND t.state = 'staged') "
+                "ORDER BY j.id"
+            ).fetchall()
+
+    def staged_results(self, job):
+        """Result files of a job's tasks, in page order."""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT result FROM tasks WHERE job = ? ORDER BY part", (job,)
+            )]
+
+    def complete_job(self, job):
+        with self.transaction() as db:
+            self._finish_job(db, job, "done")
+
+    def fail_job(self, job, error):
+        with self.transaction() as db:
+            self._finish_job(db, job, "failed", str(error))
+
+    def requeue_job(self, job, reason):
+        """Send every task of a job back to the queue, e.g. when the file changed mid-job."""
+        with self.transaction() as db:
+            for (result,) in db.execute(
+                "SELECT result FROM tasks WHERE job = ? AND result IS NOT NULL", (job,)
+            ).fetchall():
+                Path(result).unlink(missing_ok=True)
+            db.execute(
+                "UPDATE tasks SET state = 'queued', owner = NULL, lease_expires = NULL, "
+                "result = NULL, error = ? WHERE job = ?", (reason, job)
+            )
+
+    # Reporting
+
+    def counts(self):
+        """Tasks per state, plus open and failed job counts."""
+        with self._lock:
+            counts = dict(self._db.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state"))
+            jobs = dict(self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+            expired = self._db.execute(
+                "SELECT COUNT(*) FROM tasks WHERE state = 'leased' AND lease_expires < ?", (time.time(),)
+            ).fetchone()[0]
+        return {
+            "queued": counts.get("queued", 0), "leased": counts.get("leased", 0),
+            "expired": expired, "staged": counts.get("staged", 0), "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0), "open_jobs": jobs.get("open", 0),
+            "done_jobs": jobs.get("done", 0), "failed_jobs": jobs.get("failed", 0),
+        }
+
+    def failed_jobs(self, limit=20):
+        with self._lock:
+            return self._db.execute(
+                "SELECT path, error FROM jobs WHERE state = 'failed' ORDER BY finished_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+
+
+class _IndexedChunks:
+    """
+    Ids of files' chunks already in the vector store, read from its manifest.
+
+    The manifest is opened read-only on first use and kept open for the
+    worker's lifetime. Ids are empty while it is not on this machine (a
+    remote worker): every chunk is then embedded and the committer keeps
+    only the changed ones.
+    """
+
+    def __init__(self):
+        self._manifest = None
+
+    def __call__(self, path):
+        if self._manifest is None:
+            if not manifest_path().exists():
+                return set()
+            self._manifest = ManifestStore(manifest_path(), read_only=True)
+        pages = self._manifest.chunk_ids(Path(path).name)
+        return {cid for ids in pages.values() for cid in ids}
+
+    def close(self):
+        if self._manifest is not None:
+            self._manifest.close()
+            self._manifest = None
+
+
+def _load_embeddings():
+    embeddings = get_embeddings()
+    if EMBEDDING_CACHE_ENABLED:
+        embeddings = CachedEmbeddings(embeddings, EmbeddingCache(EMBEDDING_MODEL))
+    return embeddings
+
+
+def _process_task(task, embeddings, chunk_size, chunk_overlap, embed_batch_size, heartbeat,
+                  indexed_ids=frozenset()):
+    """
+    Extract, chunk and embed one page range.
+
+    Chunks whose ids are in indexed_ids are unchanged since the file was
+    last indexed; they are not embedded and get a None vector.
+
+    Returns:
+        Tuple of (chunks, vectors, stat key)
+    """
+    stat_key = _stat_key(task["path"])
+    chunks, stats = chunk_pdf_shard(task["path"], chunk_size, chunk_overlap,
+                                    task["start_page"], task["end_page"])
+    metrics.observe("pdf_extract", stats["extract_seconds"], pages=stats["pages"], chars=stats["chars"])
+    metrics.observe("chunking", stats["chunk_seconds"], chunks=len(chunks), chars=stats["chars"])
+    if _stat_key(task["path"]) != stat_key:
+        raise RuntimeError("file changed while it was being read")
+
+    pending = [i for i, doc in enumerate(as_documents(chunks)) if chunk_id(doc) not in indexed_ids]
+    vectors = [None] * len(chunks)
+    for start in range(0, len(pending), embed_batch_size):
+        batch = pending[start:start + embed_batch_size]
+        texts = [chunks[i].text for i in batch]
+        with metrics.span("embed", chunks=len(texts), chars=sum(map(len, texts))):
+            for i, vector in zip(batch, embeddings.embed_documents(texts)):
+                vectors[i] = vector
+        if not heartbeat():
+            raise RuntimeError("lease lost")
+    return chunks, vectors, stat_key
+
+
+def _changed_vectors(vsm, docs, part, changed):
+    """
+    Staged vectors of the chunks to write.
+
+    A chunk the worker skipped as already indexed can still need writing
+    (a forced job, or the file changed in the store since the worker read
+    its manifest); those are embedded here.
+    """
+    staged = dict(zip(part.get("embedded", range(len(docs))), part["vectors"]))
+    rows = {id(doc): row for row, doc in enumerate(docs)}
+    vectors = [staged.get(rows[id(doc)]) for doc in changed]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        texts = [changed[i].page_content for i in missing]
+        with metrics.span("embed", chunks=len(texts), chars=sum(map(len, texts))):
+            for i, vector in zip(missing, vsm.embeddings.embed_documents(texts)):
+                vectors[i] = vector
+    return [list(map(float, vector)) for vector in vectors]
+
+
+def commit_staged(work_queue, owner, vsm_factory):
+    """
+    Apply every fully staged job to the vector store, if no other worker is.
+
+    Only the holder of the commit lock writes to the store and manifest, so
+    workers never race on them. Jobs are applied with the same plan/commit
+    steps as run_indexing_pipeline(), one page range at a time. The lock is
+    renewed in the background; if it is lost anyway (e.g. this process was
+    suspended past the lease), the file being written is discarded and
+    committing stops, leaving the job staged for the new holder.
+
+    Args:
+        work_queue: WorkQueue
+        owner: Worker name
+        vsm_factory: Returns a loaded VectorStoreManager; called only when
+            there is something to commit
+
+    Returns:
+        Dict with 'jobs', 'chunks' (written) and 'stale' (deleted), or None
+        if another worker holds the commit lock
+    """
+    stats = {"jobs": 0, "chunks": 0, "stale": 0}
+    jobs = work_queue.ready_jobs()
+    if not jobs or not work_queue.acquire_lock(COMMIT_LOCK, owner):
+        return stats if not jobs else None
+
+    vsm = None
+    keeper = LeaseKeeper(lambda: work_queue.acquire_lock(COMMIT_LOCK, owner), work_queue.lease_seconds / 3)
+    try:
+        with keeper:
+            # Re-read under the lock: another committer may have just applied some
+            for job, path, force in work_queue.ready_jobs():
+                if keeper.lost.is_set() or not work_queue.acquire_lock(COMMIT_LOCK, owner):
+                    return stats
+                parts = []
+                for result in work_queue.staged_results(job):
+                    with open(result, "rb") as f:
+                        parts.append(pickle.load(f))
+                try:
+                    current = _stat_key(path)
+                except FileNotFoundError:
+                    work_queue.fail_job(job, "file no longer exists")
+                    continue
+                if any(part["stat"] != current for part in parts):
+                    work_queue.requeue_job(job, "file changed before commit")
+                    continue
+
+                vsm = vsm or vsm_factory()
+                written = stale_total = 0
+                try:
+                    for i, part in enumerate(parts):
+                        if keeper.lost.is_set():
+                            raise CommitLockLost("commit lock lost")
+                        docs = as_documents(part["chunks"])
+                        changed, stale = vsm.plan_file_update(path, docs, force=bool(force),
+                                                              complete=i == len(parts) - 1)
+                        if changed:
+                            vectors = _changed_vectors(vsm, docs, part, changed)
+                            with metrics.span("store_write", chunks=len(changed)):
+                                vsm.add_embedded_documents(changed, vectors)
+                        written += len(changed)
+                        stale_total += stale
+                    if keeper.lost.is_set():
+                        raise CommitLockLost("commit lock lost")
+                    vsm.commit_file_update(path)
+                except CommitLockLost:
+                    vsm.discard_file_update(path)
+                    print(f"  ✗ Commit lock lost while writing {os.path.basename(path)}; left for the next committer")
+                    return stats
+                except Exception as e:
+                    vsm.discard_file_update(path)
+                    work_queue.fail_job(job, e)
+                    print(f"  ✗ Error committing {os.path.basename(path)}: {e}")
+                    continue
+                work_queue.complete_job(job)
+                stats["jobs"] += 1
+                stats["chunks"] += written
+                stats["stale"] += stale_total
+    finally:
+        if vsm is not None:
+            vsm.save_lexical_index()
+        work_queue.release_lock(COMMIT_LOCK, owner)
+    return stats
+
+
+def run_worker(chunk_size, chunk_overlap, owner=None, work_queue=None, commit=True,
+               follow=False, poll_interval=QUEUE_POLL_INTERVAL, embed_batch_size=EMBED_BATCH_SIZE,
+               vsm_factory=None):
+    """
+    Claim and process tasks until the queue is drained (or forever with follow).
+
+    Each task is extracted, chunked and embedded in this process and its
+    result staged; chunks already in the vector store's manifest are not
+    re-embedded and the rest go through the embedding cache; the lease is renewed in the background while it runs.
+    With commit=True the worker also applies finished jobs whenever it can
+    take the commit lock. Run committing workers only on the machine that
+    holds the vector store: its SQLite files must not be written over a
+    network filesystem.
+
+    Args:
+        chunk_size: Characters per chunk
+        chunk_overlap: Overlap between chunks
+        owner: Worker name (hostname-pid by default)
+        work_queue: WorkQueue (QUEUE_DB_PATH by default)
+        commit: Also apply staged jobs to the vector store
+        follow: Keep polling for new work instead of exiting when idle
+        poll_interval: Seconds between claims while idle
+        embed_batch_size: Chunks per embedding call
+        vsm_factory: Returns a loaded VectorStoreManager for committing
+
+    Returns:
+        Dict with 'tasks' staged, 'retried' (failed tasks handed back to the
+        queue), 'failed' (tasks that failed their job after max_attempts),
+        'committed' jobs and 'chunks' written
+    """
+    owner = owner or worker_name()
+    work_queue = work_queue or WorkQueue()
+    embeddings = LazyEmbeddings(_load_embeddings)
+    if vsm_factory is None:
+        def vsm_factory():
+            from src.vector_store import VectorStoreManager
+            vsm = VectorStoreManager()
+            vsm.create_or_load()
+            return vsm
+
+    totals = {"tasks": 0, "retried": 0, "failed": 0, "committed": 0, "chunks": 0}
+
+    def try_commit():
+        result = commit_staged(work_queue, owner, vsm_factory) if commit else None
+        if result:
+            totals["committed"] += result["jobs"]
+            totals["chunks"] += result["chunks"]
+            if result["jobs"]:
+                print(f"[{owner}] Committed {result['jobs']} file(s): {result['chunks']} chunks "
+                      f"written, {result['stale']} stale")
+
+    indexed_chunks = _IndexedChunks()
+    try:
+        while True:
+            task = work_queue.claim(owner)
+            if task is None:
+                try_commit()
+                counts = work_queue.counts()
+                busy = counts["queued"] + counts["leased"] + (counts["staged"] if commit else 0)
+                if not follow and not busy:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            name = f"{os.path.basename(task['path'])} pages {task['start_page'] + 1}-{task['end_page'] or 'end'}"
+            keeper = LeaseKeeper(lambda task_id=task["id"]: work_queue.renew(task_id, owner),
+                                 work_queue.lease_seconds / 3)
+            try:
+                with keeper:
+                    chunks, vectors, stat_key = _process_task(
+                        task, embeddings, chunk_size, chunk_overlap, embed_batch_size,
+                        heartbeat=lambda: not keeper.lost.is_set(),
+                        indexed_ids=frozenset() if task["force"] else indexed_chunks(task["path"])
+                    )
+            except Exception as e:
+                outcome = work_queue.fail(task, owner, e)
+                if outcome:
+                    totals[outcome] += 1
+                print(f"[{owner}] ✗ {name} (attempt {task['attempts']}"
+                      f"{', giving up' if outcome == 'failed' else ''}): {e}")
+                continue
+
+            if work_queue.stage(task, owner, chunks, vectors, stat_key):
+                totals["tasks"] += 1
+                print(f"[{owner}] {name}: {len(chunks)} chunks staged")
+            else:
+                print(f"[{owner}] ✗ {name}: lease expired, result discarded")
+            try_commit()
+    finally:
+        indexed_chunks.close()
+    return totals